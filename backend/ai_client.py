@@ -0,0 +1,501 @@
+"""
+AI 上游 HTTP 客户端
+全应用共享一个 httpx.AsyncClient（在 FastAPI lifespan 中创建和关闭），
+复用 keep-alive 连接，避免每个请求重复进行 DNS / TCP / TLS 握手。
+
+所有上游调用经过同一个调度层：全局并发上限 + 各接口并发上限、按优先级排队
+（交互式的任务分解优先于日报）、429/5xx 与网络错误的抖动指数退避重试（遵循 Retry-After）、
+上游持续故障时快速失败的熔断器，以及可选的对冲请求。
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+import metrics
+
+# ========== 配置（可通过环境变量调整） ==========
+AI_BASE_URL = os.getenv("AI_BASE_URL", "https://api.zhizengzeng.com/v1")
+AI_MODEL = os.getenv("AI_MODEL", "gpt-3.5-turbo")
+CONNECT_TIMEOUT = float(os.getenv("AI_CONNECT_TIMEOUT", "10"))
+REQUEST_TIMEOUT = float(os.getenv("AI_TIMEOUT", "30"))            # 普通请求
+STREAM_TIMEOUT = float(os.getenv("AI_STREAM_TIMEOUT", "60"))      # 流式请求
+MAX_CONNECTIONS = int(os.getenv("AI_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("AI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("AI_KEEPALIVE_EXPIRY", "30"))
+# HTTP/2 需要额外安装 h2 包（pip install httpx[http2]），未安装时自动退回 HTTP/1.1
+HTTP2_REQUESTED = os.getenv("AI_HTTP2", "0") == "1"
+
+# ----- 调度 -----
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))      # 同时进行的上游请求总数
+AI_MAX_QUEUE = int(os.getenv("AI_MAX_QUEUE", "200"))                # 排队请求超过该值时直接拒绝
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))
+AI_RETRY_BASE_DELAY = float(os.getenv("AI_RETRY_BASE_DELAY", "0.5"))
+AI_RETRY_MAX_DELAY = float(os.getenv("AI_RETRY_MAX_DELAY", "8"))
+# Retry-After 超过该秒数时不再等待重试，直接返回错误
+AI_RETRY_AFTER_MAX = float(os.getenv("AI_RETRY_AFTER_MAX", "30"))
+AI_BREAKER_FAILURES = int(os.getenv("AI_BREAKER_FAILURES", "5"))    # 连续失败多少次后熔断
+AI_BREAKER_COOLDOWN = float(os.getenv("AI_BREAKER_COOLDOWN", "30")) # 熔断后多少秒放行一次试探请求
+# 非流式请求超过该毫秒数仍未返回时再发一个相同请求，先返回者胜出；0 表示关闭
+AI_HEDGE_DELAY_MS = float(os.getenv("AI_HEDGE_DELAY_MS", "0"))
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+_PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BATCH: "batch"}
+
+# 接口名 -> (优先级, 该接口的并发上限)
+ENDPOINTS = {
+    "breakdown": (PRIORITY_INTERACTIVE, int(os.getenv("AI_BREAKDOWN_CONCURRENCY", "6"))),
+    "report": (PRIORITY_BATCH, int(os.getenv("AI_REPORT_CONCURRENCY", "2"))),
+    "report_summary": (PRIORITY_BATCH, int(os.getenv("AI_REPORT_SUMMARY_CONCURRENCY", "4"))),
+}
+DEFAULT_ENDPOINT = "report"
+
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=AI_BASE_URL,
+        http2=HTTP2_REQUESTED and HTTP2_AVAILABLE,
+        timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        headers={"Content-Type": "application/json"},
+    )
+
+
+async def start():
+    """创建共享客户端（应用启动时调用）"""
+    global _client
+    if _client is None:
+        _client = _build_client()
+        if HTTP2_REQUESTED and not HTTP2_AVAILABLE:
+            print("⚠️  AI_HTTP2=1 但未安装 h2，使用 HTTP/1.1")
+
+
+async def close():
+    """关闭共享客户端及其连接池（应用关闭时调用）"""
+    global _client, _governor
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    # asyncio 原语绑定在事件循环上，下次启动时重新创建
+    _governor = _Governor()
+
+
+def get_client() -> httpx.AsyncClient:
+    """获取共享客户端；未经 lifespan 启动时按需创建"""
+    global _client
+    if _client is None:
+        _client = _build_client()
+    return _client
+
+
+def auth_headers(api_key: str) -> Dict[str, str]:
+    """上游鉴权请求头"""
+    return {"Authorization": f"Bearer {api_key}"}
+
+
+# ========== 调度层 ==========
+
+class UpstreamUnavailable(Exception):
+    """上游暂不可用（熔断中或排队过多），请求未发出"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _PriorityLimiter:
+    """全局并发上限；有空位时按 (优先级, 到达顺序) 唤醒等待者"""
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.active = 0
+        self._waiters: List[tuple] = []
+        self._seq = itertools.count()
+
+    def _pending(self) -> List[tuple]:
+        return [w for w in self._waiters if not w[2].done()]
+
+    def waiting(self) -> Dict[str, int]:
+        counts = {name: 0 for name in _PRIORITY_NAMES.values()}
+        for priority, _, _ in self._pending():
+            counts[_PRIORITY_NAMES.get(priority, str(priority))] += 1
+        return counts
+
+    def try_acquire(self) -> bool:
+        if self.active < self.capacity and not self._pending():
+            self.active += 1
+            return True
+        return False
+
+    async def acquire(self, priority: int):
+        if self.try_acquire():
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 被唤醒的同时被取消：把名额让给下一个等待者
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self.active -= 1
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+                break
+
+
+class _EndpointLimit:
+    def __init__(self, name: str, priority: int, limit: int):
+        self.name = name
+        self.priority = priority
+        self.limit = max(1, limit)
+        self.semaphore = asyncio.Semaphore(self.limit)
+        self.active = 0
+        self.waiting = 0
+        self.completed = 0
+
+    def stats(self) -> Dict:
+        return {
+            "priority": _PRIORITY_NAMES.get(self.priority, str(self.priority)),
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "completed_total": self.completed,
+        }
+
+
+class CircuitBreaker:
+    """连续失败达到阈值后熔断；冷却期过后放行一个试探请求，成功则恢复"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.opened_total = 0
+        self.rejected_total = 0
+        self._trial_in_flight = False
+
+    def before_call(self) -> bool:
+        """请求发出前调用；熔断中抛出 UpstreamUnavailable，返回本次是否为试探请求"""
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining > 0:
+                self.rejected_total += 1
+                raise UpstreamUnavailable("AI 服务暂时不可用（熔断中）", retry_after=remaining)
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._trial_in_flight:
+                self.rejected_total += 1
+                raise UpstreamUnavailable("AI 服务暂时不可用（等待试探请求）", retry_after=1.0)
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record(self, success: bool, trial: bool):
+        if trial:
+            self._trial_in_flight = False
+        if success:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            return
+        self.consecutive_failures += 1
+        if trial or (self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold):
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.opened_total += 1
+
+    def abandon(self, trial: bool):
+        """请求被取消、结果未知"""
+        if trial:
+            self._trial_in_flight = False
+
+    def stats(self) -> Dict:
+        stats = {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "cooldown_seconds": self.cooldown,
+            "opened_total": self.opened_total,
+            "rejected_total": self.rejected_total,
+        }
+        if self.state == self.OPEN:
+            stats["retry_after_seconds"] = round(
+                max(0.0, self.opened_at + self.cooldown - time.monotonic()), 3
+            )
+        return stats
+
+
+class _Governor:
+    def __init__(self):
+        self.limiter = _PriorityLimiter(AI_MAX_CONCURRENCY)
+        self.endpoints = {
+            name: _EndpointLimit(name, priority, limit)
+            for name, (priority, limit) in ENDPOINTS.items()
+        }
+        self.breaker = CircuitBreaker(AI_BREAKER_FAILURES, AI_BREAKER_COOLDOWN)
+        self.retries = 0
+        self.queue_rejected = 0
+        self.hedges_launched = 0
+        self.hedges_won = 0
+
+    def queued(self) -> int:
+        return sum(e.waiting for e in self.endpoints.values()) + len(self.limiter._pending())
+
+    @asynccontextmanager
+    async def slot(self, endpoint: str) -> AsyncIterator[None]:
+        """先占接口名额，再按优先级占全局名额"""
+        limit = self.endpoints.get(endpoint) or self.endpoints[DEFAULT_ENDPOINT]
+        if self.queued() >= AI_MAX_QUEUE:
+            self.queue_rejected += 1
+            raise UpstreamUnavailable("AI 请求排队过多，请稍后重试", retry_after=1.0)
+        queued_at = time.perf_counter()
+        limit.waiting += 1
+        try:
+            await limit.semaphore.acquire()
+        finally:
+            limit.waiting -= 1
+        try:
+            await self.limiter.acquire(limit.priority)
+            metrics.AI_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - queued_at, limit.name)
+            limit.active += 1
+            try:
+                yield
+            finally:
+                limit.active -= 1
+                limit.completed += 1
+                self.limiter.release()
+        finally:
+            limit.semaphore.release()
+
+    async def call(
+        self,
+        send: Callable[[], Awaitable[httpx.Response]],
+        endpoint: str = DEFAULT_ENDPOINT,
+    ) -> httpx.Response:
+        """执行 send，按需重试；熔断器记录每次尝试的结果，耗时按接口和结果计入指标"""
+        attempt = 0
+        while True:
+            trial = self.breaker.before_call()
+            retry_after = None
+            started = time.perf_counter()
+            outcome = "cancelled"
+            try:
+                response = await send()
+                outcome = str(response.status_code)
+            except httpx.HTTPStatusError as e:
+                status = e.response.status_code
+                outcome = str(status)
+                # 4xx（含 429 限流）说明上游可达，不计入熔断
+                self.breaker.record(success=status < 500, trial=trial)
+                if status not in _RETRY_STATUSES:
+                    raise
+                error: Exception = e
+                retry_after = _retry_after_seconds(e.response)
+            except httpx.TransportError as e:
+                outcome = "transport_error"
+                self.breaker.record(success=False, trial=trial)
+                error = e
+            except BaseException:
+                self.breaker.abandon(trial)
+                raise
+            else:
+                self.breaker.record(success=True, trial=trial)
+                return response
+            finally:
+                metrics.AI_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, outcome)
+
+            if attempt >= AI_MAX_RETRIES or (retry_after is not None and retry_after > AI_RETRY_AFTER_MAX):
+                raise error
+            # 全抖动指数退避；上游给出 Retry-After 时至少等待该时长
+            delay = random.uniform(0, min(AI_RETRY_MAX_DELAY, AI_RETRY_BASE_DELAY * 2 ** attempt))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def hedged(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """主请求超过 AI_HEDGE_DELAY_MS 未返回且全局有空位时，再发一个相同请求"""
+        primary = asyncio.ensure_future(send())
+        tasks = {primary}
+        hedge_slot = False
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=AI_HEDGE_DELAY_MS / 1000)
+            if not done and self.limiter.try_acquire():
+                hedge_slot = True
+                self.hedges_launched += 1
+                tasks.add(asyncio.ensure_future(send()))
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedges_won += 1
+                        return task.result()
+                    if error is None or task is primary:
+                        error = task.exception()
+            raise error
+        finally:
+            for task in (primary, *tasks):
+                if not task.done():
+                    task.cancel()
+            if hedge_slot:
+                self.limiter.release()
+
+    def stats(self) -> Dict:
+        return {
+            "max_concurrency": self.limiter.capacity,
+            "active": self.limiter.active,
+            "queued": self.queued(),
+            "queued_by_priority": self.limiter.waiting(),
+            "max_queue": AI_MAX_QUEUE,
+            "queue_rejected_total": self.queue_rejected,
+            "endpoints": {name: e.stats() for name, e in self.endpoints.items()},
+            "breaker": self.breaker.stats(),
+            "retries_total": self.retries,
+            "hedge_delay_ms": AI_HEDGE_DELAY_MS,
+            "hedges_launched_total": self.hedges_launched,
+            "hedges_won_total": self.hedges_won,
+        }
+
+
+def _retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """解析 Retry-After（秒数或 HTTP 日期）"""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_governor = _Governor()
+
+
+async def chat_completion(
+    api_key: str,
+    messages: List[Dict[str, str]],
+    endpoint: str = DEFAULT_ENDPOINT,
+    **params,
+) -> str:
+    """非流式对话补全，返回回复文本
+
+    HTTP 错误以 httpx.HTTPStatusError 抛出；熔断或排队过多时抛出 UpstreamUnavailable。
+    """
+    body = {"model": AI_MODEL, "messages": messages, **params}
+
+    async def send() -> httpx.Response:
+        response = await get_client().post("/chat/completions", headers=auth_headers(api_key), json=body)
+        response.raise_for_status()
+        return response
+
+    async with _governor.slot(endpoint):
+        if AI_HEDGE_DELAY_MS > 0:
+            response = await _governor.call(lambda: _governor.hedged(send), endpoint)
+        else:
+            response = await _governor.call(send, endpoint)
+    data = response.json()
+    return data["choices"][0]["message"]["content"]
+
+
+@asynccontextmanager
+async def stream_chat_completion(
+    api_key: str,
+    messages: List[Dict[str, str]],
+    endpoint: str = DEFAULT_ENDPOINT,
+    **params,
+) -> AsyncIterator[httpx.Response]:
+    """流式对话补全，产出已检查状态码的响应；整个流期间占用并发名额
+
+    只在收到响应头之前重试，开始输出后不再重试。
+    """
+    body = {"model": AI_MODEL, "messages": messages, "stream": True, **params}
+
+    async def send() -> httpx.Response:
+        client = get_client()
+        request = client.build_request(
+            "POST", "/chat/completions",
+            headers=auth_headers(api_key), json=body, timeout=STREAM_TIMEOUT,
+        )
+        response = await client.send(request, stream=True)
+        if response.is_error:
+            await response.aread()
+            await response.aclose()
+            response.raise_for_status()
+        return response
+
+    async with _governor.slot(endpoint):
+        response = await _governor.call(send, endpoint)
+        try:
+            yield response
+        finally:
+            await response.aclose()
+
+
+def get_governor_stats() -> Dict:
+    """调度层状态：排队深度、各接口并发、熔断器状态、重试与对冲次数"""
+    return _governor.stats()
+
+
+def get_pool_stats() -> Dict:
+    """连接池使用情况（用于监控）"""
+    stats = {
+        "base_url": AI_BASE_URL,
+        "http2": HTTP2_REQUESTED and HTTP2_AVAILABLE,
+        "max_connections": MAX_CONNECTIONS,
+        "max_keepalive_connections": MAX_KEEPALIVE_CONNECTIONS,
+        "started": _client is not None,
+        "connections": 0,
+        "active": 0,
+        "idle": 0,
+    }
+    if _client is None:
+        return stats
+    # httpx 未公开连接池状态，这里读取底层 httpcore 连接池
+    pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    stats["connections"] = len(connections)
+    stats["idle"] = sum(1 for c in connections if c.is_idle())
+    stats["active"] = stats["connections"] - stats["idle"]
+    return stats
@@ -0,0 +1,119 @@
+"""
+归档基准：大量已完成的旧任务移入归档表前后，全量读取（日报使用的 get_all_todos）、
+列表分页和统计的耗时，以及分批归档本身的速度和单批事务耗时（即归档期间写锁的最长占用时间）
+
+预置数据库与 bench_load 共用（按行数缓存在 --db-dir 中），约 40% 为已完成任务；
+其中 --old-ratio 比例的已完成任务被改为 --age-days 天前完成，作为归档候选。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_archive --rows 100000
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict
+
+import database
+from benchmarks.bench_load import prepare_run_database, seed_template
+
+
+def timed(fn: Callable, repeat: int) -> float:
+    """多次执行取中位数（毫秒）"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 3)
+
+def measure_reads(repeat: int) -> Dict:
+    with database.get_db_connection() as conn:
+        live = conn.execute("SELECT COUNT(*) FROM todos").fetchone()[0]
+    return {
+        "live_rows": live,
+        "get_all_todos_ms": timed(database.get_all_todos, repeat),
+        "list_all_ms": timed(lambda: database.list_todo_rows(), repeat),
+        "list_page_ms": timed(lambda: database.list_todo_rows(limit=50), repeat),
+        "list_completed_page_ms": timed(lambda: database.list_todo_rows(limit=50, completed=True), repeat),
+        "etag_state_ms": timed(database.get_list_etag_state, repeat),
+    }
+
+def run(args) -> Dict:
+    template = seed_template(args.db_dir, args.rows, args.seed)
+    workdir = tempfile.mkdtemp(prefix="bench_archive_")
+    prepare_run_database(template, workdir, f"archive_{args.rows}")
+    with database.get_db_connection() as conn:
+        # 只改 updated_at，不触发版本号和计数触发器
+        conn.execute(
+            "UPDATE todos SET updated_at = datetime('now', ?) WHERE completed = 1 AND id % 100 < ?",
+            (f"-{args.age_days} days", int(args.old_ratio * 100)),
+        )
+    before = measure_reads(args.repeat)
+
+    batch_ms = []
+    moved = 0
+    started = time.perf_counter()
+    while True:
+        batch_started = time.perf_counter()
+        count = database.archive_completed_todos(args.after_days, args.batch_size)
+        batch_ms.append((time.perf_counter() - batch_started) * 1000)
+        moved += count
+        if count < args.batch_size:
+            break
+    elapsed = time.perf_counter() - started
+
+    after = measure_reads(args.repeat)
+    after["list_all_with_archive_ms"] = timed(lambda: database.list_todo_rows(include_archived=True), args.repeat)
+    after["archive_page_ms"] = timed(lambda: database.list_todo_rows(limit=50, archived_only=True), args.repeat)
+    database.close_pool()
+    return {
+        "rows": args.rows,
+        "before": before,
+        "after": after,
+        "archive": {
+            "moved": moved,
+            "batches": len(batch_ms),
+            "rows_per_sec": round(moved / elapsed, 1) if elapsed else 0,
+            "batch_p50_ms": round(statistics.median(batch_ms), 3),
+            "batch_max_ms": round(max(batch_ms), 3),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="归档基准")
+    parser.add_argument("--rows", type=int, default=100000, help="预置行数")
+    parser.add_argument("--old-ratio", type=float, default=0.9, help="改为旧任务的已完成任务比例")
+    parser.add_argument("--age-days", type=float, default=60, help="旧任务的完成时间（天前）")
+    parser.add_argument("--after-days", type=float, default=30, help="归档阈值（天）")
+    parser.add_argument("--batch-size", type=int, default=database.ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--repeat", type=int, default=5, help="每项读取的重复次数")
+    parser.add_argument("--db-dir", default=os.path.join(tempfile.gettempdir(), "todo_bench"),
+                        help="预置数据库缓存目录（与 bench_load 共用）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    os.makedirs(args.db_dir, exist_ok=True)
+    report = run(args)
+    if args.json:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+    a = report["archive"]
+    print(f"{report['rows']} 行：归档 {a['moved']} 行，{a['batches']} 批，{a['rows_per_sec']} 行/s，"
+          f"单批 p50 {a['batch_p50_ms']}ms / max {a['batch_max_ms']}ms")
+    print(f"{'':<26}{'归档前':>12}{'归档后':>12}")
+    for key, value in report["before"].items():
+        print(f"{key:<26}{value:>12}{report['after'][key]:>12}")
+    for key in ("list_all_with_archive_ms", "archive_page_ms"):
+        print(f"{key:<26}{'':>12}{report['after'][key]:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+列表接口基准：对比 GET /todos 的旧实现（sqlite3.Row → dict → response_model 校验与序列化）、
+快速路径（元组行直接编码为 JSON）和命中已编码响应缓存时的延迟
+
+经 httpx.ASGITransport 在进程内调用，包含 FastAPI 的路由与响应构建开销，不含网络开销。
+预置数据库与 bench_load 共用（按行数缓存在 --db-dir 中）。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_list --rows 10000,100000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, Request, Response
+
+import database
+import db_executor
+from benchmarks.bench_load import percentile, prepare_run_database, seed_template
+
+QUERIES = {
+    "all": {},
+    "limit=1000": {"limit": 1000},
+    "limit=50": {"limit": 50},
+}
+VARIANTS = ["legacy", "fast", "cached"]
+
+
+# ========== 旧实现（改造前的列表接口，作为基线） ==========
+
+def legacy_list_todos(limit: Optional[int]):
+    sql = f"SELECT {database._TODO_COLUMNS} FROM todos ORDER BY id DESC"
+    params: List = []
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+    with database.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        rows = [dict(row) for row in cursor.fetchall()]
+        cursor.execute("SELECT COUNT(*) FROM todos")
+        total = cursor.fetchone()[0]
+    return rows[:limit] if limit is not None else rows, total
+
+def create_legacy_app(todo_model) -> FastAPI:
+    import main
+
+    app = FastAPI()
+
+    @app.get("/todos", response_model=List[todo_model])
+    async def get_todos(request: Request, response: Response, limit: Optional[int] = None):
+        version, new_count = await db_executor.run_read(database.get_list_etag_state)
+        response.headers["ETag"] = main.list_etag(
+            version, new_count, str(sorted(request.query_params.multi_items()))
+        )
+        todos, total = await db_executor.run_read(legacy_list_todos, limit)
+        response.headers["X-Total-Count"] = str(total)
+        return todos
+
+    return app
+
+
+# ========== 计时 ==========
+
+async def measure(client: httpx.AsyncClient, params: Dict, requests: int, before=None) -> Dict:
+    samples = []
+    size = 0
+    for _ in range(requests):
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        response = await client.get("/todos", params=params)
+        samples.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+        size = len(response.content)
+    samples.sort()
+    return {
+        "requests": requests,
+        "bytes": size,
+        "mean_ms": round(sum(samples) / len(samples), 3),
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+    }
+
+def check_equivalent(legacy_body: bytes, fast_body: bytes):
+    """快速路径的每一项包含旧接口的全部字段且取值相同"""
+    legacy, fast = json.loads(legacy_body), json.loads(fast_body)
+    assert len(legacy) == len(fast), "条数不一致"
+    for old, new in zip(legacy, fast):
+        assert all(new[key] == value for key, value in old.items()), f"内容不一致: {old} != {new}"
+
+async def run_rows(rows: int, template: str, workdir: str, requests: int) -> Dict:
+    prepare_run_database(template, workdir, f"list_{rows}")
+    import main  # 数据库在 lifespan 启动时按当前 DATABASE_PATH 初始化
+
+    legacy_app = create_legacy_app(main.Todo)
+    results: Dict[str, Dict] = {}
+    async with main.app.router.lifespan_context(main.app):
+        legacy_client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=legacy_app), base_url="http://bench", timeout=None
+        )
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=None
+        )
+        async with legacy_client, client:
+            for name, params in QUERIES.items():
+                legacy_body = (await legacy_client.get("/todos", params=params)).content
+                main.list_cache.clear()
+                check_equivalent(legacy_body, (await client.get("/todos", params=params)).content)
+                results[name] = {
+                    "legacy": await measure(legacy_client, params, requests),
+                    "fast": await measure(client, params, requests, before=main.list_cache.clear),
+                    "cached": await measure(client, params, requests),
+                }
+    database.close_pool()
+    return results
+
+
+def print_table(report: Dict):
+    print(f"orjson: {report['orjson']}，单位：毫秒")
+    print(f"{'rows':>8}  {'query':<12}{'variant':<9}{'mean':>10}{'p50':>10}{'p95':>10}{'speedup':>9}{'bytes':>12}")
+    for rows, queries in report["results"].items():
+        for query, variants in queries.items():
+            base = variants["legacy"]["mean_ms"]
+            for name in VARIANTS:
+                r = variants[name]
+                speedup = f"{base / r['mean_ms']:.1f}x" if r["mean_ms"] else "-"
+                print(f"{rows:>8}  {query:<12}{name:<9}{r['mean_ms']:>10}{r['p50_ms']:>10}"
+                      f"{r['p95_ms']:>10}{speedup:>9}{r['bytes']:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="列表接口基准")
+    parser.add_argument("--rows", default="10000,100000", help="预置行数，逗号分隔")
+    parser.add_argument("--requests", type=int, default=10, help="每种查询、每种实现的请求次数")
+    parser.add_argument("--db-dir", default=os.path.join(tempfile.gettempdir(), "todo_bench"),
+                        help="预置数据库缓存目录（与 bench_load 共用）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    import fast_json
+
+    os.makedirs(args.db_dir, exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix="bench_list_")
+    report = {"orjson": fast_json.ORJSON_AVAILABLE, "results": {}}
+    for rows in [int(r) for r in args.rows.split(",")]:
+        template = seed_template(args.db_dir, rows, args.seed)
+        report["results"][rows] = asyncio.run(run_rows(rows, template, workdir, args.requests))
+
+    if args.json:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+    print_table(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,519 @@
+"""
+端到端负载基准：混合 CRUD 工作负载与并发日报流同时运行，
+按接口输出吞吐量和 p50/p95/p99 延迟（JSON），用于对比性能改动前后的结果
+
+两种运行模式：
+    asgi     进程内经 httpx.ASGITransport 直接调用 FastAPI app（不含网络和 HTTP 解析开销）
+    uvicorn  在子进程中启动 uvicorn，经真实 socket 访问
+
+上游 AI 由 benchmarks.fake_llm 替代（独立子进程），首 token 延迟和输出速率可配置。
+预置数据库按行数缓存在 --db-dir 中，每轮运行前复制一份，保证各轮起点一致。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_load --rows 1000,100000,1000000 --mode both --output before.json
+    python -m benchmarks.bench_load --rows 1000,100000,1000000 --mode both --compare before.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+import ai_client
+import database
+from benchmarks.fake_llm import free_port
+
+# 任务文本用词（与搜索用词一致，使全文搜索有命中）
+WORDS = ["报告", "会议", "代码", "测试", "部署", "文档", "客户", "需求", "设计", "评审",
+         "预算", "招聘", "培训", "采购", "上线", "review", "release", "invoice", "sprint", "budget"]
+
+SEED_CHUNK_ROWS = 50000
+SEED_SPAN_DAYS = 90
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# uvicorn 模式的服务进程：指定数据库路径后启动 main.app（数据库在 lifespan 启动阶段、文件锁内初始化）
+_SERVER_BOOTSTRAP = (
+    "import sys, database; database.DATABASE_PATH = sys.argv[1]; "
+    "import main, uvicorn; "
+    "uvicorn.run(main.app, host='127.0.0.1', port=int(sys.argv[2]), log_level='warning')"
+)
+
+
+class ServerProcess:
+    """子进程中运行的 HTTP 服务；健康检查通过后才返回"""
+
+    def __init__(self, argv: List[str], port: int, health_path: str, env: Optional[Dict[str, str]] = None):
+        self.argv = argv
+        self.url = f"http://127.0.0.1:{port}"
+        self.health_path = health_path
+        self.env = {**os.environ, **(env or {})}
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self, timeout: float = 60) -> "ServerProcess":
+        self.process = subprocess.Popen(
+            [sys.executable, *self.argv], cwd=BACKEND_DIR, env=self.env, stdout=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"服务进程退出（{self.process.returncode}）: {' '.join(self.argv)}")
+            try:
+                if httpx.get(self.url + self.health_path, timeout=1).status_code == 200:
+                    return self
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                self.stop()
+                raise RuntimeError(f"服务启动超时: {self.url}")
+            time.sleep(0.05)
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+
+# ========== 预置数据 ==========
+
+def _open_database(path: str):
+    database.close_pool()
+    database.DATABASE_PATH = path
+    database.init_database()
+
+def _checkpoint_and_close():
+    with database.get_db_connection() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    database.close_pool()
+
+def seed_template(db_dir: str, rows: int, seed: int, reseed: bool = False) -> str:
+    """生成（或复用）含 rows 行的模板数据库：约 40% 已完成，创建时间分布在过去 SEED_SPAN_DAYS 天"""
+    path = os.path.join(db_dir, f"seed_{rows}.db")
+    if os.path.exists(path) and not reseed:
+        with sqlite3.connect(path) as conn:
+            if conn.execute("SELECT COUNT(*) FROM todos").fetchone()[0] == rows:
+                return path
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    _open_database(path)
+    for start in range(0, rows, SEED_CHUNK_ROWS):
+        count = min(SEED_CHUNK_ROWS, rows - start)
+        texts = [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))) + f" #{start + i}"
+            for i in range(count)
+        ]
+        with database.get_db_connection() as conn:
+            database._insert_todos(conn.cursor(), texts)
+    with database.get_db_connection() as conn:
+        conn.execute("UPDATE todos SET completed = 1 WHERE id % 5 < 2")
+        # 创建时间均匀分布在过去 SEED_SPAN_DAYS 天内，id 越大越新
+        seconds_per_row = SEED_SPAN_DAYS * 86400 / max(1, rows)
+        conn.execute(
+            "UPDATE todos SET created_at = datetime('now', printf('-%d seconds', "
+            "CAST(((SELECT MAX(id) FROM todos) - id) * ? AS INTEGER)))",
+            (seconds_per_row,),
+        )
+    # 与后台任务一致：超过 NEW_FLAG_HOURS 的任务清除 NEW 标记
+    database.expire_new_flags()
+    _checkpoint_and_close()
+    print(f"🌱 已预置 {rows} 行（{time.perf_counter() - started:.1f}s）: {path}", file=sys.stderr)
+    return path
+
+def prepare_run_database(template: str, workdir: str, name: str) -> str:
+    """复制模板数据库作为本轮的数据库，并读取工作负载需要的初始状态"""
+    path = os.path.join(workdir, f"run_{name}.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    shutil.copyfile(template, path)
+    _open_database(path)
+    return path
+
+
+# ========== 统计 ==========
+
+def percentile(sorted_samples: List[float], pct: float) -> float:
+    """最近秩百分位数"""
+    if not sorted_samples:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(sorted_samples)) - 1
+    return sorted_samples[max(0, min(len(sorted_samples) - 1, rank))]
+
+def summarize_ms(samples: List[float], errors: int, elapsed: float) -> Dict:
+    samples = sorted(samples)
+    if not samples:
+        return {"count": 0, "errors": errors}
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "throughput_rps": round(len(samples) / elapsed, 2),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def add(self, name: str, elapsed_ms: float, ok: bool):
+        self.samples.setdefault(name, [])
+        self.errors.setdefault(name, 0)
+        if ok:
+            self.samples[name].append(elapsed_ms)
+        else:
+            self.errors[name] += 1
+
+    def summary(self, elapsed: float) -> Dict:
+        return {
+            name: summarize_ms(self.samples[name], self.errors[name], elapsed)
+            for name in sorted(self.samples)
+        }
+
+
+# ========== 工作负载 ==========
+
+class WorkloadState:
+    def __init__(self, ids: List[int], version: int):
+        self.ids = ids                   # 预置数据中的任务 id（用于读和修改）
+        self.created: List[int] = []     # 本轮创建的任务 id（用于删除）
+        self.version = version
+
+Operation = Callable[[httpx.AsyncClient, WorkloadState, random.Random], Awaitable[httpx.Response]]
+
+async def op_list_page(client, state, rng):
+    params = {"limit": 50}
+    if rng.random() < 0.5:
+        params["cursor"] = rng.choice(state.ids)
+    return await client.get("/todos", params=params)
+
+async def op_list_filtered(client, state, rng):
+    return await client.get("/todos", params={"limit": 50, "completed": "false"})
+
+async def op_stats(client, state, rng):
+    return await client.get("/stats")
+
+async def op_search(client, state, rng):
+    return await client.get("/todos/search", params={"q": rng.choice(WORDS) + rng.choice(WORDS)})
+
+async def op_changes(client, state, rng):
+    return await client.get("/todos/changes", params={"since": max(0, state.version - 100), "limit": 100})
+
+async def op_create(client, state, rng):
+    response = await client.post("/todos", json={"text": f"压测任务 {rng.random():.6f}"})
+    if response.status_code == 200:
+        state.created.append(response.json()["id"])
+    return response
+
+async def op_toggle(client, state, rng):
+    return await client.put(f"/todos/{rng.choice(state.ids)}/toggle")
+
+async def op_update_text(client, state, rng):
+    return await client.put(
+        f"/todos/{rng.choice(state.ids)}/text",
+        json={"text": " ".join(rng.choice(WORDS) for _ in range(3))},
+    )
+
+async def op_delete(client, state, rng):
+    if not state.created:
+        return await op_create(client, state, rng)
+    return await client.delete(f"/todos/{state.created.pop()}")
+
+# 名称 -> (请求, 权重)；名称即结果中的接口名
+OPERATIONS: Dict[str, tuple] = {
+    "GET /todos?limit=50": (op_list_page, 30),
+    "GET /todos?completed=false&limit=50": (op_list_filtered, 10),
+    "GET /stats": (op_stats, 10),
+    "GET /todos/search": (op_search, 10),
+    "GET /todos/changes": (op_changes, 5),
+    "POST /todos": (op_create, 15),
+    "PUT /todos/{id}/toggle": (op_toggle, 10),
+    "PUT /todos/{id}/text": (op_update_text, 5),
+    "DELETE /todos/{id}": (op_delete, 5),
+}
+
+async def crud_worker(client, state: WorkloadState, deadline: float, rng: random.Random, recorder: Recorder):
+    names = list(OPERATIONS)
+    weights = [OPERATIONS[name][1] for name in names]
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            response = await OPERATIONS[name][0](client, state, rng)
+            ok = response.status_code < 400
+        except Exception:
+            ok = False
+        recorder.add(name, (time.perf_counter() - started) * 1000, ok)
+
+async def stream_worker(client, deadline: float, timeout: float, results: List[Dict]):
+    """循环请求日报流，记录首字节时间和总耗时（日报缓存已关闭，每次都会请求上游）"""
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        first_byte: Optional[float] = None
+        size = 0
+        ok = True
+        try:
+            async with asyncio.timeout(timeout):
+                async with client.stream("POST", "/generate-report-stream", json={}) as response:
+                    ok = response.status_code == 200
+                    async for chunk in response.aiter_bytes():
+                        if chunk and first_byte is None:
+                            first_byte = time.perf_counter()
+                        size += len(chunk)
+                        if "❌".encode("utf-8") in chunk:
+                            ok = False
+        except Exception:
+            ok = False
+        ended = time.perf_counter()
+        results.append({
+            "ok": ok,
+            "ttfb_ms": (first_byte - started) * 1000 if first_byte is not None else None,
+            "total_ms": (ended - started) * 1000,
+            "bytes": size,
+        })
+
+def summarize_streams(results: List[Dict], elapsed: float) -> Dict:
+    ok = [r for r in results if r["ok"]]
+    errors = len(results) - len(ok)
+    return {
+        "ttfb": summarize_ms([r["ttfb_ms"] for r in ok if r["ttfb_ms"] is not None], errors, elapsed),
+        "total": summarize_ms([r["total_ms"] for r in ok], errors, elapsed),
+        "bytes_mean": round(statistics.fmean(r["bytes"] for r in ok), 1) if ok else 0,
+    }
+
+
+# ========== 运行 ==========
+
+async def drive(client: httpx.AsyncClient, args, state: WorkloadState, run_seed: int) -> Dict:
+    recorder = Recorder()
+    stream_results: List[Dict] = []
+    # 预热：建立连接、填充页缓存
+    warmup_deadline = time.perf_counter() + args.warmup
+    await asyncio.gather(*(
+        crud_worker(client, state, warmup_deadline, random.Random(run_seed + i), Recorder())
+        for i in range(args.concurrency)
+    ))
+
+    started = time.perf_counter()
+    deadline = started + args.duration
+
+    async def crud() -> float:
+        await asyncio.gather(*(
+            crud_worker(client, state, deadline, random.Random(run_seed + 1000 + i), recorder)
+            for i in range(args.concurrency)
+        ))
+        return time.perf_counter() - started
+
+    async def streams() -> float:
+        await asyncio.gather(*(
+            stream_worker(client, deadline, args.stream_timeout, stream_results)
+            for _ in range(args.streams)
+        ))
+        return time.perf_counter() - started
+
+    # CRUD 与日报流同时运行，各自按自己的结束时间计算吞吐量
+    elapsed, stream_elapsed = await asyncio.gather(crud(), streams())
+
+    endpoints = recorder.summary(elapsed)
+    total = sum(e["count"] for e in endpoints.values())
+    result = {
+        "elapsed_s": round(elapsed, 3),
+        "crud": {
+            "requests": total,
+            "errors": sum(e["errors"] for e in endpoints.values()),
+            "throughput_rps": round(total / elapsed, 2),
+        },
+        "endpoints": endpoints,
+    }
+    if args.streams:
+        result["report_stream"] = summarize_streams(stream_results, stream_elapsed)
+    return result
+
+async def run_asgi(args, state: WorkloadState, run_seed: int) -> Dict:
+    import main  # 数据库在 lifespan 启动时按当前 DATABASE_PATH 初始化
+    main.report_cache.memory.ttl = 0
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            return await drive(client, args, state, run_seed)
+
+async def run_uvicorn(args, state: WorkloadState, run_seed: int, db_path: str) -> Dict:
+    port = free_port()
+    server = ServerProcess(
+        ["-c", _SERVER_BOOTSTRAP, db_path, str(port)], port, "/health",
+        env={"REPORT_CACHE_TTL": "0"},
+    ).start()
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency + args.streams + 4)
+        async with httpx.AsyncClient(base_url=server.url, limits=limits, timeout=None) as client:
+            return await drive(client, args, state, run_seed)
+    finally:
+        server.stop()
+
+def run_one(args, mode: str, rows: int, template: str, workdir: str) -> Dict:
+    db_path = prepare_run_database(template, workdir, f"{mode}_{rows}")
+    with database.get_db_connection() as conn:
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM todos ORDER BY random() LIMIT 10000"
+        )]
+    state = WorkloadState(ids, database.get_sync_version())
+    try:
+        if mode == "asgi":
+            return asyncio.run(run_asgi(args, state, args.seed))
+        database.close_pool()
+        return asyncio.run(run_uvicorn(args, state, args.seed, db_path))
+    finally:
+        database.close_pool()
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(report: Dict, baseline: Dict):
+    """打印与基线结果的差异（p95 延迟与吞吐量的变化百分比）"""
+    def delta(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"\n对比基线（{baseline['meta'].get('git_revision')}）：")
+    print(f"{'运行':<16}{'接口':<38}{'p95 ms':>12}{'变化':>10}{'rps':>12}{'变化':>10}")
+    for key, run in report["runs"].items():
+        base_run = baseline.get("runs", {}).get(key)
+        if base_run is None:
+            continue
+        for name, stats in run["endpoints"].items():
+            base = base_run["endpoints"].get(name)
+            if not base or not stats.get("count") or not base.get("count"):
+                continue
+            print(f"{key:<16}{name:<38}{stats['p95_ms']:>12}{delta(stats['p95_ms'], base['p95_ms']):>10}"
+                  f"{stats['throughput_rps']:>12}{delta(stats['throughput_rps'], base['throughput_rps']):>10}")
+
+def print_table(report: Dict):
+    for key, run in report["runs"].items():
+        crud = run["crud"]
+        print(f"\n[{key}] {crud['requests']} 个请求，{crud['throughput_rps']} req/s，错误 {crud['errors']}")
+        print(f"{'接口':<38}{'count':>8}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+        for name, s in run["endpoints"].items():
+            if s.get("count"):
+                print(f"{name:<38}{s['count']:>8}{s['throughput_rps']:>10}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}")
+        stream = run.get("report_stream")
+        if stream and stream["total"].get("count"):
+            ttfb, total = stream["ttfb"], stream["total"]
+            print(f"日报流：{total['count']} 次，错误 {total['errors']}，"
+                  f"首字节 p50/p95 {ttfb.get('p50_ms')}/{ttfb.get('p95_ms')} ms，"
+                  f"总耗时 p50/p95 {total['p50_ms']}/{total['p95_ms']} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端负载基准")
+    parser.add_argument("--rows", default="1000", help="预置行数，逗号分隔，例如 1000,100000,1000000")
+    parser.add_argument("--mode", choices=["asgi", "uvicorn", "both"], default="asgi")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发的 CRUD 客户端数")
+    parser.add_argument("--duration", type=float, default=10, help="每轮计时时长（秒）")
+    parser.add_argument("--warmup", type=float, default=1, help="每轮预热时长（秒）")
+    parser.add_argument("--streams", type=int, default=2, help="并发的日报流客户端数，0 表示不测日报")
+    parser.add_argument("--stream-timeout", type=float, default=120, help="单次日报流超时（秒）")
+    parser.add_argument("--llm-latency-ms", type=float, default=200, help="假 LLM 首 token 延迟")
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=50, help="假 LLM 输出速率")
+    parser.add_argument("--llm-max-tokens", type=int, default=200, help="假 LLM 每次回复的 token 数")
+    parser.add_argument("--db-dir", default=os.path.join(tempfile.gettempdir(), "todo_bench"),
+                        help="预置数据库的缓存目录")
+    parser.add_argument("--reseed", action="store_true", help="忽略缓存，重新生成预置数据库")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--output", help="将 JSON 结果写入文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果对比")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出到标准输出")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.rows.split(",") if size.strip()]
+    modes = ["asgi", "uvicorn"] if args.mode == "both" else [args.mode]
+    os.makedirs(args.db_dir, exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix="bench_load_")
+
+    llm_port = free_port()
+    fake_llm = ServerProcess([
+        "-m", "benchmarks.fake_llm", "--port", str(llm_port),
+        "--latency-ms", str(args.llm_latency_ms),
+        "--tokens-per-sec", str(args.llm_tokens_per_sec),
+        "--max-tokens", str(args.llm_max_tokens),
+    ], llm_port, "/v1/models").start()
+    # asgi 模式直接修改本进程的配置，uvicorn 模式的服务进程从环境变量读取
+    ai_client.AI_BASE_URL = os.environ["AI_BASE_URL"] = f"{fake_llm.url}/v1"
+    os.environ.setdefault("AI_API_KEY", "bench")
+
+    report = {
+        "meta": {
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "sqlite_version": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "concurrency": args.concurrency,
+            "streams": args.streams,
+            "duration_s": args.duration,
+            "seed": args.seed,
+            "fake_llm": {
+                "latency_ms": args.llm_latency_ms,
+                "tokens_per_sec": args.llm_tokens_per_sec,
+                "max_tokens": args.llm_max_tokens,
+            },
+            # ASGITransport 在应用返回完整响应后才交给客户端，asgi 模式下首字节时间等于总耗时
+            "note": "asgi 模式的 report_stream.ttfb 不反映真实首字节时间",
+        },
+        "runs": {},
+    }
+    try:
+        for rows in sizes:
+            template = seed_template(args.db_dir, rows, args.seed, args.reseed)
+            for mode in modes:
+                key = f"{mode}/{rows}"
+                print(f"🏃 {key} ...", file=sys.stderr)
+                report["runs"][key] = run_one(args, mode, rows, template, workdir)
+    finally:
+        fake_llm.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.json:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        print_table(report)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+变更操作微基准：对比旧实现（SELECT + UPDATE + SELECT）、
+无 RETURNING 的回退实现和单语句 RETURNING 实现的单次操作延迟
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_mutations --rows 10000 --ops 2000
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import database
+
+
+# ========== 旧实现（改造前的多语句版本，作为基线） ==========
+
+def legacy_toggle_todo(todo_id: int) -> Optional[Dict]:
+    with database.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT completed FROM todos WHERE id = ?", (todo_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        new_status = 0 if row["completed"] else 1
+        cursor.execute("UPDATE todos SET completed = ? WHERE id = ?", (new_status, todo_id))
+        cursor.execute(f"SELECT {database._TODO_COLUMNS} FROM todos WHERE id = ?", (todo_id,))
+        updated_row = cursor.fetchone()
+        return dict(updated_row) if updated_row else None
+
+def legacy_update_todo_text(todo_id: int, new_text: str) -> Optional[Dict]:
+    with database.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE todos SET text = ? WHERE id = ?", (new_text, todo_id))
+        if cursor.rowcount == 0:
+            return None
+        cursor.execute(f"SELECT {database._TODO_COLUMNS} FROM todos WHERE id = ?", (todo_id,))
+        updated_row = cursor.fetchone()
+        return dict(updated_row) if updated_row else None
+
+def legacy_create_todo(text: str) -> Dict:
+    with database.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO todos (text, completed, is_new) VALUES (?, 0, 1)", (text,))
+        return {"id": cursor.lastrowid, "text": text, "completed": False, "is_new": True}
+
+def legacy_delete_all_todos() -> int:
+    with database.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM todos")
+        count = cursor.fetchone()[0]
+        cursor.execute("DELETE FROM todos")
+        return count
+
+
+# ========== 计时工具 ==========
+
+def summarize(samples: List[float]) -> Dict:
+    samples = sorted(samples)
+    return {
+        "ops": len(samples),
+        "mean_us": round(statistics.fmean(samples), 1),
+        "p50_us": round(samples[len(samples) // 2], 1),
+        "p99_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 1),
+    }
+
+def measure(fn: Callable[[], object], ops: int, setup: Optional[Callable[[], object]] = None) -> Dict:
+    samples: List[float] = []
+    for _ in range(ops):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return summarize(samples)
+
+def seed(rows: int):
+    database.delete_all_todos()
+    database.create_bulk_todos([f"任务 {i}" for i in range(rows)])
+
+def run_variant(name: str, workdir: str, rows: int, ops: int) -> Dict[str, Dict]:
+    """name: legacy / fallback / returning"""
+    # 每种实现使用独立的数据库文件，避免 WAL 增长等因素影响后运行的实现
+    database.close_pool()
+    database.DATABASE_PATH = os.path.join(workdir, f"bench_{name}.db")
+    database.init_database()
+    database.HAS_RETURNING = name == "returning" and sqlite_supports_returning()
+    toggle = legacy_toggle_todo if name == "legacy" else database.toggle_todo
+    update_text = legacy_update_todo_text if name == "legacy" else database.update_todo_text
+    create = legacy_create_todo if name == "legacy" else database.create_todo
+    delete_all = legacy_delete_all_todos if name == "legacy" else database.delete_all_todos
+
+    seed(rows)
+    with database.get_db_connection() as conn:
+        ids = [row[0] for row in conn.execute("SELECT id FROM todos")]
+    rng = random.Random(42)
+    results = {
+        "toggle": measure(lambda: toggle(rng.choice(ids)), ops),
+        "update_text": measure(lambda: update_text(rng.choice(ids), f"更新 {rng.random()}"), ops),
+        "create": measure(lambda: create("新任务"), ops),
+    }
+    # delete_all 每次执行前重新预置数据
+    results["delete_all"] = measure(delete_all, max(1, ops // 100), setup=lambda: seed(rows))
+    return results
+
+def sqlite_supports_returning() -> bool:
+    return sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="变更操作微基准")
+    parser.add_argument("--rows", type=int, default=10000, help="预置的行数")
+    parser.add_argument("--ops", type=int, default=2000, help="每种操作的执行次数")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_mutations_")
+
+    variants = ["legacy", "fallback"]
+    if sqlite_supports_returning():
+        variants.append("returning")
+    report = {
+        "sqlite_version": sqlite3.sqlite_version,
+        "rows": args.rows,
+        "results": {name: run_variant(name, workdir, args.rows, args.ops) for name in variants},
+    }
+    database.close_pool()
+
+    if args.json:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+
+    print(f"SQLite {report['sqlite_version']}，{args.rows} 行，单位：微秒")
+    print(f"{'操作':<12}{'实现':<12}{'mean':>10}{'p50':>10}{'p99':>10}")
+    for op in ["toggle", "update_text", "create", "delete_all"]:
+        for name in variants:
+            r = report["results"][name][op]
+            print(f"{op:<12}{name:<12}{r['mean_us']:>10}{r['p50_us']:>10}{r['p99_us']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+多 worker 扩展基准：以 main.py --workers N 启动后端（uvicorn 多进程、共用同一个数据库文件），
+用与 bench_load 相同的 CRUD 混合负载测量吞吐量随 worker 数的变化
+
+负载由多个客户端进程产生，避免单个事件循环成为瓶颈。客户端与服务端在同一台机器上运行，
+worker 数超过 CPU 核数后吞吐量不会继续增长。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_workers --workers 1,2,4 --rows 10000 --duration 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+import database
+from benchmarks.bench_load import (
+    BACKEND_DIR, Recorder, ServerProcess, WorkloadState, crud_worker, percentile,
+    prepare_run_database, seed_template,
+)
+from benchmarks.fake_llm import free_port
+
+
+# ========== 客户端进程 ==========
+
+async def client_main(url: str, state_path: str, concurrency: int, warmup: float, duration: float,
+                      start_at: float, seed: int) -> Dict:
+    with open(state_path, encoding="utf-8") as f:
+        initial = json.load(f)
+    state = WorkloadState(initial["ids"], initial["version"])
+    limits = httpx.Limits(max_connections=concurrency + 4)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=None) as client:
+        # 所有客户端进程约定同一个开始时间，保证负载时间段重叠
+        await asyncio.sleep(max(0.0, start_at - time.time()))
+        warmup_deadline = time.perf_counter() + warmup
+        await asyncio.gather(*(
+            crud_worker(client, state, warmup_deadline, random.Random(seed * 1000 + i), Recorder())
+            for i in range(concurrency)
+        ))
+        recorder = Recorder()
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(
+            crud_worker(client, state, deadline, random.Random(seed * 1000 + 500 + i), recorder)
+            for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+    return {"elapsed": elapsed, "samples": recorder.samples, "errors": recorder.errors}
+
+
+# ========== 调度 ==========
+
+def run_workers(args, workers: int, template: str, workdir: str) -> Dict:
+    path = prepare_run_database(template, workdir, f"workers_{workers}")
+    with database.get_db_connection() as conn:
+        ids = [row[0] for row in conn.execute("SELECT id FROM todos ORDER BY random() LIMIT 10000")]
+    state_path = os.path.join(workdir, "state.json")
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "version": database.get_sync_version()}, f)
+    database.close_pool()
+
+    port = free_port()
+    server = ServerProcess(
+        ["main.py", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        port, "/health",
+        env={"DATABASE_PATH": path, "REPORT_CACHE_TTL": "0"},
+    ).start()
+    try:
+        start_at = time.time() + 2
+        clients = [
+            subprocess.Popen(
+                [sys.executable, "-m", "benchmarks.bench_workers", "--client", server.url,
+                 "--state", state_path, "--concurrency", str(args.concurrency),
+                 "--warmup", str(args.warmup), "--duration", str(args.duration),
+                 "--start-at", str(start_at), "--seed", str(args.seed + i)],
+                cwd=BACKEND_DIR, stdout=subprocess.PIPE,
+            )
+            for i in range(args.clients)
+        ]
+        results = [json.loads(p.communicate()[0]) for p in clients]
+    finally:
+        server.stop()
+
+    reads: List[float] = []
+    writes: List[float] = []
+    errors = 0
+    for r in results:
+        for name, samples in r["samples"].items():
+            (reads if name.startswith("GET ") else writes).extend(samples)
+        errors += sum(r["errors"].values())
+    latencies = sorted(reads + writes)
+    elapsed = max(r["elapsed"] for r in results)
+    with sqlite3.connect(path) as conn:
+        integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "read_rps": round(len(reads) / elapsed, 1),
+        "write_rps": round(len(writes) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "integrity": integrity,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多 worker 扩展基准")
+    parser.add_argument("--workers", default="1,2,4", help="要测试的 worker 数，逗号分隔")
+    parser.add_argument("--rows", type=int, default=10000, help="预置行数")
+    parser.add_argument("--clients", type=int, default=4, help="产生负载的客户端进程数")
+    parser.add_argument("--concurrency", type=int, default=16, help="每个客户端进程的并发请求数")
+    parser.add_argument("--duration", type=float, default=10, help="每轮计时时长（秒）")
+    parser.add_argument("--warmup", type=float, default=2, help="每轮预热时长（秒）")
+    parser.add_argument("--db-dir", default=os.path.join(tempfile.gettempdir(), "todo_bench"),
+                        help="预置数据库缓存目录（与 bench_load 共用）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    # 内部参数：作为客户端进程运行
+    parser.add_argument("--client", help=argparse.SUPPRESS)
+    parser.add_argument("--state", help=argparse.SUPPRESS)
+    parser.add_argument("--start-at", type=float, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.client:
+        result = asyncio.run(client_main(
+            args.client, args.state, args.concurrency, args.warmup, args.duration, args.start_at, args.seed
+        ))
+        json.dump(result, sys.stdout)
+        return
+
+    os.makedirs(args.db_dir, exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix="bench_workers_")
+    template = seed_template(args.db_dir, args.rows, args.seed)
+    report = {
+        "rows": args.rows,
+        "cpu_count": os.cpu_count(),
+        "clients": args.clients,
+        "concurrency": args.concurrency,
+        "results": {},
+    }
+    try:
+        for workers in [int(n) for n in args.workers.split(",")]:
+            print(f"🏃 {workers} worker ...", file=sys.stderr)
+            report["results"][workers] = run_workers(args, workers, template, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+    print(f"{report['rows']} 行，{args.clients} 个客户端进程 × {args.concurrency} 并发，"
+          f"{args.duration}s，CPU 核数 {report['cpu_count']}")
+    print(f"{'workers':>8}{'rps':>10}{'read rps':>10}{'write rps':>10}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}{'scaling':>9}{'errors':>8}")
+    base = next(iter(report["results"].values()))["throughput_rps"]
+    for workers, r in report["results"].items():
+        scaling = f"{r['throughput_rps'] / base:.2f}x" if base else "-"
+        print(f"{workers:>8}{r['throughput_rps']:>10}{r['read_rps']:>10}{r['write_rps']:>10}"
+              f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{scaling:>9}{r['errors']:>8}")
+        if r["integrity"] != "ok":
+            print(f"{'':>8}⚠️  integrity_check: {r['integrity']}")
+    if max(report["results"]) > (report["cpu_count"] or 1):
+        print(f"⚠️  worker 数超过 CPU 核数（{report['cpu_count']}），超出部分无法带来扩展")
+
+
+if __name__ == "__main__":
+    main()
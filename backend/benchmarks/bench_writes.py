@@ -0,0 +1,170 @@
+"""
+写入吞吐基准：大量并发的单条 CRUD 写请求（创建 / 切换 / 改文本 / 删除），
+对比逐条提交与合并提交（DB_GROUP_COMMIT）下的写入速率、延迟和 "database is locked" 错误数
+
+每个进程经 db_executor.run_write 发起写请求（不含 HTTP 开销）；--processes 大于 1 时
+多个进程同时写同一个数据库文件，模拟多 worker 部署下的写锁竞争。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_writes --rows 10000 --concurrency 64 --duration 5
+    python -m benchmarks.bench_writes --processes 4
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.bench_load import BACKEND_DIR, percentile, prepare_run_database, seed_template
+
+# 写操作比例
+OPERATIONS = [("create", 3), ("toggle", 4), ("update_text", 2), ("delete", 1)]
+
+
+# ========== 工作进程 ==========
+
+async def worker_main(path: str, duration: float, concurrency: int, start_at: float, seed: int) -> Dict:
+    import database
+    import db_executor
+
+    database.DATABASE_PATH = path
+    with database.get_db_connection() as conn:
+        ids = [row[0] for row in conn.execute("SELECT id FROM todos")]
+    max_id = max(ids) if ids else 1
+    names = [name for name, weight in OPERATIONS for _ in range(weight)]
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+
+    async def client(rng: random.Random, deadline: float):
+        while time.time() < deadline:
+            op = rng.choice(names)
+            todo_id = rng.randint(1, max_id)
+            started = time.perf_counter()
+            try:
+                if op == "create":
+                    await db_executor.run_write(database.create_todo, f"写入基准 {rng.random()}")
+                elif op == "toggle":
+                    await db_executor.run_write(database.toggle_todo, todo_id)
+                elif op == "update_text":
+                    await db_executor.run_write(database.update_todo_text, todo_id, f"更新 {rng.random()}")
+                else:
+                    await db_executor.run_write(database.delete_todo, todo_id)
+            except Exception as e:
+                key = "database is locked" if "locked" in str(e) else type(e).__name__
+                errors[key] = errors.get(key, 0) + 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    # 多个进程约定同一个开始时间，保证写入时间段重叠
+    await asyncio.sleep(max(0.0, start_at - time.time()))
+    deadline = time.time() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(client(random.Random(seed * 1000 + i), deadline) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await db_executor.flush_writes()
+    stats = db_executor.get_executor_stats()["group_commit"]
+    db_executor.shutdown()
+    database.close_pool()
+    return {"ops": len(latencies), "elapsed": elapsed, "latencies": latencies, "errors": errors,
+            "avg_batch_size": stats["avg_batch_size"]}
+
+
+# ========== 调度 ==========
+
+def run_mode(args, mode: str, template: str, workdir: str) -> Dict:
+    path = prepare_run_database(template, workdir, f"writes_{mode}")
+    import database
+    database.close_pool()
+
+    env = {
+        **os.environ,
+        "DB_GROUP_COMMIT": "1" if mode == "group" else "0",
+        "DB_GROUP_COMMIT_WINDOW_MS": str(args.window_ms),
+        "DB_GROUP_COMMIT_MAX_BATCH": str(args.max_batch),
+    }
+    start_at = time.time() + 2
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.bench_writes", "--worker", path,
+             "--duration", str(args.duration), "--concurrency", str(args.concurrency),
+             "--start-at", str(start_at), "--seed", str(args.seed + i)],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.PIPE,
+        )
+        for i in range(args.processes)
+    ]
+    results = [json.loads(p.communicate()[0]) for p in processes]
+
+    latencies = sorted(v for r in results for v in r["latencies"])
+    errors: Dict[str, int] = {}
+    for r in results:
+        for key, count in r["errors"].items():
+            errors[key] = errors.get(key, 0) + count
+    elapsed = max(r["elapsed"] for r in results)
+    with sqlite3.connect(path) as conn:
+        integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    return {
+        "ops": len(latencies),
+        "writes_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "errors": errors,
+        "avg_batch_size": [r["avg_batch_size"] for r in results],
+        "integrity": integrity,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="写入吞吐基准")
+    parser.add_argument("--rows", type=int, default=10000, help="预置行数")
+    parser.add_argument("--duration", type=float, default=5, help="每种模式的运行秒数")
+    parser.add_argument("--concurrency", type=int, default=64, help="每个进程的并发写请求数")
+    parser.add_argument("--processes", type=int, default=1, help="同时写同一数据库的进程数")
+    parser.add_argument("--modes", default="single,group", help="single（逐条提交）、group（合并提交），逗号分隔")
+    parser.add_argument("--window-ms", type=float, default=2)
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--db-dir", default=os.path.join(tempfile.gettempdir(), "todo_bench"),
+                        help="预置数据库缓存目录（与 bench_load 共用）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    # 内部参数：作为工作进程运行
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--start-at", type=float, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = asyncio.run(worker_main(args.worker, args.duration, args.concurrency, args.start_at, args.seed))
+        json.dump(result, sys.stdout)
+        return
+
+    os.makedirs(args.db_dir, exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix="bench_writes_")
+    template = seed_template(args.db_dir, args.rows, args.seed)
+    report = {
+        "rows": args.rows,
+        "processes": args.processes,
+        "concurrency": args.concurrency,
+        "results": {mode: run_mode(args, mode, template, workdir) for mode in args.modes.split(",")},
+    }
+
+    if args.json:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+    print(f"{args.processes} 个进程 × {args.concurrency} 并发，{args.rows} 行，{args.duration}s")
+    print(f"{'mode':<8}{'writes/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'batch':>8}  errors")
+    for mode, r in report["results"].items():
+        batch = sum(r["avg_batch_size"]) / len(r["avg_batch_size"])
+        print(f"{mode:<8}{r['writes_per_sec']:>10}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}"
+              f"{batch:>8.1f}  {r['errors'] or '-'}")
+
+
+if __name__ == "__main__":
+    main()
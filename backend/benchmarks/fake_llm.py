@@ -0,0 +1,101 @@
+"""
+本地假 LLM 服务（OpenAI 兼容接口），用于压测时替代真实上游
+
+支持 POST /v1/chat/completions（普通与 stream=true）和 GET /v1/models。
+首 token 延迟与输出速率可配置，响应内容固定，结果可复现。
+
+单独运行（在 backend 目录下）：
+    python -m benchmarks.fake_llm --port 9100 --latency-ms 200 --tokens-per-sec 50
+然后以 AI_BASE_URL=http://127.0.0.1:9100/v1 启动后端。
+"""
+
+import argparse
+import asyncio
+import json
+import socket
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 输出内容：按 token 切分后循环使用
+_TOKENS = ["工作", "日报", "：", "今天", "完成", "了", "多项", "任务", "，", "进展", "顺利", "。", "\n"]
+
+
+def create_app(latency_ms: float = 200, tokens_per_sec: float = 50, max_tokens: int = 200) -> FastAPI:
+    """latency_ms：首 token 延迟；tokens_per_sec：输出速率（<= 0 表示不限速）；max_tokens：默认输出长度"""
+    app = FastAPI(title="Fake LLM")
+    app.state.stats = {"requests": 0, "stream_requests": 0, "tokens": 0}
+
+    def token_interval() -> float:
+        return 1 / tokens_per_sec if tokens_per_sec > 0 else 0
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "fake-model", "object": "model"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        count = min(int(body.get("max_tokens") or max_tokens), max_tokens)
+        tokens = [_TOKENS[i % len(_TOKENS)] for i in range(count)]
+        stats = app.state.stats
+        stats["requests"] += 1
+        stats["tokens"] += count
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency_ms / 1000 + count * token_interval())
+            return JSONResponse({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "model": body.get("model", "fake-model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                "usage": {"completion_tokens": count},
+            })
+
+        stats["stream_requests"] += 1
+
+        async def events():
+            await asyncio.sleep(latency_ms / 1000)
+            interval = token_interval()
+            started = time.monotonic()
+            for i, token in enumerate(tokens):
+                chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                if interval:
+                    # 按绝对时间对齐，避免 sleep 误差累积
+                    delay = started + (i + 1) * interval - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地假 LLM 服务（OpenAI 兼容）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=200, help="首 token 延迟（毫秒）")
+    parser.add_argument("--tokens-per-sec", type=float, default=50, help="输出速率，<= 0 表示不限速")
+    parser.add_argument("--max-tokens", type=int, default=200, help="每次回复的 token 数")
+    args = parser.parse_args()
+
+    print(f"🤖 Fake LLM: http://{args.host}:{args.port}/v1")
+    uvicorn.run(
+        create_app(args.latency_ms, args.tokens_per_sec, args.max_tokens),
+        host=args.host, port=args.port, log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+缓存模块
+提供带 TTL 的内存 LRU 缓存、AI 日报的内容寻址缓存（内存 + 可选 SQLite 磁盘层），
+AI 任务分解的结果缓存与并发请求合并（single-flight），以及已编码的列表响应缓存
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class TTLCache:
+    """线程安全的 LRU 缓存，条目在 ttl 秒后过期"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# ========== AI 日报缓存 ==========
+
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "256"))
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", "3600"))
+# 设置后启用磁盘层，例如 REPORT_CACHE_DB=report_cache.db；进程重启后缓存仍然有效
+REPORT_CACHE_DB = os.getenv("REPORT_CACHE_DB", "")
+
+
+def report_cache_key(
+    language: str,
+    date_str: str,
+    completed_texts: List[str],
+    incomplete_texts: List[str],
+    model: str,
+) -> str:
+    """根据生成日报的全部输入计算缓存键；任务集合不变时键不变"""
+    payload = json.dumps(
+        [language, date_str, completed_texts, incomplete_texts, model],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ReportCache:
+    """两级日报缓存：内存 LRU 在前，SQLite 文件在后（可选）"""
+
+    def __init__(self, max_size: int, ttl: float, db_path: str = ""):
+        self.memory = TTLCache(max_size, ttl)
+        self.ttl = ttl
+        self.db_path = db_path
+        self.disk_hits = 0
+        self._disk_conn: Optional[sqlite3.Connection] = None
+        self._disk_lock = threading.Lock()
+
+    # ----- 磁盘层（同步实现，在线程中调用） -----
+
+    def _disk(self) -> sqlite3.Connection:
+        if self._disk_conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS report_cache (
+                    key TEXT PRIMARY KEY,
+                    report TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.commit()
+            self._disk_conn = conn
+        return self._disk_conn
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        with self._disk_lock:
+            row = self._disk().execute(
+                "SELECT report FROM report_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+            return row[0] if row else None
+
+    def _disk_set(self, key: str, report: str):
+        with self._disk_lock:
+            conn = self._disk()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO report_cache (key, report, expires_at) VALUES (?, ?, ?)",
+                (key, report, now + self.ttl),
+            )
+            conn.execute("DELETE FROM report_cache WHERE expires_at <= ?", (now,))
+            conn.commit()
+
+    # ----- 异步接口 -----
+
+    async def get(self, key: str) -> Optional[str]:
+        report = self.memory.get(key)
+        if report is not None or not self.db_path:
+            return report
+        report = await asyncio.to_thread(self._disk_get, key)
+        if report is not None:
+            self.disk_hits += 1
+            self.memory.set(key, report)
+        return report
+
+    async def set(self, key: str, report: str):
+        self.memory.set(key, report)
+        if self.db_path:
+            await asyncio.to_thread(self._disk_set, key, report)
+
+    def close(self):
+        with self._disk_lock:
+            if self._disk_conn is not None:
+                self._disk_conn.close()
+                self._disk_conn = None
+
+    def stats(self) -> Dict:
+        stats = self.memory.stats()
+        # 内存未命中但磁盘命中的请求，整体上仍算命中
+        stats["disk_enabled"] = bool(self.db_path)
+        stats["disk_hits"] = self.disk_hits
+        stats["misses"] = stats["misses"] - self.disk_hits
+        lookups = stats["hits"] + self.disk_hits + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + self.disk_hits) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+report_cache = ReportCache(REPORT_CACHE_SIZE, REPORT_CACHE_TTL, REPORT_CACHE_DB)
+
+
+# ========== AI 任务分解缓存 ==========
+
+BREAKDOWN_CACHE_SIZE = int(os.getenv("BREAKDOWN_CACHE_SIZE", "1024"))
+BREAKDOWN_CACHE_TTL = float(os.getenv("BREAKDOWN_CACHE_TTL", "86400"))
+
+# 中日韩文字（汉字、假名、谚文）
+_CJK_CHAR = (
+    r"\u2e80-\u2fdf\u3040-\u30ff\u3100-\u312f\u3400-\u4dbf"
+    r"\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+)
+_SPACE_NEAR_CJK = re.compile(rf"(?<=[{_CJK_CHAR}])\s+|\s+(?=[{_CJK_CHAR}])")
+
+
+# 句末标点（NFKC 之后的形式）：只去掉结尾的这些字符，其余标点和符号都有意义（"C++"、"#123"、"50%"）
+_TRAILING_PUNCTUATION = ".。｡!?,;:、…~～"
+
+
+def normalize_task_text(text: str) -> str:
+    """归一化任务文本，使仅在空白、句末标点、全半角或大小写上不同的任务共享缓存
+
+    中文等 CJK 文本不以空格分词，因此紧邻 CJK 字符的空白全部去掉；
+    拉丁文单词之间的空白压缩为一个空格。
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    # 例如 "写报告。" 与 "写报告" 视为同一任务
+    text = " ".join(text.split()).rstrip(_TRAILING_PUNCTUATION + " ")
+    return _SPACE_NEAR_CJK.sub("", text)
+
+
+def breakdown_cache_key(task_text: str, model: str) -> str:
+    """任务分解缓存键"""
+    return f"{model}\x00{normalize_task_text(task_text)}"
+
+
+class SingleFlight:
+    """合并并发的相同请求：同一个 key 同时只执行一次，其余调用者共享结果"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shield：某个调用者断开连接时，不取消其他调用者仍在等待的请求
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict:
+        return {"inflight": len(self._inflight), "coalesced": self.coalesced}
+
+
+breakdown_cache = TTLCache(BREAKDOWN_CACHE_SIZE, BREAKDOWN_CACHE_TTL)
+breakdown_flight = SingleFlight()
+
+
+# ========== 列表响应缓存 ==========
+# 缓存已编码的 GET /todos 响应体；键为列表 ETag（数据版本 + NEW 数量 + 查询参数），
+# 有写入时整体清空，因此不会返回旧数据。
+
+LIST_CACHE_SIZE = int(os.getenv("LIST_CACHE_SIZE", "16"))
+LIST_CACHE_TTL = float(os.getenv("LIST_CACHE_TTL", "300"))
+LIST_CACHE_MAX_BYTES = int(os.getenv("LIST_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))  # 超过此大小的响应体不缓存
+
+list_cache = TTLCache(LIST_CACHE_SIZE, LIST_CACHE_TTL)
+list_flight = SingleFlight()
@@ -3,40 +3,622 @@ SQLite 数据库管理模块
 负责初始化数据库、创建表、以及所有 CRUD 操作
 """
 
+import os
+import queue
+import re
 import sqlite3
-from typing import List, Dict, Optional
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, List, Dict, Optional, Tuple
 from contextlib import contextmanager
 
-DATABASE_PATH = "todos.db"
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl：初始化不加文件锁，只支持单 worker
+    fcntl = None
 
-@contextmanager
-def get_db_connection():
-    """数据库连接上下文管理器"""
-    conn = sqlite3.connect(DATABASE_PATH)
+import metrics
+
+# 数据库文件：可用环境变量 DATABASE_PATH 指定，默认为 backend 目录下的 todos.db。
+# 统一转成绝对路径，多个 worker 进程无论工作目录在哪里都打开同一个文件。
+DATABASE_PATH = os.path.abspath(
+    os.getenv("DATABASE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "todos.db"))
+)
+
+# ========== 连接池配置（可通过环境变量调整） ==========
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))                 # 池中最多保留的连接数
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))         # 等待空闲连接的最长秒数
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))   # 写锁冲突时的等待时间
+MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "8192"))      # 每个连接的页缓存大小 (KiB)
+
+# 是否可以使用 FTS5 trigram 全文索引（由 init_database() 检测）
+FTS_AVAILABLE = False
+
+# ========== "NEW" 标记 ==========
+NEW_FLAG_HOURS = 1  # 创建后多少小时内显示 "NEW"
+
+# is_new 在读取时计算：存储值为 1 且仍在有效期内才视为新任务。
+# 过期标记由后台清理任务 expire_new_flags() 批量写回，读路径不再产生任何写操作。
+# 写成 is_new = 1（而不是 is_new）才能匹配部分索引 idx_todos_new_created_at 的 WHERE 条件。
+_IS_NEW_SQL = (
+    f"(is_new = 1 AND (created_at IS NULL OR created_at > datetime('now', '-{NEW_FLAG_HOURS} hours')))"
+)
+_TODO_COLUMNS = f"id, text, completed, {_IS_NEW_SQL} AS is_new, created_at"
+# _TODO_COLUMNS 的列顺序（元组行按此顺序取值）
+TODO_FIELDS = ("id", "text", "completed", "is_new", "created_at")
+# 归档表按同样的列顺序读取：归档的任务都已完成，不显示 NEW
+_ARCHIVE_COLUMNS = "id, text, 1 AS completed, 0 AS is_new, created_at"
+
+def _todo_from_row(row) -> Dict:
+    """把按 _TODO_COLUMNS 读出的一行（sqlite3.Row 或元组）转换为字典
+
+    completed / is_new 在 SQLite 中是 0/1，这里转成布尔值，与 Todo 模型和列表接口的输出一致。
+    所有离开本模块的任务记录都经过这里。
+    """
+    todo = dict(row) if isinstance(row, sqlite3.Row) else dict(zip(TODO_FIELDS, row))
+    todo["completed"] = bool(todo["completed"])
+    todo["is_new"] = bool(todo["is_new"])
+    return todo
+
+
+def _create_connection() -> sqlite3.Connection:
+    """创建新连接，并一次性应用所有 PRAGMA 调优"""
+    conn = sqlite3.connect(
+        DATABASE_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,  # 连接会在不同线程间复用，由连接池保证同一时刻只有一个使用者
+        # 开启慢查询分析时使用计时游标，否则不做任何包装
+        factory=_ProfiledConnection if _profiler is not None else sqlite3.Connection,
+    )
     conn.row_factory = sqlite3.Row  # 允许通过列名访问
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+class ConnectionPool:
+    """有界 SQLite 连接池：连接按需创建、用完归还、跨请求复用"""
+
+    def __init__(self, max_size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._acquired = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._discarded = 0
+
+    def acquire(self) -> sqlite3.Connection:
+        """取出一个空闲连接；池未满时新建，已满时阻塞等待"""
+        waited = 0.0
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.max_size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = _create_connection()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                started = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"等待数据库连接超时（{self.timeout}s）")
+                finally:
+                    waited = time.perf_counter() - started
+                    with self._lock:
+                        self._waits += 1
+                        self._wait_time += waited
+        with self._lock:
+            self._in_use += 1
+            self._acquired += 1
+        metrics.DB_POOL_WAIT_SECONDS.observe(waited)
+        return conn
+
+    def release(self, conn: sqlite3.Connection, discard: bool = False):
+        """归还连接；出现异常的连接直接关闭丢弃"""
+        with self._lock:
+            self._in_use -= 1
+            if discard:
+                self._created -= 1
+                self._discarded += 1
+        if discard:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        else:
+            self._idle.put(conn)
+
+    def close_all(self):
+        """关闭所有空闲连接（应用关闭时调用）"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def stats(self) -> Dict:
+        """连接池运行状态"""
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "acquired_total": self._acquired,
+                "waits_total": self._waits,
+                "wait_time_total_ms": round(self._wait_time * 1000, 3),
+                "discarded_total": self._discarded,
+            }
+
+
+_pool = ConnectionPool()
+
+
+def get_pool_stats() -> Dict:
+    """获取连接池统计信息"""
+    return _pool.stats()
+
+
+def close_pool():
+    """关闭连接池中的所有连接"""
+    _pool.close_all()
+
+
+# ========== 慢查询分析（可选） ==========
+# DB_PROFILE=1 时连接改用计时游标：按语句模板汇总调用次数与耗时，超过 DB_SLOW_QUERY_MS 的
+# 执行记入慢查询日志（参数只保留类型），并在首次变慢时抓取一次 EXPLAIN QUERY PLAN。
+PROFILE_ENABLED = os.getenv("DB_PROFILE", "0") == "1"
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "20"))
+PROFILE_MAX_STATEMENTS = 500   # 最多跟踪的语句模板数
+SLOW_LOG_SIZE = 100            # 保留最近多少条慢查询
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_PLACEHOLDER_LIST_RE = re.compile(r"\?(?: ?, ?\?)+")
+_REPEATED_GROUP_RE = re.compile(r"(\([^()]*\))(?: ?, ?\1)+")
+
+
+def normalize_sql(sql: str) -> str:
+    """语句模板：压缩空白，并把长度不定的 IN 列表 / 多行 VALUES 合并成一项"""
+    sql = _WHITESPACE_RE.sub(" ", sql).strip()
+    sql = _PLACEHOLDER_LIST_RE.sub("?, ...", sql)
+    return _REPEATED_GROUP_RE.sub(r"\1, ...", sql)
+
+
+def _redact_params(params: Any, max_items: int = 8) -> str:
+    """参数脱敏：只保留类型（字符串附带长度），不记录取值"""
+    values = list(params.values()) if isinstance(params, dict) else list(params or ())
+    parts = []
+    for value in values[:max_items]:
+        if value is None:
+            parts.append("NULL")
+        elif isinstance(value, (str, bytes)):
+            parts.append(f"{type(value).__name__}({len(value)})")
+        else:
+            parts.append(type(value).__name__)
+    if len(values) > max_items:
+        parts.append(f"...共 {len(values)} 个")
+    return ", ".join(parts)
+
+
+def _explain(conn: sqlite3.Connection, sql: str, params: Any) -> List[str]:
+    """EXPLAIN QUERY PLAN，按层级缩进；使用普通游标，不计入分析结果"""
+    try:
+        rows = sqlite3.Cursor(conn).execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    except sqlite3.Error as e:
+        return [f"(无法获取查询计划: {e})"]
+    depth = {0: -1}
+    plan = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        plan.append("  " * depth[node_id] + detail)
+    return plan
+
+
+def _plan_flags(plan: List[str]) -> Dict:
+    """从查询计划中找出全表 / 全索引扫描和临时排序
+
+    子查询 / CTE 的结果（MATERIALIZE、CO-ROUTINE）和虚拟表的扫描不算全表扫描。
+    """
+    details = [line.strip() for line in plan]
+    derived = {d.split(" ", 1)[1] for d in details if d.startswith(("MATERIALIZE ", "CO-ROUTINE "))}
+    return {
+        "full_scans": [
+            d for d in details
+            if d.startswith("SCAN ")
+            and d.split(" ")[1] not in derived | {"CONSTANT"}
+            and "VIRTUAL TABLE" not in d
+        ],
+        "temp_btree": any("USE TEMP B-TREE" in d for d in details),
+    }
+
+
+class QueryProfiler:
+    """按语句模板汇总耗时，记录慢查询"""
+
+    def __init__(
+        self,
+        threshold_ms: float = SLOW_QUERY_MS,
+        max_statements: int = PROFILE_MAX_STATEMENTS,
+        log_size: int = SLOW_LOG_SIZE,
+        log: bool = True,
+    ):
+        self.threshold = threshold_ms / 1000
+        self.log = log
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self._statements: Dict[str, Dict] = {}
+        self._slow_log: deque = deque(maxlen=log_size)
+        self.untracked = 0
+        self.started_at = time.time()
+
+    def record(self, conn: sqlite3.Connection, sql: str, params: Any, elapsed: float, rows: int):
+        key = normalize_sql(sql)
+        slow = elapsed >= self.threshold
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is None:
+                if len(self._statements) >= self.max_statements:
+                    self.untracked += 1
+                    return
+                entry = self._statements[key] = {
+                    "sql": key, "calls": 0, "total": 0.0, "max": 0.0, "rows": 0,
+                    "slow_calls": 0, "plan": None, "full_scans": [], "temp_btree": False,
+                }
+            entry["calls"] += 1
+            entry["total"] += elapsed
+            entry["max"] = max(entry["max"], elapsed)
+            entry["rows"] += rows
+            if not slow:
+                return
+            entry["slow_calls"] += 1
+            capture_plan = entry["plan"] is None
+            if capture_plan:
+                entry["plan"] = []  # 占位，避免多个线程重复抓取
+        if capture_plan:
+            plan = _explain(conn, sql, params)
+            with self._lock:
+                entry["plan"] = plan
+                entry.update(_plan_flags(plan))
+        redacted = _redact_params(params)
+        with self._lock:
+            self._slow_log.append({
+                "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "elapsed_ms": round(elapsed * 1000, 3),
+                "rows": rows,
+                "sql": key,
+                "params": redacted,
+                "full_scan": bool(entry["full_scans"]),
+            })
+        metrics.DB_SLOW_QUERIES.inc()
+        if self.log:
+            print(f"🐢 慢查询 {elapsed * 1000:.1f}ms（{rows} 行）: {key[:200]} [{redacted}]")
+
+    def report(self, limit: int = 20) -> Dict:
+        with self._lock:
+            entries = sorted(self._statements.values(), key=lambda e: e["total"], reverse=True)
+            top = [dict(e, plan=list(e["plan"] or [])) for e in entries[:limit]]
+            recent = list(self._slow_log)
+            tracked = len(self._statements)
+        return {
+            "enabled": True,
+            "threshold_ms": self.threshold * 1000,
+            "since": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started_at)),
+            "statements_tracked": tracked,
+            "untracked_calls": self.untracked,
+            "top": [
+                {
+                    "sql": e["sql"],
+                    "calls": e["calls"],
+                    "total_ms": round(e["total"] * 1000, 3),
+                    "avg_ms": round(e["total"] * 1000 / e["calls"], 3),
+                    "max_ms": round(e["max"] * 1000, 3),
+                    "avg_rows": round(e["rows"] / e["calls"], 1),
+                    "slow_calls": e["slow_calls"],
+                    "full_scans": e["full_scans"],
+                    "temp_btree": e["temp_btree"],
+                    "plan": e["plan"],
+                }
+                for e in top
+            ],
+            "recent_slow": recent[::-1],
+        }
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._slow_log.clear()
+            self.untracked = 0
+            self.started_at = time.time()
+
+
+class _ProfiledCursor(sqlite3.Cursor):
+    """计时游标：一次执行的耗时 = execute + 之后的各次 fetch，直到结果读完、游标复用或被释放"""
+
+    _pending: Optional[list] = None  # [sql, params, 累计耗时, 已读行数]
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None and _profiler is not None:
+            _profiler.record(self.connection, *pending)
+
+    def _timed(self, fetch: Callable, *args):
+        started = time.perf_counter()
+        result = fetch(*args)
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - started
+        return result
+
+    def execute(self, sql: str, parameters: Any = ()):
+        self._finish()
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._pending = [sql, parameters, time.perf_counter() - started, 0]
+        if self.description is None:
+            # 没有结果集的语句（不带 RETURNING 的写操作等）在 execute 时已执行完毕
+            self._pending[3] = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters):
+        self._finish()
+        seq = list(seq_of_parameters)
+        started = time.perf_counter()
+        super().executemany(sql, seq)
+        # 查询计划按第一组参数抓取
+        self._pending = [sql, seq[0] if seq else (), time.perf_counter() - started, max(self.rowcount, 0)]
+        self._finish()
+        return self
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        elif self._pending is not None:
+            self._pending[3] += 1
+        return row
+
+    def fetchmany(self, size: Optional[int] = None):
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        if self._pending is not None:
+            self._pending[3] += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        if self._pending is not None:
+            self._pending[3] += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        if self._pending is not None:
+            self._pending[3] += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # 只读取了部分结果（如 execute(...).fetchone()）的游标在释放时结算
+        self._finish()
+
+
+class _ProfiledConnection(sqlite3.Connection):
+    def cursor(self, factory=_ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql: str, parameters: Any = ()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+_profiler: Optional[QueryProfiler] = QueryProfiler() if PROFILE_ENABLED else None
+
+
+def enable_query_profiling(threshold_ms: float = SLOW_QUERY_MS, log: bool = True):
+    """运行时开启慢查询分析（命令行工具使用）
+
+    只对之后新建的连接生效：这里会关闭池中的空闲连接，借出中的连接保持不变。
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = QueryProfiler(threshold_ms, log=log)
+    else:
+        _profiler.threshold = threshold_ms / 1000
+        _profiler.log = log
+    close_pool()
+
+
+def get_query_profile(limit: int = 20) -> Dict:
+    """按总耗时排序的前 limit 条语句模板及最近的慢查询"""
+    if _profiler is None:
+        return {"enabled": False, "threshold_ms": SLOW_QUERY_MS, "top": [], "recent_slow": []}
+    return _profiler.report(limit)
+
+
+def reset_query_profile():
+    """清空已汇总的分析数据"""
+    if _profiler is not None:
+        _profiler.reset()
+
+
+# ========== 变更通知 ==========
+# 写事务提交后依次调用这些回调（在执行写操作的线程中调用，回调需自行保证线程安全）
+_change_listeners: List[Callable[[], None]] = []
+
+def add_change_listener(listener: Callable[[], None]):
+    """注册数据变更回调"""
+    _change_listeners.append(listener)
+
+def remove_change_listener(listener: Callable[[], None]):
+    if listener in _change_listeners:
+        _change_listeners.remove(listener)
+
+def _notify_change():
+    for listener in list(_change_listeners):
+        try:
+            listener()
+        except Exception as e:
+            print(f"⚠️  变更通知回调失败: {e}")
+
+
+# ========== 跨进程变更检测 ==========
+# 多 worker 部署时，其他进程的写入不会触发本进程的变更回调（推送、列表缓存失效等）。
+# PRAGMA data_version 在其他连接提交写入后会变化：后台任务定期检查，变化时调用变更回调。
+# 本进程自己的写入同样会使它变化，回调因此会多执行一次；现有回调都是幂等的，只多一次无效检查。
+DATA_VERSION_POLL_INTERVAL = float(os.getenv("DB_DATA_VERSION_POLL_INTERVAL", "0.25"))  # 秒，0 表示不检查
+
+
+class DataVersionWatcher:
+    """用一条独立连接（data_version 按连接计算，不能用池中轮换的连接）检测数据库文件的变化"""
+
+    def __init__(self):
+        self._conn: Optional[sqlite3.Connection] = None
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.changes = 0
+
+    def poll(self) -> bool:
+        """检查一次，数据库被修改过时通知变更回调并返回 True"""
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(
+                    DATABASE_PATH, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False
+                )
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            changed = self._version is not None and version != self._version
+            self._version = version
+            if changed:
+                self.changes += 1
+        if changed:
+            _notify_change()
+        return changed
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._version = None
+
+
+_data_version_watcher = DataVersionWatcher()
+
+
+def poll_data_version() -> bool:
+    """检测其他进程的写入（由后台任务定期调用）"""
+    return _data_version_watcher.poll()
+
+def close_data_version_watcher():
+    _data_version_watcher.close()
+
+
+@contextmanager
+def get_db_connection(notify: bool = True):
+    """数据库连接上下文管理器（从连接池借出，结束后归还）
+
+    事务提交后如果有数据被修改，通知所有变更回调；notify=False 用于对客户端不可见的写入。
+    """
+    conn = _pool.acquire()
+    discard = False
+    changes_before = conn.total_changes
     try:
         yield conn
-        conn.commit()
+        if conn.in_transaction:
+            # 只读操作不会开启事务，这里只统计写事务的提交耗时
+            started = time.perf_counter()
+            conn.commit()
+            metrics.DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+        if notify and conn.total_changes != changes_before:
+            _notify_change()
     except Exception as e:
-        conn.rollback()
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            # 连接已处于异常状态，丢弃而不是放回池中
+            discard = True
         raise e
     finally:
-        conn.close()
+        _pool.release(conn, discard=discard)
+
+@contextmanager
+def _file_lock(path: str):
+    """跨进程互斥锁（flock），进程异常退出时由操作系统释放"""
+    with open(path, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
 
 def init_database():
-    """初始化数据库，创建 todos 表"""
+    """初始化数据库：按版本执行尚未执行的结构迁移（见 migrations 包）
+
+    多 worker 部署时每个进程启动都会调用；用数据库旁的 .init.lock 文件锁串行执行，
+    避免多个进程同时执行迁移。存量数据的回填不在启动时执行，由 migrate_db.py 在线分批完成。
+    """
+    import migrations
+
+    global FTS_AVAILABLE
+    os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
+    with _file_lock(DATABASE_PATH + ".init.lock"):
+        with get_db_connection() as conn:
+            journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        if journal_mode.lower() != "wal":
+            # 网络文件系统等环境可能无法开启 WAL，此时多个进程的读写会互相阻塞
+            print(f"⚠️  数据库未能开启 WAL（当前 journal_mode={journal_mode}），不建议多 worker 部署")
+        for migration in migrations.apply_schema():
+            print(f"🔧 已执行迁移 v{migration.version:04d}: {migration.description}")
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS todos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                text TEXT NOT NULL,
-                completed BOOLEAN NOT NULL DEFAULT 0,
-                is_new BOOLEAN NOT NULL DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-    print("✅ 数据库初始化成功")
+        FTS_AVAILABLE = has_search_index(conn)
+    print(f"✅ 数据库初始化成功: {DATABASE_PATH}")
+    pending = migrations.pending_backfills()
+    if pending:
+        names = ", ".join(f"v{p['version']:04d}" for p in pending)
+        print(f"⚠️  {len(pending)} 个迁移的数据回填尚未完成（{names}），请运行 python migrate_db.py")
+
+def has_search_index(conn: sqlite3.Connection) -> bool:
+    """数据库中是否已建立全文索引（原文和短词两个索引；SQLite 不支持 FTS5 trigram 时迁移会跳过建立）"""
+    return conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ('todos_fts', 'todos_fts_short')"
+    ).fetchone()[0] == 2
 
 # ========== CRUD 操作 ==========
 
@@ -44,128 +626,695 @@ def get_all_todos() -> List[Dict]:
     """获取所有待办事项"""
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, text, completed, is_new, created_at,
-                   (julianday('now') - julianday(created_at)) * 24 as hours_since_creation
+        cursor.execute(f"""
+            SELECT {_TODO_COLUMNS}
             FROM todos 
             ORDER BY id DESC
         """)
         rows = cursor.fetchall()
-        todos = []
-        for row in rows:
-            todo = dict(row)
-            # Auto-expire 'is_new' flag after 1 hour
-            hours = todo.get('hours_since_creation')
-            if todo.get('is_new') and hours is not None and hours > 1:
-                cursor.execute("UPDATE todos SET is_new = 0 WHERE id = ?", (todo['id'],))
-                todo['is_new'] = False
-            todos.append(todo)
-        conn.commit()
-        return todos
+        return [_todo_from_row(row) for row in rows]
+
+def list_todo_rows(
+    limit: Optional[int] = None,
+    cursor: Optional[int] = None,
+    completed: Optional[bool] = None,
+    created_after: Optional[str] = None,
+    include_archived: bool = False,
+    archived_only: bool = False,
+) -> Tuple[List[tuple], int, Optional[int]]:
+    """按条件分页获取待办事项（按 id 倒序的键集分页），行以元组返回，列顺序见 TODO_FIELDS
+
+    cursor 为上一页最后一条记录的 id；返回 (当前页, 满足筛选条件的总数, 下一页 cursor)。
+    created_after 为 'YYYY-MM-DD HH:MM:SS' 格式的 UTC 时间。
+    include_archived 时合并归档表中的任务（id 不重复，按 id 统一排序分页）；archived_only 时只查归档表。
+    不构造 sqlite3.Row / dict，供列表接口直接序列化。
+    """
+    common_filters = []
+    common_params: List = []
+    if created_after is not None:
+        common_filters.append("created_at > ?")
+        common_params.append(created_after)
+
+    # (表, 列, 筛选条件, 参数)
+    sources = []
+    if not archived_only:
+        filters, params = list(common_filters), list(common_params)
+        if completed is not None:
+            filters.append("completed = ?")
+            params.append(1 if completed else 0)
+        sources.append(("todos", _TODO_COLUMNS, filters, params))
+    if (include_archived or archived_only) and completed is not False:
+        # 归档表中都是已完成的任务
+        sources.append(("todos_archive", _ARCHIVE_COLUMNS, common_filters, common_params))
+    if not sources:
+        return [], 0, None
+
+    selects = []
+    page_params: List = []
+    for table, columns, filters, params in sources:
+        page_filters = list(filters)
+        if cursor is not None:
+            page_filters.append("id < ?")
+        where = f" WHERE {' AND '.join(page_filters)}" if page_filters else ""
+        selects.append(f"SELECT {columns} FROM {table}{where}")
+        page_params.extend(params)
+        if cursor is not None:
+            page_params.append(cursor)
+    sql = " UNION ALL ".join(selects) + " ORDER BY id DESC"
+    if limit is not None:
+        # 多取一条用于判断是否还有下一页
+        sql += " LIMIT ?"
+        page_params.append(limit + 1)
+
+    with get_db_connection() as conn:
+        db_cursor = conn.cursor()
+        db_cursor.row_factory = None
+        db_cursor.execute(sql, page_params)
+        rows = db_cursor.fetchall()
+        total = 0
+        for table, _, filters, params in sources:
+            where = f"WHERE {' AND '.join(filters)}" if filters else ""
+            db_cursor.execute(f"SELECT COUNT(*) FROM {table} {where}", params)
+            total += db_cursor.fetchone()[0]
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1][0]
+    return rows, total, next_cursor
+
+def list_todos(
+    limit: Optional[int] = None,
+    cursor: Optional[int] = None,
+    completed: Optional[bool] = None,
+    created_after: Optional[str] = None,
+    include_archived: bool = False,
+    archived_only: bool = False,
+) -> Tuple[List[Dict], int, Optional[int]]:
+    """同 list_todo_rows()，行以字典返回"""
+    rows, total, next_cursor = list_todo_rows(
+        limit, cursor, completed, created_after, include_archived, archived_only
+    )
+    return [_todo_from_row(row) for row in rows], total, next_cursor
 
 def get_incomplete_todos() -> List[Dict]:
     """获取所有未完成的待办事项（用于 AI 日报）"""
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, text, completed, is_new, created_at 
+        cursor.execute(f"""
+            SELECT {_TODO_COLUMNS}
             FROM todos 
             WHERE completed = 0 
             ORDER BY id DESC
         """)
         rows = cursor.fetchall()
-        return [dict(row) for row in rows]
+        return [_todo_from_row(row) for row in rows]
 
 def get_todo_by_id(todo_id: int) -> Optional[Dict]:
     """根据 ID 获取单个待办事项"""
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, text, completed, is_new, created_at 
+        cursor.execute(f"""
+            SELECT {_TODO_COLUMNS}
             FROM todos 
             WHERE id = ?
         """, (todo_id,))
         row = cursor.fetchone()
-        return dict(row) if row else None
+        return _todo_from_row(row) if row else None
+
+def get_todos_by_ids(ids: List[int]) -> Dict[int, Dict]:
+    """按 ID 批量获取待办事项（主键 IN 查询），返回 {id: todo}；不存在的 ID 不出现在结果中"""
+    with get_db_connection() as conn:
+        return _select_todos(conn.cursor(), ids)
+
+# ========== 单语句变更（基于 RETURNING） ==========
+# SQLite 3.35+ 支持 RETURNING，写入和读回结果只需一条语句；旧版本退回到 "写入 + 查询"。
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# 多行 INSERT 每批的行数（每行两个参数，低于旧版本 SQLite 999 个参数的上限）
+_INSERT_CHUNK_SIZE = 400
+
+def _select_todo(cursor: sqlite3.Cursor, todo_id: int) -> Optional[Dict]:
+    cursor.execute(f"SELECT {_TODO_COLUMNS} FROM todos WHERE id = ?", (todo_id,))
+    row = cursor.fetchone()
+    return _todo_from_row(row) if row else None
+
+def _insert_todos(cursor: sqlite3.Cursor, texts: List[str]) -> List[Dict]:
+    """在当前事务中插入多条待办事项，按插入顺序返回新记录"""
+    created_todos = []
+    if HAS_RETURNING:
+        for start in range(0, len(texts), _INSERT_CHUNK_SIZE):
+            chunk = texts[start:start + _INSERT_CHUNK_SIZE]
+            values = ", ".join(["(?, 0, 1, ?)"] * len(chunk))
+            cursor.execute(
+                f"INSERT INTO todos (text, completed, is_new, short_text) VALUES {values} RETURNING {_TODO_COLUMNS}",
+                [value for text in chunk for value in (text, short_index_text(text))],
+            )
+            # RETURNING 的行顺序未作保证，按自增 id 恢复插入顺序
+            created_todos.extend(sorted((_todo_from_row(row) for row in cursor.fetchall()), key=lambda t: t["id"]))
+    elif texts:
+        first_id = None
+        for text in texts:
+            cursor.execute("""
+                INSERT INTO todos (text, completed, is_new, short_text) 
+                VALUES (?, 0, 1, ?)
+            """, (text, short_index_text(text)))
+            if first_id is None:
+                first_id = cursor.lastrowid
+        # 事务持有写锁，自增 id 不小于第一条的行都是本次插入的；读回以得到与 RETURNING 相同的字段
+        cursor.execute(f"SELECT {_TODO_COLUMNS} FROM todos WHERE id >= ? ORDER BY id", (first_id,))
+        created_todos = [_todo_from_row(row) for row in cursor.fetchall()]
+    return created_todos
+
+def _toggle_todo(cursor: sqlite3.Cursor, todo_id: int) -> Optional[Dict]:
+    cursor.execute(
+        "UPDATE todos SET completed = NOT completed WHERE id = ?"
+        + (f" RETURNING {_TODO_COLUMNS}" if HAS_RETURNING else ""),
+        (todo_id,),
+    )
+    if HAS_RETURNING:
+        rows = cursor.fetchall()
+        return _todo_from_row(rows[0]) if rows else None
+    return _select_todo(cursor, todo_id) if cursor.rowcount else None
+
+def _update_todo_text(cursor: sqlite3.Cursor, todo_id: int, new_text: str) -> Optional[Dict]:
+    cursor.execute(
+        "UPDATE todos SET text = ?, short_text = ? WHERE id = ?"
+        + (f" RETURNING {_TODO_COLUMNS}" if HAS_RETURNING else ""),
+        (new_text, short_index_text(new_text), todo_id),
+    )
+    if HAS_RETURNING:
+        rows = cursor.fetchall()
+        return _todo_from_row(rows[0]) if rows else None
+    return _select_todo(cursor, todo_id) if cursor.rowcount else None
+
+def _delete_todo(cursor: sqlite3.Cursor, todo_id: int) -> bool:
+    cursor.execute("DELETE FROM todos WHERE id = ?", (todo_id,))
+    return cursor.rowcount > 0
 
 def create_todo(text: str) -> Dict:
     """创建新的待办事项"""
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO todos (text, completed, is_new) 
-            VALUES (?, 0, 1)
-        """, (text,))
-        new_id = cursor.lastrowid
-        return {"id": new_id, "text": text, "completed": False, "is_new": True}
+        return _insert_todos(conn.cursor(), [text])[0]
 
 def delete_todo(todo_id: int) -> bool:
     """删除待办事项"""
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM todos WHERE id = ?", (todo_id,))
-        return cursor.rowcount > 0
+        return _delete_todo(conn.cursor(), todo_id)
 
 def toggle_todo(todo_id: int) -> Optional[Dict]:
-    """切换待办事项的完成状态"""
+    """切换待办事项的完成状态（单条 UPDATE ... RETURNING）"""
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        # 先获取当前状态
-        cursor.execute("SELECT completed FROM todos WHERE id = ?", (todo_id,))
-        row = cursor.fetchone()
-        if not row:
-            return None
-        
-        # 切换状态
-        new_status = 0 if row["completed"] else 1
-        cursor.execute("UPDATE todos SET completed = ? WHERE id = ?", (new_status, todo_id))
-        
-        # 返回更新后的数据
-        cursor.execute("""
-            SELECT id, text, completed, is_new, created_at 
-            FROM todos 
-            WHERE id = ?
-        """, (todo_id,))
-        updated_row = cursor.fetchone()
-        return dict(updated_row) if updated_row else None
+        return _toggle_todo(conn.cursor(), todo_id)
 
 def update_todo_text(todo_id: int, new_text: str) -> Optional[Dict]:
     """更新待办事项的文本内容"""
+    with get_db_connection() as conn:
+        return _update_todo_text(conn.cursor(), todo_id, new_text)
+
+def create_bulk_todos(texts: List[str]) -> List[Dict]:
+    """批量创建待办事项（用于 AI 任务分解）"""
+    with get_db_connection() as conn:
+        return _insert_todos(conn.cursor(), texts)
+
+def replace_todo_with_subtasks(todo_id: int, texts: List[str]) -> Optional[List[Dict]]:
+    """在同一事务中删除原任务并插入子任务（用于 AI 任务分解）
+
+    原任务已不存在（例如已被另一次分解请求处理）时不插入任何内容，返回 None。
+    """
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("UPDATE todos SET text = ? WHERE id = ?", (new_text, todo_id))
-        
-        if cursor.rowcount == 0:
+        if not _delete_todo(cursor, todo_id):
             return None
+        return _insert_todos(cursor, texts)
+
+def replace_todos_with_subtasks(replacements: Dict[int, List[str]]) -> Dict[int, Optional[List[Dict]]]:
+    """在同一事务中分解多个任务：删除各原任务并插入各自的子任务
+
+    已不存在的原任务被跳过（对应值为 None），不影响其他任务；
+    子任务按 replacements 的顺序一次性插入。
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        ids = list(replacements)
+        existing = _existing_ids(cursor, ids)
+        kept = [todo_id for todo_id in ids if todo_id in existing]
+        cursor.executemany("DELETE FROM todos WHERE id = ?", [(todo_id,) for todo_id in kept])
+        inserted = _insert_todos(cursor, [text for todo_id in kept for text in replacements[todo_id]])
         
-        # 返回更新后的数据
-        cursor.execute("""
-            SELECT id, text, completed, is_new, created_at 
-            FROM todos 
-            WHERE id = ?
-        """, (todo_id,))
-        updated_row = cursor.fetchone()
-        return dict(updated_row) if updated_row else None
+        results: Dict[int, Optional[List[Dict]]] = {todo_id: None for todo_id in ids}
+        position = 0
+        for todo_id in kept:
+            count = len(replacements[todo_id])
+            results[todo_id] = inserted[position:position + count]
+            position += count
+        return results
 
-def create_bulk_todos(texts: List[str]) -> List[Dict]:
-    """批量创建待办事项（用于 AI 任务分解）"""
-    created_todos = []
+# ========== 合并提交（group commit） ==========
+# 高频的单条变更可以由写入队列合并到同一个事务中提交（见 db_executor 的 DB_GROUP_COMMIT）。
+
+def _create_todo(cursor: sqlite3.Cursor, text: str) -> Dict:
+    return _insert_todos(cursor, [text])[0]
+
+# 可合并提交的公开写函数 -> 在调用方事务中执行的版本
+GROUPABLE_WRITES: Dict[Callable, Callable] = {
+    create_todo: _create_todo,
+    delete_todo: _delete_todo,
+    toggle_todo: _toggle_todo,
+    update_todo_text: _update_todo_text,
+}
+
+def apply_write_group(ops: List[Tuple[Callable, tuple]]) -> List[Tuple[bool, Any]]:
+    """在一个事务中按顺序执行多个单条变更，只提交一次
+
+    ops 为 [(在事务中执行的函数, 参数)]，返回与之对应的 [(是否成功, 结果或异常)]。
+    每个操作在自己的 SAVEPOINT 中执行：失败只回滚该操作，不影响同一批的其他操作。
+    提交失败时抛出异常，整批均未生效。
+    """
+    results: List[Tuple[bool, Any]] = []
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        for text in texts:
-            cursor.execute("""
-                INSERT INTO todos (text, completed, is_new) 
-                VALUES (?, 0, 1)
-            """, (text,))
-            new_id = cursor.lastrowid
-            created_todos.append({"id": new_id, "text": text, "completed": False, "is_new": True})
-    return created_todos
+        # 先显式开启事务并取得写锁；否则最外层 SAVEPOINT 的 RELEASE 会直接提交
+        cursor.execute("BEGIN IMMEDIATE")
+        for fn, args in ops:
+            cursor.execute("SAVEPOINT write_op")
+            try:
+                results.append((True, fn(cursor, *args)))
+            except Exception as e:
+                cursor.execute("ROLLBACK TO write_op")
+                results.append((False, e))
+            cursor.execute("RELEASE write_op")
+    return results
+
+# ========== 批量变更 ==========
+
+BATCH_OPS = ("toggle", "set_completed", "update_text", "delete", "create")
+
+class BatchAborted(Exception):
+    """原子批量操作中有条目失败，整个事务已回滚"""
+
+    def __init__(self, results: List[Dict]):
+        super().__init__("批量操作中有条目失败，已全部回滚")
+        self.results = results
+
+def _existing_ids(cursor: sqlite3.Cursor, ids: List[int]) -> set:
+    """返回 ids 中当前存在的 id（在当前事务内查询）"""
+    found = set()
+    unique_ids = list(dict.fromkeys(ids))
+    for start in range(0, len(unique_ids), _INSERT_CHUNK_SIZE):
+        chunk = unique_ids[start:start + _INSERT_CHUNK_SIZE]
+        placeholders = ", ".join("?" * len(chunk))
+        cursor.execute(f"SELECT id FROM todos WHERE id IN ({placeholders})", chunk)
+        found.update(row[0] for row in cursor.fetchall())
+    return found
+
+def _select_todos(cursor: sqlite3.Cursor, ids: List[int]) -> Dict[int, Dict]:
+    todos = {}
+    unique_ids = list(dict.fromkeys(ids))
+    for start in range(0, len(unique_ids), _INSERT_CHUNK_SIZE):
+        chunk = unique_ids[start:start + _INSERT_CHUNK_SIZE]
+        placeholders = ", ".join("?" * len(chunk))
+        cursor.execute(f"SELECT {_TODO_COLUMNS} FROM todos WHERE id IN ({placeholders})", chunk)
+        todos.update((row["id"], _todo_from_row(row)) for row in cursor.fetchall())
+    return todos
+
+def _batch_result(index: int, op: str, ok: bool, **fields) -> Dict:
+    result = {"index": index, "op": op, "ok": ok}
+    result.update(fields)
+    return result
+
+def _run_batch_group(cursor: sqlite3.Cursor, op: str, items: List[Tuple[int, Dict]], results: List):
+    """执行一段连续的同类操作"""
+    if op == "create":
+        created = _insert_todos(cursor, [item["text"] for _, item in items])
+        for (index, _), todo in zip(items, created):
+            results[index] = _batch_result(index, op, True, id=todo["id"], todo=todo)
+
+    elif op == "set_completed":
+        existing = _existing_ids(cursor, [item["id"] for _, item in items])
+        cursor.executemany(
+            "UPDATE todos SET completed = ? WHERE id = ?",
+            [(1 if item["completed"] else 0, item["id"]) for _, item in items if item["id"] in existing],
+        )
+        todos = _select_todos(cursor, list(existing))
+        for index, item in items:
+            if item["id"] in existing:
+                results[index] = _batch_result(index, op, True, id=item["id"], todo=todos.get(item["id"]))
+            else:
+                results[index] = _batch_result(index, op, False, id=item["id"], error="not_found")
+
+    elif op == "delete":
+        existing = _existing_ids(cursor, [item["id"] for _, item in items])
+        deleted = set()
+        for index, item in items:
+            # 同一批中重复删除同一 id 时，只有第一次成功
+            if item["id"] in existing and item["id"] not in deleted:
+                deleted.add(item["id"])
+                results[index] = _batch_result(index, op, True, id=item["id"])
+            else:
+                results[index] = _batch_result(index, op, False, id=item["id"], error="not_found")
+        cursor.executemany("DELETE FROM todos WHERE id = ?", [(todo_id,) for todo_id in deleted])
+
+    else:
+        # toggle / update_text 需要逐条返回更新后的数据，逐条执行（同一事务内）
+        for index, item in items:
+            if op == "toggle":
+                todo = _toggle_todo(cursor, item["id"])
+            else:
+                todo = _update_todo_text(cursor, item["id"], item["text"])
+            if todo is None:
+                results[index] = _batch_result(index, op, False, id=item["id"], error="not_found")
+            else:
+                results[index] = _batch_result(index, op, True, id=item["id"], todo=todo)
+
+def apply_batch(operations: List[Dict], atomic: bool = False) -> List[Dict]:
+    """在一个事务中按顺序执行多个变更操作，返回逐条结果
+
+    每个操作为 {"op": ..., "id": ..., "text": ..., "completed": ...}，op 取值见 BATCH_OPS。
+    连续的同类操作合并执行（executemany / 多行 INSERT）。
+    atomic=True 时只要有一条失败就回滚全部并抛出 BatchAborted。
+    """
+    results: List[Optional[Dict]] = [None] * len(operations)
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        start = 0
+        while start < len(operations):
+            op = operations[start]["op"]
+            end = start
+            while end < len(operations) and operations[end]["op"] == op:
+                end += 1
+            _run_batch_group(cursor, op, [(i, operations[i]) for i in range(start, end)], results)
+            start = end
+        if atomic and not all(r["ok"] for r in results):
+            raise BatchAborted(results)
+    return results
 
 def delete_all_todos() -> int:
-    """删除所有待办事项，返回删除的数量"""
+    """删除所有待办事项（含归档），返回删除的数量
+
+    每张表一条 DELETE，直接使用影响行数，不先 COUNT。归档表没有触发器，
+    整表 DELETE 走 SQLite 的清空优化，不逐行处理。
+    """
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM todos")
-        count = cursor.fetchone()[0]
         cursor.execute("DELETE FROM todos")
-        return count
+        deleted = cursor.rowcount
+        cursor.execute("DELETE FROM todos_archive")
+        archived = cursor.rowcount
+        if archived:
+            # 归档表的变化不经过版本号触发器，手动推进版本号使列表 ETag 失效
+            cursor.execute("UPDATE sync_state SET version = version + 1 WHERE id = 1")
+        return deleted + archived
+
+def expire_new_flags() -> int:
+    """用一条语句清除所有已过期的 NEW 标记，返回更新的行数（由后台任务定期调用）
+
+    is_new 在读取时计算，过期标记本来就显示为 False，清除它不推进版本号、不通知变更回调，
+    列表缓存和 ETag 保持有效。
+    """
+    with get_db_connection(notify=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            UPDATE todos SET is_new = 0
+            WHERE is_new = 1 AND created_at <= datetime('now', '-{NEW_FLAG_HOURS} hours')
+        """)
+        return cursor.rowcount
+
+def get_todo_stats() -> Dict:
+    """获取任务数量统计（读取计数表，O(1)）"""
+    with get_db_connection() as conn:
+        row = conn.execute("SELECT total, completed FROM todo_stats WHERE id = 1").fetchone()
+    total, completed = (row["total"], row["completed"]) if row else (0, 0)
+    return {"total": total, "completed": completed, "incomplete": total - completed}
+
+def check_connection() -> bool:
+    """数据库可用性检查"""
+    with get_db_connection() as conn:
+        conn.execute("SELECT 1").fetchone()
+    return True
+
+# ========== 增量同步 ==========
+
+TOMBSTONE_RETENTION_DAYS = float(os.getenv("TOMBSTONE_RETENTION_DAYS", "7"))
+
+def get_list_etag_state() -> Tuple[int, int]:
+    """返回 (当前版本号, 当前带 NEW 标记的任务数)，用于生成列表 ETag
+
+    is_new 在读取时计算，会随时间变化而版本号不变，因此 ETag 还需包含 NEW 任务数。
+    """
+    with get_db_connection() as conn:
+        row = conn.execute(f"""
+            SELECT (SELECT version FROM sync_state WHERE id = 1),
+                   (SELECT COUNT(*) FROM todos WHERE {_IS_NEW_SQL})
+        """).fetchone()
+    return row[0] or 0, row[1]
+
+def get_sync_version() -> int:
+    """当前数据版本号"""
+    with get_db_connection() as conn:
+        row = conn.execute("SELECT version FROM sync_state WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+def get_change_log(since: int, limit: int = 1000) -> Dict:
+    """按版本号顺序返回 since 之后的变更条目
+
+    每个条目为 {"type": "upsert", "version", "todo"} 或 {"type": "delete", "version", "id"}。
+    since 早于已清理的墓碑时返回 reset=True，客户端需要重新拉取完整列表。
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT version, tombstone_floor FROM sync_state WHERE id = 1")
+        state = cursor.fetchone()
+        current_version, tombstone_floor = (state[0], state[1]) if state else (0, 0)
+        if since < tombstone_floor:
+            return {"version": current_version, "reset": True, "items": [],
+                    "has_more": False, "next_since": current_version}
+
+        cursor.execute(f"""
+            SELECT {_TODO_COLUMNS}, version FROM todos
+            WHERE version > ? ORDER BY version LIMIT ?
+        """, (since, limit + 1))
+        # version 只放在条目上，任务记录只取 TODO_FIELDS 对应的列
+        items = [{"type": "upsert", "version": row["version"], "todo": _todo_from_row(row[:len(TODO_FIELDS)])}
+                 for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT id, version FROM todo_tombstones
+            WHERE version > ? ORDER BY version LIMIT ?
+        """, (since, limit + 1))
+        items.extend({"type": "delete", "version": row["version"], "id": row["id"]} for row in cursor.fetchall())
+
+    items.sort(key=lambda item: item["version"])
+    has_more = len(items) > limit
+    items = items[:limit]
+    return {
+        "version": current_version,
+        "reset": False,
+        "items": items,
+        "has_more": has_more,
+        "next_since": items[-1]["version"] if has_more else current_version,
+    }
+
+def get_changes(since: int, limit: int = 1000) -> Dict:
+    """获取版本号大于 since 的变更（新增 / 修改的记录和被删除的 id），按版本号排序"""
+    log = get_change_log(since, limit)
+    return {
+        "version": log["version"],
+        "reset": log["reset"],
+        "changes": [item["todo"] for item in log["items"] if item["type"] == "upsert"],
+        "deleted": [item["id"] for item in log["items"] if item["type"] == "delete"],
+        "has_more": log["has_more"],
+        "next_since": log["next_since"],
+    }
+
+def prune_tombstones(retention_days: float = TOMBSTONE_RETENTION_DAYS) -> int:
+    """清理过期的删除墓碑，并记录已清理到的版本号"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT MAX(version) FROM todo_tombstones WHERE deleted_at <= datetime('now', ?)",
+            (f"-{retention_days} days",),
+        )
+        floor = cursor.fetchone()[0]
+        if floor is None:
+            return 0
+        cursor.execute("DELETE FROM todo_tombstones WHERE version <= ?", (floor,))
+        pruned = cursor.rowcount
+        cursor.execute(
+            "UPDATE sync_state SET tombstone_floor = MAX(tombstone_floor, ?) WHERE id = 1", (floor,)
+        )
+        return pruned
+
+# ========== 归档 ==========
+# 完成超过 ARCHIVE_AFTER_DAYS 天（按 updated_at，即最后一次修改的时间）的任务由后台任务分批移入
+# todos_archive，todos 表、统计计数、全文索引和日报只包含活跃任务。归档对客户端等同于删除
+# （写入删除墓碑、推送 delete 事件），归档后的任务只读，可通过归档列表或 include_archived 查询。
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "30"))   # 0 表示不归档
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))    # 每个事务最多移动的行数
+
+def archive_completed_todos(older_than_days: float = ARCHIVE_AFTER_DAYS,
+                            batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """把一批完成较久的任务移入归档表（一个短事务），返回移动的行数；返回值小于 batch_size 表示已无候选"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        # 先取写锁再挑选候选行，多个 worker 同时归档时不会重复移动
+        cursor.execute("BEGIN IMMEDIATE")
+        # 不指定索引时查询计划会选 (completed, id) 索引再排序，需要扫描全部已完成任务
+        cursor.execute(
+            """
+            SELECT id FROM todos INDEXED BY idx_todos_completed_updated_at
+            WHERE completed = 1 AND updated_at <= datetime('now', ?)
+            ORDER BY updated_at LIMIT ?
+            """,
+            (f"-{older_than_days} days", batch_size),
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return 0
+        placeholders = ",".join("?" * len(ids))
+        cursor.execute(
+            f"""
+            INSERT OR REPLACE INTO todos_archive (id, text, created_at, completed_at)
+            SELECT id, text, created_at, updated_at FROM todos WHERE id IN ({placeholders})
+            """,
+            ids,
+        )
+        cursor.execute(f"DELETE FROM todos WHERE id IN ({placeholders})", ids)
+        return cursor.rowcount
+
+def get_archive_stats() -> Dict:
+    """归档表的行数和最近一次归档时间"""
+    with get_db_connection() as conn:
+        row = conn.execute("SELECT COUNT(*), MAX(archived_at) FROM todos_archive").fetchone()
+    return {"archived": row[0], "last_archived_at": row[1]}
+
+# ========== 全文搜索 ==========
+# 两个 FTS5 trigram 索引（trigram 分词可直接匹配中文子串）：
+#   todos_fts        原文，匹配不少于 3 个字符的关键词（短语查询）
+#   todos_fts_short  short_text 列（= short_index_text(原文)，应用写入），匹配 1～2 个字符的关键词
+#                    （每个关键词恰好一个 trigram）。short_text 为 NULL 的行（存量数据、其他程序直接写入的行）
+#                    不在索引中，由后台任务 fill_short_index() 分批补上；存在这样的行时短关键词改用 LIKE 过滤
+# 每个关键词先在索引中探测命中数（最多读 SEARCH_RANK_LIMIT + 1 个 rowid），再选择驱动查询的关键词：
+#   - 有低频词（命中不超过 SEARCH_RANK_LIMIT）时，由命中最少的关键词所在索引中的低频词驱动，
+#     候选不超过 SEARCH_RANK_LIMIT 条，按 bm25 相关度排序；
+#   - 全部是高频词时，按 id 倒序遍历索引，取满一页即停止。bm25 需要读取短语的全部命中，
+#     高频词（如 10 万条命中）不计算相关度。
+# 不参与驱动的关键词在候选行上用 LIKE 过滤。
+
+# trigram 索引只能匹配不少于 3 个字符的子串
+_TRIGRAM_MIN_CHARS = 3
+# 命中数不超过该值的关键词为低频词，结果按相关度排序
+SEARCH_RANK_LIMIT = int(os.getenv("SEARCH_RANK_LIMIT", "1000"))
+# 短词索引中字符之间的分隔符（控制字符，正常文本中不会出现）
+_SHORT_INDEX_SEP = "\x1f"
+SHORT_INDEX_BATCH_SIZE = int(os.getenv("SHORT_INDEX_BATCH_SIZE", "1000"))   # 每个事务最多补上的行数
+
+def short_index_text(text: Optional[str]) -> Optional[str]:
+    """短词索引的内容：每个字符两侧加分隔符，如 "ab" -> "|a|b|"（| 代表分隔符）
+
+    单个字符 a 对应 trigram "|a|"，两个字符 ab 对应 "a|b"。写入 text 时同时写入 short_text 列。
+    """
+    if text is None:
+        return None
+    sep = _SHORT_INDEX_SEP
+    return sep + sep.join(text.replace(sep, "")) + sep
+
+def fill_short_index(batch_size: int = SHORT_INDEX_BATCH_SIZE) -> int:
+    """为一批 short_text 为 NULL 的任务补上短词索引（一个短事务），返回处理的行数；小于 batch_size 表示已全部补上
+
+    只写 short_text，不推进版本号、不通知变更回调。
+    """
+    with get_db_connection(notify=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        rows = cursor.execute(
+            "SELECT id, text FROM todos INDEXED BY idx_todos_short_text_pending WHERE short_text IS NULL LIMIT ?",
+            (batch_size,),
+        ).fetchall()
+        cursor.executemany(
+            "UPDATE todos SET short_text = ? WHERE id = ?",
+            [(short_index_text(text), todo_id) for todo_id, text in rows],
+        )
+        return len(rows)
+
+def _short_index_ready(cursor: sqlite3.Cursor) -> bool:
+    """短词索引是否包含全部任务（部分索引只含 short_text 为 NULL 的行，查询很快）"""
+    return cursor.execute(
+        "SELECT 1 FROM todos INDEXED BY idx_todos_short_text_pending WHERE short_text IS NULL LIMIT 1"
+    ).fetchone() is None
+
+def _term_match(term: str) -> Tuple[str, str]:
+    """关键词对应的 (索引表, MATCH 表达式)；作为短语查询，避免用户输入被解析为 FTS5 语法"""
+    if len(term) >= _TRIGRAM_MIN_CHARS:
+        table, needle = "todos_fts", term
+    else:
+        sep = _SHORT_INDEX_SEP
+        table, needle = "todos_fts_short", (sep + term + sep if len(term) == 1 else sep.join(term))
+    return table, '"' + needle.replace('"', '""') + '"'
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+def search_todos(query: str, limit: int = 20, offset: int = 0) -> Tuple[List[Dict], bool]:
+    """按关键词搜索待办事项，返回 (结果, 是否还有更多)
+
+    空白分隔的多个关键词需同时命中。含低频词时按 bm25 相关度排序（score 越大越相关），
+    全部是高频词时按 id 倒序（score 为 None）。查询路径见本节开头的说明。
+    没有可用的全文索引时（包括短词索引尚未补全时只有短关键词）按 id 倒序用 LIKE 扫描，取满一页即停止。
+    """
+    terms = list(dict.fromkeys(query.split()))
+    if not terms:
+        return [], False
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        indexed = terms if FTS_AVAILABLE else []
+        if any(len(t) < _TRIGRAM_MIN_CHARS for t in indexed) and not _short_index_ready(cursor):
+            indexed = [t for t in indexed if len(t) >= _TRIGRAM_MIN_CHARS]
+        if not indexed:
+            like_sql = " AND ".join(["text LIKE ? ESCAPE '\\'"] * len(terms))
+            cursor.execute(f"""
+                SELECT {_TODO_COLUMNS}, NULL AS score FROM todos
+                WHERE {like_sql}
+                ORDER BY id DESC
+                LIMIT ? OFFSET ?
+            """, [*(_like_pattern(t) for t in terms), limit + 1, offset])
+            rows = [_todo_from_row(row) for row in cursor.fetchall()]
+            return rows[:limit], len(rows) > limit
+
+        # (命中数, 关键词, 索引表, MATCH 表达式)
+        probes = []
+        for term in indexed:
+            table, match = _term_match(term)
+            cursor.execute(
+                f"SELECT COUNT(*) FROM (SELECT 1 FROM {table} WHERE {table} MATCH ? LIMIT ?)",
+                (match, SEARCH_RANK_LIMIT + 1),
+            )
+            hits = cursor.fetchone()[0]
+            if hits == 0:
+                return [], False
+            probes.append((hits, term, table, match))
+
+        rarest = min(probes, key=lambda p: p[0])
+        ranked = rarest[0] <= SEARCH_RANK_LIMIT
+        table = rarest[2]
+        # 同一索引中的关键词由 FTS5 直接求交集；有低频词时只用低频词，候选集和 bm25 的统计范围都很小
+        driving = [p for p in probes if p[2] == table and (not ranked or p[0] <= SEARCH_RANK_LIMIT)]
+        filtering = [p[1] for p in probes if p not in driving] + [t for t in terms if t not in indexed]
+        match = " AND ".join(p[3] for p in driving)
+        where = " AND ".join(["todos.text LIKE ? ESCAPE '\\'"] * len(filtering))
+        if ranked:
+            hits_sql = f"SELECT rowid AS hit_id, rank AS hit_rank FROM {table} WHERE {table} MATCH ?"
+            score, order = "-hits.hit_rank", "hits.hit_rank"
+        else:
+            hits_sql = f"SELECT rowid AS hit_id FROM {table} WHERE {table} MATCH ?"
+            score, order = "NULL", "hits.hit_id DESC"
+        cursor.execute(f"""
+            SELECT {_TODO_COLUMNS}, {score} AS score
+            FROM ({hits_sql}) AS hits JOIN todos ON todos.id = hits.hit_id
+            {"WHERE " + where if where else ""}
+            ORDER BY {order}
+            LIMIT ? OFFSET ?
+        """, [match, *(_like_pattern(t) for t in filtering), limit + 1, offset])
+        rows = [_todo_from_row(row) for row in cursor.fetchall()]
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,274 @@
+"""
+异步数据访问层
+将同步的 database.* 调用放到专用线程池中执行，避免阻塞 asyncio 事件循环。
+读写分两条通道：读通道多线程并发，写通道单线程串行（SQLite 同一时刻只有一个写者），
+因此读请求永远不会排在写请求后面。
+可选的合并提交模式下，写请求先进入队列，由单个写入任务把短时间内到达的单条变更合并到一个事务中提交。
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+import database
+import metrics
+
+READ_WORKERS = int(os.getenv("DB_READ_WORKERS", "4"))
+WRITE_WORKERS = 1
+# 每条通道允许排队（含执行中）的最大任务数，超出后调用方在事件循环中等待
+READ_QUEUE_LIMIT = int(os.getenv("DB_READ_QUEUE_LIMIT", "256"))
+WRITE_QUEUE_LIMIT = int(os.getenv("DB_WRITE_QUEUE_LIMIT", "256"))
+
+# 合并提交：DB_GROUP_COMMIT=1 时开启
+GROUP_COMMIT = os.getenv("DB_GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("DB_GROUP_COMMIT_WINDOW_MS", "2"))   # 收到第一个写请求后最多再等待多久
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("DB_GROUP_COMMIT_MAX_BATCH", "256"))    # 每个事务最多合并的写请求数
+GROUP_COMMIT_QUEUE_LIMIT = int(os.getenv("DB_GROUP_COMMIT_QUEUE_LIMIT", "4096"))
+
+
+def _call_timed(fn: Callable, name: str, lane: str, *args, **kwargs) -> Any:
+    """执行 fn，按 (函数名, 通道) 记录耗时和错误"""
+    started = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    except Exception:
+        metrics.DB_CALL_ERRORS.inc(name, lane)
+        raise
+    finally:
+        metrics.DB_CALL_SECONDS.observe(time.perf_counter() - started, name, lane)
+
+
+class _Lane:
+    """一条有界的执行通道"""
+
+    def __init__(self, name: str, workers: int, queue_limit: int):
+        self.name = name
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+        self._completed = 0
+        self._failed = 0
+        self._busy_time = 0.0
+
+    def _ensure_started(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix=f"db-{self.name}"
+            )
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.queue_limit)
+
+    def _call(self, fn: Callable, submitted: float, *args, **kwargs) -> Any:
+        """在工作线程中执行，记录排队时间和执行耗时"""
+        metrics.DB_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - submitted, self.name)
+        return _call_timed(fn, getattr(fn, "__name__", "unknown"), self.name, *args, **kwargs)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        self._ensure_started()
+        submitted = time.perf_counter()
+        async with self._slots:
+            self._pending += 1
+            started = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            try:
+                result = await loop.run_in_executor(
+                    self._executor, partial(self._call, fn, submitted, *args, **kwargs)
+                )
+            except Exception:
+                self._failed += 1
+                raise
+            else:
+                self._completed += 1
+                return result
+            finally:
+                self._pending -= 1
+                self._busy_time += time.perf_counter() - started
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._slots = None
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "pending": self._pending,
+            "completed_total": self._completed,
+            "failed_total": self._failed,
+            "busy_time_total_ms": round(self._busy_time * 1000, 3),
+        }
+
+
+class _GroupCommitWriter:
+    """写入队列：单个任务按到达顺序取出写请求，连续的单条变更合并到一个事务提交
+
+    可合并的写函数见 database.GROUPABLE_WRITES；其他写函数（批量操作、后台清理等）单独执行，
+    并作为分隔点：它之前的请求先提交，之后的请求后执行。所有写请求按入队顺序生效，
+    因此同一客户端先后发出的写请求不会乱序。
+    """
+
+    def __init__(self, lane: _Lane, window_ms: float, max_batch: int, queue_limit: int):
+        self.lane = lane
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.queue_limit = queue_limit
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.batches = 0
+        self.grouped_ops = 0
+        self.largest_batch = 0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue(self.queue_limit)
+            self._task = loop.create_task(self._run())
+
+    async def submit(self, fn: Callable, args: tuple, kwargs: Dict) -> Any:
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((fn, args, kwargs, future))
+        return await future
+
+    async def _collect(self) -> List[tuple]:
+        """取出第一个请求后，在窗口期内继续收集，直到达到批次上限"""
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                group: List[tuple] = []
+                for item in batch:
+                    fn, args, kwargs, future = item
+                    in_transaction = database.GROUPABLE_WRITES.get(fn)
+                    if in_transaction is not None and not kwargs:
+                        # 每个操作仍按原函数名记录耗时和错误，与单独执行时的指标一致
+                        timed = partial(_call_timed, in_transaction, fn.__name__, self.lane.name)
+                        group.append((timed, args, future))
+                        continue
+                    await self._flush_group(group)
+                    group = []
+                    await self._run_single(fn, args, kwargs, future)
+                await self._flush_group(group)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush_group(self, group: List[tuple]):
+        if not group:
+            return
+        self.batches += 1
+        self.grouped_ops += len(group)
+        self.largest_batch = max(self.largest_batch, len(group))
+        metrics.DB_GROUP_COMMIT_BATCH_SIZE.observe(len(group))
+        try:
+            results = await self.lane.run(
+                database.apply_write_group, [(fn, args) for fn, args, _ in group]
+            )
+        except Exception as e:
+            # 整个事务失败（如提交失败），同批请求全部返回该错误
+            for _, _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), (ok, value) in zip(group, results):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    async def _run_single(self, fn: Callable, args: tuple, kwargs: Dict, future: asyncio.Future):
+        try:
+            result = await self.lane.run(fn, *args, **kwargs)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+    async def flush(self):
+        """等待队列中的写请求全部完成后停止写入任务"""
+        if self._task is None or self._loop is not asyncio.get_running_loop():
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": GROUP_COMMIT,
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "batches_total": self.batches,
+            "grouped_ops_total": self.grouped_ops,
+            "avg_batch_size": round(self.grouped_ops / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+        }
+
+
+_read_lane = _Lane("read", READ_WORKERS, READ_QUEUE_LIMIT)
+_write_lane = _Lane("write", WRITE_WORKERS, WRITE_QUEUE_LIMIT)
+_writer = _GroupCommitWriter(
+    _write_lane, GROUP_COMMIT_WINDOW_MS, GROUP_COMMIT_MAX_BATCH, GROUP_COMMIT_QUEUE_LIMIT
+)
+
+
+async def run_read(fn: Callable, *args, **kwargs) -> Any:
+    """在读通道中执行只读的数据库函数"""
+    return await _read_lane.run(fn, *args, **kwargs)
+
+
+async def run_write(fn: Callable, *args, **kwargs) -> Any:
+    """在写通道中执行会修改数据的数据库函数（开启合并提交时经写入队列执行）"""
+    if GROUP_COMMIT:
+        return await _writer.submit(fn, args, kwargs)
+    return await _write_lane.run(fn, *args, **kwargs)
+
+
+async def flush_writes():
+    """等待写入队列清空（应用关闭时、关闭线程池之前调用）"""
+    await _writer.flush()
+
+
+def shutdown():
+    """等待执行中的任务结束并关闭线程池（应用关闭时调用）"""
+    _read_lane.shutdown()
+    _write_lane.shutdown()
+
+
+def get_executor_stats() -> Dict:
+    """读写通道运行状态"""
+    return {"read": _read_lane.stats(), "write": _write_lane.stats(), "group_commit": _writer.stats()}
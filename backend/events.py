@@ -0,0 +1,167 @@
+"""
+变更推送中心（进程内 pub/sub）
+database 在写事务提交后发出通知；推送中心合并通知，按版本号拉取一次增量变更，
+再分发给所有订阅者。每个订阅者有独立的有界队列，消费过慢的订阅者会被断开，
+由客户端携带最后的版本号重连并补齐。
+"""
+
+import asyncio
+import os
+from typing import Dict, List, Optional, Set
+
+import database
+import db_executor
+
+EVENTS_MAX_SUBSCRIBERS = int(os.getenv("EVENTS_MAX_SUBSCRIBERS", "1000"))
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+# 每次从数据库拉取的最大变更条数
+EVENTS_FETCH_LIMIT = 500
+
+
+class HubFull(Exception):
+    """订阅者数量已达上限"""
+
+
+class Subscription:
+    """单个订阅者：有界事件队列，溢出后标记为需要重新同步"""
+
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+        self._wakeup = asyncio.Event()
+
+    def offer(self, event: Dict) -> bool:
+        if self.overflowed:
+            return False
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self._wakeup.set()
+            return False
+
+    async def get(self, timeout: float) -> Optional[Dict]:
+        """取下一个事件；超时返回 None；已溢出且队列取空时抛出 OverflowError"""
+        if not self.queue.empty():
+            return self.queue.get_nowait()
+        if self.overflowed:
+            raise OverflowError("订阅者消费过慢，事件已丢弃")
+        getter = asyncio.ensure_future(self.queue.get())
+        waker = asyncio.ensure_future(self._wakeup.wait())
+        try:
+            done, _ = await asyncio.wait({getter, waker}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waker.cancel()
+            if not getter.done():
+                getter.cancel()
+        if getter in done:
+            return getter.result()
+        if self.overflowed:
+            raise OverflowError("订阅者消费过慢，事件已丢弃")
+        return None
+
+
+class ChangeHub:
+    def __init__(self, max_subscribers: int = EVENTS_MAX_SUBSCRIBERS, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self._subscribers: Set[Subscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._dirty: Optional[asyncio.Event] = None
+        self.version = 0
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    # ----- 生命周期 -----
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._dirty = asyncio.Event()
+        self.version = await db_executor.run_read(database.get_sync_version)
+        database.add_change_listener(self.notify)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        database.remove_change_listener(self.notify)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._loop = None
+
+    # ----- 发布 -----
+
+    def notify(self):
+        """数据变更回调（可在任意线程调用）"""
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._dirty.set)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    async def _run(self):
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            try:
+                await self._dispatch()
+            except Exception as e:
+                print(f"⚠️  推送变更失败: {e}")
+
+    async def _dispatch(self):
+        """拉取自上次分发以来的全部变更并广播（多次写入只拉取一次）"""
+        while True:
+            result = await db_executor.run_read(database.get_change_log, self.version, EVENTS_FETCH_LIMIT)
+            if result["reset"]:
+                self._broadcast([{"type": "reset", "version": result["version"]}])
+                self.version = result["version"]
+                return
+            self._broadcast(result["items"])
+            self.version = result["next_since"]
+            if not result["has_more"]:
+                return
+
+    def _broadcast(self, events: List[Dict]):
+        if not events:
+            return
+        for subscription in list(self._subscribers):
+            for event in events:
+                if not subscription.offer(event):
+                    # 慢消费者：断开，客户端重连后从最后的版本号补齐
+                    self._subscribers.discard(subscription)
+                    self.dropped_subscribers += 1
+                    break
+        self.published += len(events)
+
+    # ----- 订阅 -----
+
+    def subscribe(self) -> Subscription:
+        if len(self._subscribers) >= self.max_subscribers:
+            raise HubFull(f"订阅者已达上限（{self.max_subscribers}）")
+        subscription = Subscription(self.queue_size)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    def stats(self) -> Dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "max_subscribers": self.max_subscribers,
+            "queue_size": self.queue_size,
+            "version": self.version,
+            "published_total": self.published,
+            "dropped_subscribers_total": self.dropped_subscribers,
+        }
+
+
+hub = ChangeHub()
@@ -0,0 +1,51 @@
+"""
+列表响应的快速 JSON 编码
+数据库返回的元组行直接编码为 JSON 字节，跳过 pydantic 校验和 jsonable_encoder。
+安装了 orjson 时使用 orjson；否则使用手写编码（字符串转义使用标准库 json 的 C 实现）。
+"""
+
+from json.encoder import encode_basestring
+from typing import Iterable, Sequence
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+_BOOL = ("false", "true")
+
+
+def _encode_todos_builtin(rows: Iterable[Sequence]) -> bytes:
+    parts = []
+    for todo_id, text, completed, is_new, created_at in rows:
+        created = "null" if created_at is None else encode_basestring(created_at)
+        parts.append(
+            f'{{"id":{int(todo_id)},"text":{encode_basestring(text)},'
+            f'"completed":{_BOOL[bool(completed)]},"is_new":{_BOOL[bool(is_new)]},'
+            f'"created_at":{created}}}'
+        )
+    return ("[" + ",".join(parts) + "]").encode("utf-8")
+
+
+def _encode_todos_orjson(rows: Iterable[Sequence]) -> bytes:
+    return orjson.dumps([
+        {
+            "id": todo_id,
+            "text": text,
+            "completed": bool(completed),
+            "is_new": bool(is_new),
+            "created_at": created_at,
+        }
+        for todo_id, text, completed, is_new, created_at in rows
+    ])
+
+
+def encode_todos(rows: Iterable[Sequence]) -> bytes:
+    """把 (id, text, completed, is_new, created_at) 元组行编码为 JSON 数组（UTF-8 字节）
+
+    completed / is_new 输出为布尔值，与 Todo 模型的序列化结果一致。
+    """
+    if ORJSON_AVAILABLE:
+        return _encode_todos_orjson(rows)
+    return _encode_todos_builtin(rows)
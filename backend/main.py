@@ -3,22 +3,142 @@
 支持 SQLite 持久化、完整 CRUD 操作、AI 日报生成、AI 任务分解
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+import hashlib
 import httpx
+import json
 import os
-from typing import List
+import re
+import time
+from typing import Dict, List, Literal, Optional
 import asyncio
-from datetime import datetime
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 import database
+import db_executor
+import ai_client
+import report_prompt
+import streaming
+import events
+import metrics
+import fast_json
+from cache import (
+    SingleFlight, TTLCache,
+    breakdown_cache, breakdown_cache_key, breakdown_flight,
+    report_cache, report_cache_key,
+    LIST_CACHE_MAX_BYTES, list_cache, list_flight,
+)
 
 # ========== 初始化 ==========
-app = FastAPI(title="Robust AI Todo API")
-
-# 初始化 SQLite 数据库
-database.init_database()
+# 数据库在 lifespan 启动阶段初始化（而不是导入时），多 worker 部署时由文件锁保证串行执行
+
+# NEW 标记清理任务的执行间隔（秒）
+NEW_FLAG_SWEEP_INTERVAL = float(os.getenv("NEW_FLAG_SWEEP_INTERVAL", "60"))
+# 删除墓碑清理任务的执行间隔（秒）
+TOMBSTONE_PRUNE_INTERVAL = float(os.getenv("TOMBSTONE_PRUNE_INTERVAL", "3600"))
+# 归档任务的执行间隔（秒）及批次之间的暂停（秒）
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "3600"))
+ARCHIVE_BATCH_PAUSE = float(os.getenv("ARCHIVE_BATCH_PAUSE", "0.05"))
+# 补建短词索引时批次之间的暂停（秒）
+SHORT_INDEX_BATCH_PAUSE = float(os.getenv("SHORT_INDEX_BATCH_PAUSE", "0.05"))
+
+async def archive_completed() -> int:
+    """分批把完成较久的任务移入归档表；每批一个短事务，批次之间让出写通道给其他写请求"""
+    total = 0
+    while True:
+        moved = await db_executor.run_write(
+            database.archive_completed_todos, database.ARCHIVE_AFTER_DAYS, database.ARCHIVE_BATCH_SIZE
+        )
+        total += moved
+        if moved < database.ARCHIVE_BATCH_SIZE:
+            return total
+        await asyncio.sleep(ARCHIVE_BATCH_PAUSE)
+
+async def fill_short_index() -> int:
+    """分批为存量数据和其他程序直接写入的任务补建短词索引；每批一个短事务，批次之间让出写通道"""
+    total = 0
+    while True:
+        filled = await db_executor.run_write(database.fill_short_index, database.SHORT_INDEX_BATCH_SIZE)
+        total += filled
+        if filled < database.SHORT_INDEX_BATCH_SIZE:
+            return total
+        await asyncio.sleep(SHORT_INDEX_BATCH_PAUSE)
+
+async def sweep_new_flags():
+    """后台任务：定期用一条 UPDATE 批量清除过期的 NEW 标记，补建短词索引，清理过期的删除墓碑，并归档完成较久的任务"""
+    loop = asyncio.get_running_loop()
+    next_prune = loop.time()
+    next_archive = loop.time()
+    while True:
+        try:
+            await db_executor.run_write(database.expire_new_flags)
+        except Exception as e:
+            print(f"⚠️  清理 NEW 标记失败: {e}")
+        if database.FTS_AVAILABLE:
+            try:
+                filled = await fill_short_index()
+                if filled:
+                    print(f"🔎 已为 {filled} 个任务补建短词索引")
+            except Exception as e:
+                print(f"⚠️  补建短词索引失败: {e}")
+        if loop.time() >= next_prune:
+            next_prune = loop.time() + TOMBSTONE_PRUNE_INTERVAL
+            try:
+                await db_executor.run_write(database.prune_tombstones)
+            except Exception as e:
+                print(f"⚠️  清理删除墓碑失败: {e}")
+        if database.ARCHIVE_AFTER_DAYS > 0 and loop.time() >= next_archive:
+            next_archive = loop.time() + ARCHIVE_INTERVAL
+            try:
+                archived = await archive_completed()
+                if archived:
+                    print(f"🗄️  已归档 {archived} 个已完成任务")
+            except Exception as e:
+                print(f"⚠️  归档已完成任务失败: {e}")
+        await asyncio.sleep(NEW_FLAG_SWEEP_INTERVAL)
+
+async def watch_external_changes():
+    """后台任务：检测其他 worker 进程的写入，触发变更推送和列表缓存失效"""
+    while True:
+        try:
+            await db_executor.run_read(database.poll_data_version)
+        except Exception as e:
+            print(f"⚠️  检查数据库变更失败: {e}")
+        await asyncio.sleep(database.DATA_VERSION_POLL_INTERVAL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时准备资源，关闭时释放"""
+    database.init_database()
+    await ai_client.start()
+    await events.hub.start()
+    # 有写入时清空已编码的列表响应
+    database.add_change_listener(list_cache.clear)
+    tasks = [asyncio.create_task(sweep_new_flags())]
+    if database.DATA_VERSION_POLL_INTERVAL > 0:
+        tasks.append(asyncio.create_task(watch_external_changes()))
+    yield
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    # 合并提交模式下先写完队列中的请求，再停止变更推送
+    await db_executor.flush_writes()
+    database.remove_change_listener(list_cache.clear)
+    await events.hub.stop()
+    await ai_client.close()
+    report_cache.close()
+    db_executor.shutdown()
+    database.close_data_version_watcher()
+    database.close_pool()
+
+app = FastAPI(title="Robust AI Todo API", lifespan=lifespan)
 
 # CORS 配置（允许前端跨域请求）
 app.add_middleware(
@@ -27,8 +147,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor", "ETag"],
 )
 
+# 请求耗时指标（最外层，包含 CORS 处理时间）
+app.add_middleware(metrics.MetricsMiddleware)
+
 # ========== 数据模型 ==========
 class TodoCreate(BaseModel):
     text: str
@@ -41,6 +165,11 @@ class Todo(BaseModel):
     text: str
     completed: bool
 
+class TodoListItem(Todo):
+    """列表项（仅用于接口文档：列表响应由 fast_json 直接编码）"""
+    is_new: bool
+    created_at: Optional[str] = None
+
 # ========== 辅助函数 ==========
 def get_ai_api_key() -> str:
     """从环境变量获取 AI API Key"""
@@ -52,23 +181,396 @@ def get_ai_api_key() -> str:
         )
     return api_key
 
+def upstream_unavailable(e: ai_client.UpstreamUnavailable) -> HTTPException:
+    """熔断或排队过多：返回 503，并告知客户端多久后重试"""
+    headers = {"Retry-After": str(max(1, round(e.retry_after)))} if e.retry_after else None
+    return HTTPException(status_code=503, detail=str(e), headers=headers)
+
 # ========== 阶段 1: 基础 CRUD API 端点 ==========
 
 @app.get("/")
 async def root():
-    """健康检查端点"""
-    todos = database.get_all_todos()
+    """健康检查端点（任务数来自计数表，不扫描 todos 表）"""
+    stats = await db_executor.run_read(database.get_todo_stats)
     return {
         "message": "Robust AI Todo API is running with SQLite", 
-        "todos_count": len(todos),
+        "todos_count": stats["total"],
         "database": "SQLite (todos.db)"
     }
 
-@app.get("/todos", response_model=List[Todo])
-async def get_todos():
-    """获取所有待办事项（从 SQLite）"""
-    todos = database.get_all_todos()
-    return todos
+@app.get("/health")
+async def health():
+    """存活检查：不访问数据库和上游，供负载均衡器高频调用"""
+    return {"status": "ok"}
+
+@app.get("/stats")
+async def get_stats():
+    """任务数量统计：总数 / 已完成 / 未完成"""
+    return await db_executor.run_read(database.get_todo_stats)
+
+# ========== 就绪检查 ==========
+# 检查结果缓存一段时间，避免高频探测压到数据库和 AI 上游
+READINESS_CACHE_TTL = float(os.getenv("READINESS_CACHE_TTL", "10"))
+UPSTREAM_CHECK_TIMEOUT = float(os.getenv("UPSTREAM_CHECK_TIMEOUT", "3"))
+readiness_cache = TTLCache(8, READINESS_CACHE_TTL)
+readiness_flight = SingleFlight()
+
+async def check_database() -> Dict:
+    try:
+        await db_executor.run_read(database.check_connection)
+        return {"ok": True}
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+
+async def check_upstream() -> Dict:
+    if not os.getenv("AI_API_KEY", ""):
+        return {"ok": False, "error": "AI_API_KEY 未配置"}
+    try:
+        response = await ai_client.get_client().get(
+            "/models",
+            headers=ai_client.auth_headers(os.getenv("AI_API_KEY", "")),
+            timeout=UPSTREAM_CHECK_TIMEOUT,
+        )
+        # 能收到非 5xx 响应即说明上游可达
+        return {"ok": response.status_code < 500, "status_code": response.status_code}
+    except Exception as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+async def cached_check(name: str, check) -> Dict:
+    result = readiness_cache.get(name)
+    if result is None:
+        result = await readiness_flight.do(name, check)
+        readiness_cache.set(name, result)
+    return result
+
+@app.get("/ready")
+async def ready(response: Response):
+    """就绪检查：数据库不可用时返回 503；AI 上游不可用时标记为 degraded"""
+    db_status, upstream_status = await asyncio.gather(
+        cached_check("database", check_database),
+        cached_check("upstream", check_upstream),
+    )
+    if not db_status["ok"]:
+        status = "unavailable"
+        response.status_code = 503
+    elif not upstream_status["ok"]:
+        status = "degraded"
+    else:
+        status = "ready"
+    return {"status": status, "database": db_status, "upstream": upstream_status}
+
+@app.get("/admin/pools")
+async def get_pool_stats():
+    """连接池运行状态（用于监控）"""
+    return {
+        "database": database.get_pool_stats(),
+        "db_executor": db_executor.get_executor_stats(),
+        "ai_http": ai_client.get_pool_stats(),
+        "ai_governor": ai_client.get_governor_stats(),
+        "events": events.hub.stats(),
+    }
+
+@app.get("/admin/caches")
+async def get_cache_stats():
+    """缓存命中统计（用于监控）"""
+    return {
+        "report": report_cache.stats(),
+        "breakdown": {**breakdown_cache.stats(), **breakdown_flight.stats()},
+        "list": {**list_cache.stats(), **list_flight.stats()},
+    }
+
+@app.get("/admin/queries")
+async def get_query_profile(limit: int = Query(20, ge=1, le=200)):
+    """慢查询分析：按总耗时排序的语句模板（含查询计划）和最近的慢查询；需以 DB_PROFILE=1 启动"""
+    return database.get_query_profile(limit)
+
+@app.delete("/admin/queries")
+async def reset_query_profile():
+    """清空慢查询分析数据"""
+    database.reset_query_profile()
+    return {"message": "已清空"}
+
+@app.get("/admin/archive")
+async def get_archive_stats():
+    """归档状态：归档表行数、最近归档时间和归档配置"""
+    stats = await db_executor.run_read(database.get_archive_stats)
+    return {**stats, "after_days": database.ARCHIVE_AFTER_DAYS, "batch_size": database.ARCHIVE_BATCH_SIZE}
+
+@app.post("/admin/archive")
+async def run_archive():
+    """立即执行一轮归档（不等待后台任务）"""
+    if database.ARCHIVE_AFTER_DAYS <= 0:
+        raise HTTPException(status_code=400, detail="归档未开启（ARCHIVE_AFTER_DAYS=0）")
+    archived = await archive_completed()
+    return {"message": f"已归档 {archived} 个已完成任务", "count": archived}
+
+# ========== 运行指标 ==========
+# 已有组件的 stats() 在抓取时读取，不在热路径上额外计数
+
+CACHES = {
+    "report": report_cache.stats,
+    "breakdown": breakdown_cache.stats,
+    "readiness": readiness_cache.stats,
+    "list": list_cache.stats,
+}
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+@metrics.counter_callback("todo_cache_hits_total", "缓存命中次数（日报缓存含磁盘命中）", ("cache",))
+def _cache_hits():
+    for name, stats in CACHES.items():
+        stats = stats()
+        yield (name,), stats["hits"] + stats.get("disk_hits", 0)
+
+@metrics.counter_callback("todo_cache_misses_total", "缓存未命中次数", ("cache",))
+def _cache_misses():
+    return [((name,), stats()["misses"]) for name, stats in CACHES.items()]
+
+@metrics.gauge("todo_cache_hit_ratio", "缓存命中率", ("cache",))
+def _cache_hit_ratio():
+    return [((name,), stats()["hit_ratio"]) for name, stats in CACHES.items()]
+
+@metrics.gauge("todo_cache_entries", "缓存中的条目数", ("cache",))
+def _cache_entries():
+    return [((name,), stats()["size"]) for name, stats in CACHES.items()]
+
+@metrics.gauge("todo_db_pool_connections", "数据库连接池中的连接数", ("state",))
+def _db_pool_connections():
+    stats = database.get_pool_stats()
+    return [(("in_use",), stats["in_use"]), (("idle",), stats["idle"]), (("created",), stats["created"])]
+
+@metrics.gauge("todo_db_executor_pending", "读 / 写通道中排队和执行中的调用数", ("lane",))
+def _db_executor_pending():
+    return [((lane,), stats["pending"]) for lane, stats in db_executor.get_executor_stats().items()]
+
+@metrics.gauge("todo_ai_queue_depth", "等待 AI 并发名额的请求数")
+def _ai_queue_depth():
+    return [((), ai_client.get_governor_stats()["queued"])]
+
+@metrics.gauge("todo_ai_active_requests", "正在进行的上游 AI 请求数", ("endpoint",))
+def _ai_active_requests():
+    endpoints = ai_client.get_governor_stats()["endpoints"]
+    return [((name,), stats["active"]) for name, stats in endpoints.items()]
+
+@metrics.gauge("todo_ai_breaker_state", "熔断器状态（0 闭合，1 半开，2 断开）")
+def _ai_breaker_state():
+    return [((), BREAKER_STATES[ai_client.get_governor_stats()["breaker"]["state"]])]
+
+@metrics.counter_callback("todo_ai_retries_total", "上游 AI 请求重试次数")
+def _ai_retries():
+    return [((), ai_client.get_governor_stats()["retries_total"])]
+
+@metrics.counter_callback("todo_ai_rejected_total", "因熔断或排队过多被拒绝的 AI 请求数", ("reason",))
+def _ai_rejected():
+    stats = ai_client.get_governor_stats()
+    return [(("breaker_open",), stats["breaker"]["rejected_total"]), (("queue_full",), stats["queue_rejected_total"])]
+
+@metrics.counter_callback("todo_ai_hedges_total", "对冲请求次数", ("result",))
+def _ai_hedges():
+    stats = ai_client.get_governor_stats()
+    return [(("launched",), stats["hedges_launched_total"]), (("won",), stats["hedges_won_total"])]
+
+@metrics.gauge("todo_events_subscribers", "变更推送的订阅连接数")
+def _events_subscribers():
+    return [((), events.hub.stats()["subscribers"])]
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 文本格式的运行指标"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# 单页最多返回的条数
+MAX_PAGE_SIZE = 1000
+
+def list_etag(version: int, new_count: int, query: str) -> str:
+    """列表的强 ETag：数据版本、NEW 标记数量和查询参数都相同时内容必然相同"""
+    digest = hashlib.sha1(f"{version}:{new_count}:{query}".encode("utf-8")).hexdigest()[:20]
+    return f'"{digest}"'
+
+def build_list_body(
+    limit: Optional[int],
+    cursor: Optional[int],
+    completed: Optional[bool],
+    created_after: Optional[str],
+    include_archived: bool = False,
+    archived_only: bool = False,
+):
+    """查询并编码一页列表（在读通道线程中执行，大列表的编码不占用事件循环）"""
+    rows, total, next_cursor = database.list_todo_rows(
+        limit, cursor, completed, created_after, include_archived, archived_only
+    )
+    return fast_json.encode_todos(rows), total, next_cursor
+
+async def list_response(
+    request: Request,
+    limit: Optional[int],
+    cursor: Optional[int],
+    completed: Optional[bool],
+    created_after: Optional[datetime],
+    include_archived: bool = False,
+    archived_only: bool = False,
+) -> Response:
+    """列表接口的公共实现：ETag / 304、已编码响应缓存与分页响应头"""
+    # 先取版本再读列表：期间若有写入，ETag 只会偏旧（下次多拉一次），不会掩盖新数据
+    version, new_count = await db_executor.run_read(database.get_list_etag_state)
+    etag = list_etag(
+        version, new_count, request.url.path + str(sorted(request.query_params.multi_items()))
+    )
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    
+    cached = list_cache.get(etag)
+    if cached is None:
+        created_after_str = None
+        if created_after is not None:
+            # created_at 以 UTC 存储，未带时区的时间按 UTC 处理
+            if created_after.tzinfo is not None:
+                created_after = created_after.astimezone(timezone.utc)
+            created_after_str = created_after.strftime("%Y-%m-%d %H:%M:%S")
+
+        # 写入后的第一波并发请求只查询、编码一次
+        cached = await list_flight.do(etag, lambda: db_executor.run_read(
+            build_list_body, limit, cursor, completed, created_after_str, include_archived, archived_only
+        ))
+        if len(cached[0]) <= LIST_CACHE_MAX_BYTES:
+            list_cache.set(etag, cached)
+
+    body, total, next_cursor = cached
+    headers["X-Total-Count"] = str(total)
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = str(next_cursor)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/todos", response_model=List[TodoListItem])
+async def get_todos(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="每页条数，不传则返回全部"),
+    cursor: Optional[int] = Query(None, description="上一页响应头 X-Next-Cursor 的值"),
+    completed: Optional[bool] = Query(None, description="按完成状态筛选"),
+    created_after: Optional[datetime] = Query(None, description="只返回此时间之后创建的任务"),
+    include_archived: bool = Query(False, description="同时返回已归档的任务"),
+):
+    """获取待办事项（从 SQLite），支持键集分页与筛选
+
+    响应头 X-Total-Count 为满足筛选条件的总数；还有下一页时返回 X-Next-Cursor。
+    支持 ETag / If-None-Match：数据未变化时返回 304，不再查询和序列化列表。
+    响应体由元组行直接编码为 JSON，并按 ETag 缓存到下一次写入。
+    """
+    return await list_response(request, limit, cursor, completed, created_after, include_archived)
+
+@app.get("/todos/archive", response_model=List[TodoListItem])
+async def get_archived_todos(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="每页条数，不传则返回全部"),
+    cursor: Optional[int] = Query(None, description="上一页响应头 X-Next-Cursor 的值"),
+    created_after: Optional[datetime] = Query(None, description="只返回此时间之后创建的任务"),
+):
+    """已归档的任务（只读），分页方式与 GET /todos 相同"""
+    return await list_response(request, limit, cursor, None, created_after, archived_only=True)
+
+@app.get("/todos/changes")
+async def get_todo_changes(
+    since: int = Query(0, ge=0, description="客户端已同步到的版本号"),
+    limit: int = Query(1000, ge=1, le=MAX_PAGE_SIZE),
+):
+    """增量同步：返回 since 之后新增 / 修改的任务和被删除的 id
+
+    has_more 为 true 时用 next_since 继续拉取；reset 为 true 时需重新获取完整列表。
+    """
+    return await db_executor.run_read(database.get_changes, since, limit)
+
+@app.get("/todos/search")
+async def search_todos(
+    q: str = Query(..., min_length=1, max_length=200, description="搜索关键词，空格分隔的多个词需同时命中"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """全文搜索待办事项（SQLite FTS5 trigram 索引）
+
+    含低频词时按相关度排序，结果带 score；全部是高频词时按 id 倒序（最新的在前），score 为 null。
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="搜索关键词不能为空")
+    results, has_more = await db_executor.run_read(database.search_todos, q, limit, offset)
+    return {
+        "query": q,
+        "results": results,
+        "has_more": has_more,
+        "next_offset": offset + len(results) if has_more else None,
+    }
+
+# ========== 变更推送 ==========
+
+# 无事件时发送心跳注释的间隔（秒），防止代理断开空闲连接
+EVENTS_HEARTBEAT_INTERVAL = float(os.getenv("EVENTS_HEARTBEAT_INTERVAL", "15"))
+
+def change_event_frame(event: Dict) -> str:
+    return streaming.sse_frame(
+        json.dumps(event, ensure_ascii=False), event_id=event["version"], event=event["type"]
+    )
+
+@app.get("/todos/events")
+async def todo_events(request: Request, since: Optional[int] = Query(None, ge=0)):
+    """变更推送（SSE）：事件 id 为数据版本号
+
+    重连时浏览器自动携带 Last-Event-ID（或显式传 ?since=），服务端先补发错过的变更再推送实时事件。
+    事件类型：ready（当前版本）、upsert、delete、reset（需重新拉取完整列表）、
+    resync（消费过慢被断开，需带最后的版本号重连）。
+    upsert 事件的 todo 与 GET /todos 的列表项格式相同（completed / is_new 为布尔值），可直接合并。
+    """
+    last_event_id = request.headers.get("last-event-id", "")
+    if since is None and last_event_id.isdigit():
+        since = int(last_event_id)
+    
+    # 先订阅再补发，保证补发和实时事件之间没有遗漏（重复的按版本号跳过）
+    try:
+        subscription = events.hub.subscribe()
+    except events.HubFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    async def event_stream():
+        try:
+            if since is None:
+                sent_version = await db_executor.run_read(database.get_sync_version)
+                yield streaming.sse_frame(
+                    json.dumps({"version": sent_version}), event_id=sent_version, event="ready"
+                )
+            else:
+                sent_version = since
+                while True:
+                    log = await db_executor.run_read(database.get_change_log, sent_version, MAX_PAGE_SIZE)
+                    if log["reset"]:
+                        sent_version = log["version"]
+                        yield change_event_frame({"type": "reset", "version": sent_version})
+                        break
+                    for item in log["items"]:
+                        yield change_event_frame(item)
+                    sent_version = log["next_since"]
+                    if not log["has_more"]:
+                        break
+            
+            while True:
+                try:
+                    event = await subscription.get(timeout=EVENTS_HEARTBEAT_INTERVAL)
+                except OverflowError:
+                    yield change_event_frame({"type": "resync", "version": sent_version})
+                    return
+                if event is None:
+                    yield ": ping\n\n"
+                    continue
+                if event["type"] != "reset" and event["version"] <= sent_version:
+                    continue
+                sent_version = event["version"]
+                yield change_event_frame(event)
+        finally:
+            events.hub.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.post("/todos", response_model=Todo)
 async def create_todo(todo: TodoCreate):
@@ -76,13 +578,13 @@ async def create_todo(todo: TodoCreate):
     if not todo.text.strip():
         raise HTTPException(status_code=400, detail="待办事项内容不能为空")
     
-    new_todo = database.create_todo(todo.text.strip())
+    new_todo = await db_executor.run_write(database.create_todo, todo.text.strip())
     return new_todo
 
 @app.delete("/todos/{todo_id}")
 async def delete_todo(todo_id: int):
     """删除待办事项（从 SQLite）"""
-    success = database.delete_todo(todo_id)
+    success = await db_executor.run_write(database.delete_todo, todo_id)
     if not success:
         raise HTTPException(status_code=404, detail="待办事项不存在")
     return {"message": "删除成功", "id": todo_id}
@@ -90,13 +592,13 @@ async def delete_todo(todo_id: int):
 @app.delete("/todos")
 async def delete_all_todos():
     """删除所有待办事项"""
-    count = database.delete_all_todos()
+    count = await db_executor.run_write(database.delete_all_todos)
     return {"message": f"成功删除 {count} 个待办事项", "count": count}
 
 @app.put("/todos/{todo_id}/toggle", response_model=Todo)
 async def toggle_todo(todo_id: int):
     """切换待办事项的完成状态（在 SQLite 中）"""
-    updated_todo = database.toggle_todo(todo_id)
+    updated_todo = await db_executor.run_write(database.toggle_todo, todo_id)
     if not updated_todo:
         raise HTTPException(status_code=404, detail="待办事项不存在")
     return updated_todo
@@ -109,17 +611,99 @@ async def update_todo_text(todo_id: int, todo_update: TodoUpdate):
     if not todo_update.text.strip():
         raise HTTPException(status_code=400, detail="待办事项内容不能为空")
     
-    updated_todo = database.update_todo_text(todo_id, todo_update.text.strip())
+    updated_todo = await db_executor.run_write(database.update_todo_text, todo_id, todo_update.text.strip())
     if not updated_todo:
         raise HTTPException(status_code=404, detail="待办事项不存在")
     return updated_todo
 
+# ========== 批量操作 ==========
+
+# 单次批量请求允许的最大操作数
+BATCH_MAX_OPERATIONS = int(os.getenv("BATCH_MAX_OPERATIONS", "5000"))
+
+class BatchOperation(BaseModel):
+    """批量操作中的单个条目"""
+    op: Literal["toggle", "set_completed", "update_text", "delete", "create"]
+    id: Optional[int] = None
+    text: Optional[str] = None
+    completed: Optional[bool] = None
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation]
+    atomic: bool = False  # True 时任一条目失败则全部回滚
+
+class BulkCreateRequest(BaseModel):
+    texts: List[str]
+
+def validate_batch_operation(index: int, operation: BatchOperation) -> Dict:
+    """检查条目所需字段，返回传给数据库层的 dict"""
+    item = operation.model_dump()
+    if operation.op != "create" and operation.id is None:
+        raise HTTPException(status_code=400, detail=f"第 {index} 个操作缺少 id")
+    if operation.op in ("create", "update_text"):
+        text = (operation.text or "").strip()
+        if not text:
+            raise HTTPException(status_code=400, detail=f"第 {index} 个操作的待办事项内容不能为空")
+        item["text"] = text
+    if operation.op == "set_completed" and operation.completed is None:
+        raise HTTPException(status_code=400, detail=f"第 {index} 个操作缺少 completed")
+    return item
+
+@app.patch("/todos/batch")
+async def batch_update_todos(batch: BatchRequest):
+    """在一个事务中执行多个操作（切换 / 设置完成状态 / 编辑 / 删除 / 创建），返回逐条结果"""
+    if not batch.operations:
+        raise HTTPException(status_code=400, detail="操作列表不能为空")
+    if len(batch.operations) > BATCH_MAX_OPERATIONS:
+        raise HTTPException(status_code=413, detail=f"单次最多 {BATCH_MAX_OPERATIONS} 个操作")
+    
+    operations = [validate_batch_operation(i, op) for i, op in enumerate(batch.operations)]
+    try:
+        results = await db_executor.run_write(database.apply_batch, operations, batch.atomic)
+    except database.BatchAborted as e:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "部分操作失败，已全部回滚", "results": e.results}
+        )
+    
+    succeeded = sum(1 for r in results if r["ok"])
+    return {"results": results, "succeeded": succeeded, "failed": len(results) - succeeded}
+
+@app.post("/todos/bulk", response_model=List[Todo])
+async def bulk_create_todos(request: BulkCreateRequest):
+    """一次创建多个待办事项（单个事务）"""
+    texts = [text.strip() for text in request.texts]
+    if not texts or not all(texts):
+        raise HTTPException(status_code=400, detail="待办事项内容不能为空")
+    if len(texts) > BATCH_MAX_OPERATIONS:
+        raise HTTPException(status_code=413, detail=f"单次最多 {BATCH_MAX_OPERATIONS} 个操作")
+    
+    return await db_executor.run_write(database.create_bulk_todos, texts)
+
 # ========== 阶段 5: AI 功能 - 生成工作日报 ==========
 
 class ReportRequest(BaseModel):
     """日报生成请求"""
     language: str = "simplified"  # simplified 或 traditional
 
+async def prepare_report_messages(
+    api_key: str,
+    language: str,
+    date_str: str,
+    completed_texts: List[str],
+    incomplete_texts: List[str],
+) -> List[Dict[str, str]]:
+    """日报提示词；超出 token 预算时先并发生成分组摘要（map-reduce）"""
+    async def summarize(messages):
+        return await ai_client.chat_completion(
+            api_key, messages, endpoint="report_summary",
+            max_tokens=report_prompt.REPORT_SUMMARY_MAX_TOKENS,
+        )
+    
+    return await report_prompt.prepare_report_messages(
+        language, date_str, completed_texts, incomplete_texts, summarize
+    )
+
 @app.post("/generate-report")
 async def generate_report(request: ReportRequest = None):
     """生成工作日报（包含已完成和未完成的任务）"""
@@ -129,28 +713,15 @@ async def generate_report(request: ReportRequest = None):
     language = request.language if request else "simplified"
     
     # 从 SQLite 获取所有任务
-    all_todos = database.get_all_todos()
+    all_todos = await db_executor.run_read(database.get_all_todos)
     
     if not all_todos:
         no_tasks_msg = "當前沒有任何待辦事項。" if language == "traditional" else "当前没有任何待办事项。"
         return {"report": no_tasks_msg}
     
     # 分类任务
-    completed_todos = [t for t in all_todos if t['completed']]
-    incomplete_todos = [t for t in all_todos if not t['completed']]
-    
-    # 构建任务列表文本
-    completed_text = "\n".join([
-        f"{i + 1}. {todo['text']}"
-        for i, todo in enumerate(completed_todos)
-    ]) if completed_todos else ("無" if language == "traditional" else "无")
-    
-    incomplete_text = "\n".join([
-        f"{i + 1}. {todo['text']}"
-        for i, todo in enumerate(incomplete_todos)
-    ]) if incomplete_todos else ("無" if language == "traditional" else "无")
-    
-    total_count = len(all_todos)
+    completed_texts = [t['text'] for t in all_todos if t['completed']]
+    incomplete_texts = [t['text'] for t in all_todos if not t['completed']]
     
     # 获取当前日期
     today = datetime.now()
@@ -159,131 +730,23 @@ async def generate_report(request: ReportRequest = None):
     else:
         date_str = today.strftime("%Y年%m月%d日")  # 简体格式
     
-    # 根据语言选择提示词
-    if language == "traditional":
-        system_prompt = f"""你是一個專業的工作總結助手。請生成一份清晰的純文字工作日報（不要使用Markdown格式，不要使用**符號）。
-
-要求：
-1. 完整列出所有已完成和未完成的任務
-2. 總結部分需要詳細（至少{max(3, total_count // 2)}句話），要涵蓋主要工作內容、進展情況、重點任務等
-3. 使用純文字格式，不要使用任何Markdown標記（如 ** ）
-4. **必須使用繁體中文輸出所有內容**（如果任務列表中包含簡體中文，請將其轉換為繁體中文）
-5. 使用換行和縮進來組織內容"""
-        user_prompt = f"""請為以下任務生成詳細的工作日報（純文字格式，使用繁體中文，不要使用**等Markdown符號）：
-
-**重要提示：無論任務列表中的文字是簡體還是繁體，最終輸出的日報必須全部使用繁體中文。請將所有簡體中文內容轉換為繁體中文。**
-
-
-已完成的任務（共{len(completed_todos)}項）：
-{completed_text}
-
-未完成的任務（共{len(incomplete_todos)}項）：
-{incomplete_text}
-
-請按照以下格式生成日報（使用純文字，繁體中文，不要Markdown格式）：
-
-工作日報
-
-日期：{date_str}
-
-一、已完成任務（{len(completed_todos)}項）
-
-{completed_text if completed_todos else '暫無已完成任務'}
-
-二、未完成任務（{len(incomplete_todos)}項）
-
-{incomplete_text if incomplete_todos else '暫無未完成任務'}
-
-三、工作總結
-
-[詳細總結，至少包含{max(3, total_count // 2)}個方面：
-- 今天完成的主要工作及成果
-- 當前進行中的重點任務
-- 遇到的問題或挑戰
-- 下一步工作計劃
-等]
-
-四、備註
-
-[特別事項或需要關注的內容]
-
-注意：請使用繁體中文純文字格式輸出，不要使用任何Markdown標記符號。"""
-    else:
-        system_prompt = f"""你是一个专业的工作总结助手。请生成一份清晰的纯文本工作日报（不要使用Markdown格式，不要使用**符号）。
-
-要求：
-1. 完整列出所有已完成和未完成的任务
-2. 总结部分需要详细（至少{max(3, total_count // 2)}句话），要涵盖主要工作内容、进展情况、重点任务等
-3. 使用纯文本格式，不要使用任何Markdown标记（如 ** ）
-4. 使用简体中文
-5. 使用换行和缩进来组织内容"""
-        user_prompt = f"""请为以下任务生成详细的工作日报（纯文本格式，使用简体中文，不要使用**等Markdown符号）：
-
-已完成的任务（共{len(completed_todos)}项）：
-{completed_text}
-
-未完成的任务（共{len(incomplete_todos)}项）：
-{incomplete_text}
-
-请按照以下格式生成日报（使用纯文本，简体中文，不要Markdown格式）：
-
-工作日报
-
-日期：{date_str}
-
-一、已完成任务（{len(completed_todos)}项）
-
-{completed_text if completed_todos else '暂无已完成任务'}
-
-二、未完成任务（{len(incomplete_todos)}项）
-
-{incomplete_text if incomplete_todos else '暂无未完成任务'}
-
-三、工作总结
-
-[详细总结，至少包含{max(3, total_count // 2)}个方面：
-- 今天完成的主要工作及成果
-- 当前进行中的重点任务
-- 遇到的问题或挑战
-- 下一步工作计划
-等]
-
-四、备注
-
-[特别事项或需要关注的内容]
-
-注意：请使用简体中文纯文本格式输出，不要使用任何Markdown标记符号。"""
-    
-    # 改进的 AI 提示词 - 生成纯文本格式（非 Markdown）
-    request_body = {
-        "model": "gpt-3.5-turbo",
-        "messages": [
-            {
-                "role": "system",
-                "content": system_prompt
-            },
-            {
-                "role": "user",
-                "content": user_prompt
-            }
-        ]
-    }
+    # 任务集合未变化时直接返回缓存的日报
+    cache_key = report_cache_key(
+        language, date_str, completed_texts, incomplete_texts, ai_client.AI_MODEL
+    )
+    cached_report = await report_cache.get(cache_key)
+    if cached_report is not None:
+        return {"report": cached_report}
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                "https://api.zhizengzeng.com/v1/chat/completions",
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {api_key}"
-                },
-                json=request_body
-            )
-            response.raise_for_status()
-            data = response.json()
-            report_text = data["choices"][0]["message"]["content"]
-            return {"report": report_text}
+        # 任务较多时先分组摘要，再由摘要生成日报
+        messages = await prepare_report_messages(api_key, language, date_str, completed_texts, incomplete_texts)
+        report_text = await ai_client.chat_completion(api_key, messages, endpoint="report")
+        await report_cache.set(cache_key, report_text)
+        return {"report": report_text}
     
+    except ai_client.UpstreamUnavailable as e:
+        raise upstream_unavailable(e)
     except httpx.HTTPStatusError as e:
         raise HTTPException(
             status_code=e.response.status_code,
@@ -292,16 +755,36 @@ async def generate_report(request: ReportRequest = None):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成日报失败: {str(e)}")
 
+def report_stream_response(chunks, use_sse: bool) -> StreamingResponse:
+    """构造日报流式响应：默认纯文本，use_sse 时使用 SSE 帧格式"""
+    if use_sse:
+        return StreamingResponse(
+            streaming.sse_events(chunks),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    return StreamingResponse(chunks, media_type="text/plain; charset=utf-8")
+
 @app.post("/generate-report-stream")
-async def generate_report_stream(request: ReportRequest = None):
-    """生成工作日报（流式输出）- 前端逐字显示"""
+async def generate_report_stream(
+    http_request: Request,
+    request: ReportRequest = None,
+    stream_format: Optional[str] = Query(None, alias="format", pattern="^(text|sse)$"),
+):
+    """生成工作日报（流式输出）- 前端逐字显示
+
+    ?format=sse 或 Accept: text/event-stream 时以 SSE 帧输出（带事件 id）。
+    """
     api_key = get_ai_api_key()
+    if stream_format is None:
+        stream_format = "sse" if "text/event-stream" in http_request.headers.get("accept", "") else "text"
+    use_sse = stream_format == "sse"
     
     # 默认使用简体中文
     language = request.language if request else "simplified"
     
     # 从 SQLite 获取所有任务
-    all_todos = database.get_all_todos()
+    all_todos = await db_executor.run_read(database.get_all_todos)
     
     no_tasks_msg = "當前沒有任何待辦事項。" if language == "traditional" else "当前没有任何待办事项。"
     
@@ -310,27 +793,11 @@ async def generate_report_stream(request: ReportRequest = None):
         async def simple_generator():
             yield no_tasks_msg
         
-        return StreamingResponse(
-            simple_generator(),
-            media_type="text/plain; charset=utf-8"
-        )
+        return report_stream_response(simple_generator(), use_sse)
     
     # 分类任务
-    completed_todos = [t for t in all_todos if t['completed']]
-    incomplete_todos = [t for t in all_todos if not t['completed']]
-    
-    # 构建任务列表文本
-    completed_text = "\n".join([
-        f"{i + 1}. {todo['text']}"
-        for i, todo in enumerate(completed_todos)
-    ]) if completed_todos else ("無" if language == "traditional" else "无")
-    
-    incomplete_text = "\n".join([
-        f"{i + 1}. {todo['text']}"
-        for i, todo in enumerate(incomplete_todos)
-    ]) if incomplete_todos else ("無" if language == "traditional" else "无")
-    
-    total_count = len(all_todos)
+    completed_texts = [t['text'] for t in all_todos if t['completed']]
+    incomplete_texts = [t['text'] for t in all_todos if not t['completed']]
     
     # 获取当前日期
     today = datetime.now()
@@ -339,237 +806,142 @@ async def generate_report_stream(request: ReportRequest = None):
     else:
         date_str = today.strftime("%Y年%m月%d日")  # 简体格式
     
-    # 根据语言选择提示词
-    if language == "traditional":
-        system_content = f"""你是一個專業的工作總結助手。請生成一份清晰的純文字工作日報（不要使用Markdown格式，不要使用**符號）。
-
-要求：
-1. 完整列出所有已完成和未完成的任務
-2. 總結部分需要詳細（至少{max(3, total_count // 2)}句話），要涵蓋主要工作內容、進展情況、重點任務等
-3. 使用純文字格式，不要使用任何Markdown標記（如 ** ）
-4. **必須使用繁體中文輸出所有內容**（如果任務列表中包含簡體中文，請將其轉換為繁體中文）
-5. 使用換行和縮進來組織內容"""
-        user_content = f"""請為以下任務生成詳細的工作日報（純文字格式，使用繁體中文，不要使用**等Markdown符號）：
-
-**重要提示：無論任務列表中的文字是簡體還是繁體，最終輸出的日報必須全部使用繁體中文。請將所有簡體中文內容轉換為繁體中文。**
-
-已完成的任務（共{len(completed_todos)}項）：
-{completed_text}
-
-未完成的任務（共{len(incomplete_todos)}項）：
-{incomplete_text}
-
-請按照以下格式生成日報（使用純文字，繁體中文，不要Markdown格式）：
-
-工作日報
-
-日期：{date_str}
-
-一、已完成任務（{len(completed_todos)}項）
-
-{completed_text if completed_todos else '暫無已完成任務'}
-
-二、未完成任務（{len(incomplete_todos)}項）
-
-{incomplete_text if incomplete_todos else '暫無未完成任務'}
-
-三、工作總結
-
-[詳細總結，至少包含{max(3, total_count // 2)}個方面：
-- 今天完成的主要工作及成果
-- 當前進行中的重點任務
-- 遇到的問題或挑戰
-- 下一步工作計劃
-等]
-
-四、備註
-
-[特別事項或需要關注的內容]
-
-注意：請使用繁體中文純文字格式輸出，不要使用任何Markdown標記符號。"""
-    else:
-        system_content = f"""你是一个专业的工作总结助手。请生成一份清晰的纯文本工作日报（不要使用Markdown格式，不要使用**符号）。
-
-要求：
-1. 完整列出所有已完成和未完成的任务
-2. 总结部分需要详细（至少{max(3, total_count // 2)}句话），要涵盖主要工作内容、进展情况、重点任务等
-3. 使用纯文本格式，不要使用任何Markdown标记（如 ** ）
-4. 使用简体中文
-5. 使用换行和缩进来组织内容"""
-        user_content = f"""已完成的任务（共{len(completed_todos)}项）：
-{completed_text}
-
-未完成的任务（共{len(incomplete_todos)}项）：
-{incomplete_text}
-
-请按照以下格式生成日报（使用纯文本，简体中文，不要Markdown格式）：
-
-工作日报
-
-日期：{date_str}
-
-一、已完成任务（{len(completed_todos)}项）
-
-{completed_text if completed_todos else '暂无已完成任务'}
-
-二、未完成任务（{len(incomplete_todos)}项）
-
-{incomplete_text if incomplete_todos else '暂无未完成任务'}
-
-三、工作总结
-
-[详细总结，至少包含{max(3, total_count // 2)}个方面：
-- 今天完成的主要工作及成果
-- 当前进行中的重点任务
-- 遇到的问题或挑战
-- 下一步工作计划
-等]
-
-四、备注
-
-[特别事项或需要关注的内容]
-
-注意：请使用简体中文纯文字格式输出，不要使用任何Markdown标记符号。"""
+    # 命中缓存时立即回放完整日报
+    cache_key = report_cache_key(
+        language, date_str, completed_texts, incomplete_texts, ai_client.AI_MODEL
+    )
+    cached_report = await report_cache.get(cache_key)
+    if cached_report is not None:
+        async def cached_generator():
+            yield cached_report
+        
+        return report_stream_response(cached_generator(), use_sse)
     
-    # 流式生成器"""
+    # 上游是否以 [DONE] 正常结束
+    stream_state = {"completed": False}
     
-    # 流式生成器
-    async def stream_generator():
-        request_body = {
-            "model": "gpt-3.5-turbo",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": system_content
-                },
-                {
-                    "role": "user",
-                    "content": user_content
-                }
-            ],
-            "stream": True  # 启用流式输出
-        }
-        
+    async def upstream_deltas(messages):
+        """逐个产出上游返回的文本增量"""
+        timer = metrics.StreamTimer()
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                async with client.stream(
-                    "POST",
-                    "https://api.zhizengzeng.com/v1/chat/completions",
-                    headers={
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {api_key}"
-                    },
-                    json=request_body
-                ) as response:
-                    response.raise_for_status()
+            async with ai_client.stream_chat_completion(api_key, messages, endpoint="report") as response:
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    data_str = line[6:]  # 移除 "data: " 前缀
+                    
+                    if data_str == "[DONE]":
+                        stream_state["completed"] = True
+                        break
                     
-                    async for line in response.aiter_lines():
-                        if line.startswith("data: "):
-                            data_str = line[6:]  # 移除 "data: " 前缀
-                            
-                            if data_str == "[DONE]":
-                                break
-                            
-                            try:
-                                import json
-                                data = json.loads(data_str)
-                                
-                                if "choices" in data and len(data["choices"]) > 0:
-                                    delta = data["choices"][0].get("delta", {})
-                                    content = delta.get("content", "")
-                                    
-                                    if content:
-                                        yield content
-                                        await asyncio.sleep(0.01)  # 模拟打字效果
-                            except json.JSONDecodeError:
-                                continue
+                    try:
+                        data = json.loads(data_str)
+                    except json.JSONDecodeError:
+                        continue
+                    
+                    if "choices" in data and len(data["choices"]) > 0:
+                        delta = data["choices"][0].get("delta", {})
+                        content = delta.get("content", "")
+                        if content:
+                            timer.token()
+                            yield content
+        finally:
+            timer.finish()
+    
+    # 流式生成器：合并小块后写出
+    async def stream_generator():
+        parts = []
+        started = time.perf_counter()
+        # 客户端中途断开时保持 cancelled
+        outcome = "cancelled"
+        try:
+            # 分组摘要阶段不产生输出，只流式输出最终日报
+            messages = await prepare_report_messages(api_key, language, date_str, completed_texts, incomplete_texts)
+            async for chunk in streaming.coalesce(upstream_deltas(messages)):
+                parts.append(chunk)
+                yield chunk
+            
+            # 只缓存完整结束的日报
+            outcome = "completed" if stream_state["completed"] else "incomplete"
+            if stream_state["completed"] and parts:
+                await report_cache.set(cache_key, "".join(parts))
         
+        except ai_client.UpstreamUnavailable as e:
+            outcome = "unavailable"
+            yield f"\n\n❌ {e}"
         except httpx.HTTPStatusError as e:
+            outcome = "error"
             yield f"\n\n❌ AI API 调用失败: {e.response.status_code}"
         except Exception as e:
+            outcome = "error"
             yield f"\n\n❌ 生成日报失败: {str(e)}"
+        finally:
+            metrics.REPORT_STREAM_SECONDS.observe(time.perf_counter() - started, outcome)
     
-    return StreamingResponse(
-        stream_generator(),
-        media_type="text/plain; charset=utf-8"
-    )
+    return report_stream_response(stream_generator(), use_sse)
 
 # ========== 阶段 5: AI 功能 - 任务分解 ==========
 
+def parse_subtasks(ai_response: str) -> List[str]:
+    """解析 AI 返回的子任务（每行一个）"""
+    subtasks = []
+    for line in ai_response.strip().split('\n'):
+        # 清理行内容（移除编号、前导空格等）
+        cleaned = line.strip()
+        # 移除常见的编号格式
+        cleaned = re.sub(r'^\d+[\.\)、]\s*', '', cleaned)
+        cleaned = re.sub(r'^[-•*]\s*', '', cleaned)
+        
+        if cleaned and len(cleaned) > 2:
+            subtasks.append(cleaned)
+    return subtasks
+
+async def request_subtasks(api_key: str, task_text: str) -> List[str]:
+    """调用 AI 生成子任务列表"""
+    # AI 提示词
+    messages = [
+        {
+            "role": "system",
+            "content": "你是一个任务规划专家。请将用户提供的复杂任务分解为 3-7 个具体的、可执行的子任务。每个子任务用一行表示，不要编号，不要多余的解释。"
+        },
+        {
+            "role": "user",
+            "content": f"请将以下任务分解为具体的子任务（每行一个，不要编号）：\n\n{task_text}"
+        }
+    ]
+    
+    return parse_subtasks(await ai_client.chat_completion(api_key, messages, endpoint="breakdown"))
+
+async def get_subtasks(api_key: str, task_text: str) -> List[str]:
+    """获取子任务：优先读缓存，相同任务的并发请求只调用一次上游"""
+    key = breakdown_cache_key(task_text, ai_client.AI_MODEL)
+    subtasks = breakdown_cache.get(key)
+    if subtasks is not None:
+        return subtasks
+    
+    async def fetch():
+        result = await request_subtasks(api_key, task_text)
+        if result:
+            breakdown_cache.set(key, result)
+        return result
+    
+    return await breakdown_flight.do(key, fetch)
+
 @app.post("/todos/{todo_id}/breakdown")
 async def breakdown_todo(todo_id: int):
     """使用 AI 将一个复杂任务分解为多个子任务"""
     api_key = get_ai_api_key()
     
-    # 获取原任务
-    todos = database.get_all_todos()
-    original_todo = next((t for t in todos if t["id"] == todo_id), None)
+    # 获取原任务（主键查询）
+    original_todo = await db_executor.run_read(database.get_todo_by_id, todo_id)
     
     if not original_todo:
         raise HTTPException(status_code=404, detail="待办事项不存在")
     
-    task_text = original_todo["text"]
-    
-    # AI 提示词
-    request_body = {
-        "model": "gpt-3.5-turbo",
-        "messages": [
-            {
-                "role": "system",
-                "content": "你是一个任务规划专家。请将用户提供的复杂任务分解为 3-7 个具体的、可执行的子任务。每个子任务用一行表示，不要编号，不要多余的解释。"
-            },
-            {
-                "role": "user",
-                "content": f"请将以下任务分解为具体的子任务（每行一个，不要编号）：\n\n{task_text}"
-            }
-        ]
-    }
-    
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                "https://api.zhizengzeng.com/v1/chat/completions",
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {api_key}"
-                },
-                json=request_body
-            )
-            response.raise_for_status()
-            data = response.json()
-            ai_response = data["choices"][0]["message"]["content"]
-            
-            # 解析 AI 返回的子任务
-            subtasks = []
-            lines = ai_response.strip().split('\n')
-            
-            for line in lines:
-                # 清理行内容（移除编号、前导空格等）
-                cleaned = line.strip()
-                # 移除常见的编号格式
-                import re
-                cleaned = re.sub(r'^\d+[\.\)、]\s*', '', cleaned)
-                cleaned = re.sub(r'^[-•*]\s*', '', cleaned)
-                
-                if cleaned and len(cleaned) > 2:
-                    subtasks.append(cleaned)
-            
-            # 批量添加子任务到数据库
-            if subtasks:
-                added_tasks = database.create_bulk_todos(subtasks)
-                
-                # 🆕 删除原始任务（因为已经被分解了）
-                database.delete_todo(todo_id)
-                
-                return {
-                    "message": f"成功分解为 {len(added_tasks)} 个子任务，原任务已删除",
-                    "count": len(added_tasks),
-                    "subtasks": added_tasks,
-                    "original_deleted": True
-                }
-            else:
-                raise HTTPException(status_code=500, detail="AI 未能生成有效的子任务")
-    
+        subtasks = await get_subtasks(api_key, original_todo["text"])
+    except ai_client.UpstreamUnavailable as e:
+        raise upstream_unavailable(e)
     except httpx.HTTPStatusError as e:
         raise HTTPException(
             status_code=e.response.status_code,
@@ -577,10 +949,140 @@ async def breakdown_todo(todo_id: int):
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"任务分解失败: {str(e)}")
+    
+    if not subtasks:
+        raise HTTPException(status_code=500, detail="AI 未能生成有效的子任务")
+    
+    # 同一事务中添加子任务并删除原任务；并发的重复点击只有一次生效
+    added_tasks = await db_executor.run_write(database.replace_todo_with_subtasks, todo_id, subtasks)
+    if added_tasks is None:
+        raise HTTPException(status_code=404, detail="待办事项不存在或已被分解")
+    
+    return {
+        "message": f"成功分解为 {len(added_tasks)} 个子任务，原任务已删除",
+        "count": len(added_tasks),
+        "subtasks": added_tasks,
+        "original_deleted": True
+    }
+
+# ========== 批量任务分解 ==========
+# 单次最多分解的任务数；同时进行的 AI 请求数（另受 ai_client 的 breakdown 并发上限约束）
+BREAKDOWN_BATCH_MAX = int(os.getenv("BREAKDOWN_BATCH_MAX", "100"))
+BREAKDOWN_BATCH_CONCURRENCY = int(os.getenv("BREAKDOWN_BATCH_CONCURRENCY", "8"))
+
+class BreakdownBatchRequest(BaseModel):
+    """批量任务分解请求"""
+    ids: List[int]
+
+def ndjson_line(payload: Dict) -> str:
+    return json.dumps(payload, ensure_ascii=False) + "\n"
+
+def breakdown_error(todo_id: int, e: Exception) -> Dict:
+    """将单个任务的分解失败转换为结果行（与单任务接口的状态码一致）"""
+    if isinstance(e, ai_client.UpstreamUnavailable):
+        status, message = 503, str(e)
+    elif isinstance(e, httpx.HTTPStatusError):
+        status, message = e.response.status_code, f"AI API 调用失败: {e.response.text}"
+    else:
+        status, message = 500, f"任务分解失败: {str(e)}"
+    return {"type": "error", "id": todo_id, "status": status, "error": message}
+
+@app.post("/todos/breakdown")
+async def breakdown_todos(request: BreakdownBatchRequest):
+    """批量分解多个任务，以 NDJSON 流式返回结果
+
+    每个任务的 AI 分解一完成就输出一行 {"type": "subtasks"} 或 {"type": "error"}；
+    全部完成后在一个事务中删除原任务、插入子任务，逐个输出 {"type": "applied"}
+    （subtasks 为新建的任务，格式与 GET /todos 的列表项相同，completed / is_new 为布尔值），
+    最后输出 {"type": "done"} 汇总。客户端中途断开时不写入任何数据。
+    """
+    api_key = get_ai_api_key()
+    ids = list(dict.fromkeys(request.ids))
+    if not ids:
+        raise HTTPException(status_code=400, detail="任务 ID 列表不能为空")
+    if len(ids) > BREAKDOWN_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"单次最多分解 {BREAKDOWN_BATCH_MAX} 个任务")
+    
+    # 一次主键 IN 查询取出全部原任务
+    todos = await db_executor.run_read(database.get_todos_by_ids, ids)
+    semaphore = asyncio.Semaphore(BREAKDOWN_BATCH_CONCURRENCY)
+    
+    async def breakdown_one(todo: Dict) -> List[str]:
+        async with semaphore:
+            return await get_subtasks(api_key, todo["text"])
+    
+    async def result_stream():
+        failed = 0
+        for todo_id in ids:
+            if todo_id not in todos:
+                failed += 1
+                yield ndjson_line({"type": "error", "id": todo_id, "status": 404, "error": "待办事项不存在"})
+        
+        pending = {asyncio.ensure_future(breakdown_one(todos[i])): i for i in ids if i in todos}
+        replacements: Dict[int, List[str]] = {}
+        try:
+            # 按完成顺序输出
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    todo_id = pending.pop(task)
+                    error = task.exception()
+                    if error is None and not task.result():
+                        error = RuntimeError("AI 未能生成有效的子任务")
+                    if error is not None:
+                        failed += 1
+                        yield ndjson_line(breakdown_error(todo_id, error))
+                        continue
+                    replacements[todo_id] = task.result()
+                    yield ndjson_line({
+                        "type": "subtasks",
+                        "id": todo_id,
+                        "text": todos[todo_id]["text"],
+                        "subtasks": task.result(),
+                    })
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        succeeded = 0
+        if replacements:
+            # 保持请求中的顺序，所有变更在同一事务中完成
+            ordered = {todo_id: replacements[todo_id] for todo_id in ids if todo_id in replacements}
+            try:
+                applied = await db_executor.run_write(database.replace_todos_with_subtasks, ordered)
+            except Exception as e:
+                failed += len(ordered)
+                for todo_id in ordered:
+                    yield ndjson_line({"type": "error", "id": todo_id, "status": 500, "error": f"保存子任务失败: {str(e)}"})
+            else:
+                for todo_id, added_tasks in applied.items():
+                    if added_tasks is None:
+                        failed += 1
+                        yield ndjson_line({"type": "error", "id": todo_id, "status": 404, "error": "待办事项不存在或已被分解"})
+                    else:
+                        succeeded += 1
+                        yield ndjson_line({"type": "applied", "id": todo_id, "subtasks": added_tasks})
+        
+        yield ndjson_line({"type": "done", "succeeded": succeeded, "failed": failed})
+    
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # ========== 服务器启动 ==========
 if __name__ == "__main__":
+    import argparse
     import uvicorn
+
+    parser = argparse.ArgumentParser(description="AI 待办事项后端")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8001")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")),
+                        help="worker 进程数，多核机器上可设为 CPU 核数")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
     
     # 检查环境变量
     api_key = os.getenv("AI_API_KEY", "")
@@ -588,11 +1090,17 @@ if __name__ == "__main__":
     print("=" * 60)
     print("🚀 健壮的 AI 待办事项管理 - 后端服务器")
     print("=" * 60)
-    print(f"💾 数据库: SQLite (todos.db)")
+    print(f"💾 数据库: SQLite ({database.DATABASE_PATH})")
+    print(f"👷 Worker 进程数: {args.workers}")
     if not api_key:
         print("⚠️  请先设置环境变量: export AI_API_KEY='your_api_key_here'")
-    print(f"📡 API 文档地址: http://localhost:8001/docs")
-    print(f"📡 后端运行在: http://localhost:8001")
+    print(f"📡 API 文档地址: http://localhost:{args.port}/docs")
+    print(f"📡 后端运行在: http://localhost:{args.port}")
     print("=" * 60)
     
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    if args.workers > 1:
+        # 多进程模式下 uvicorn 需要按导入路径在每个 worker 中加载应用
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers,
+                    log_level=args.log_level)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port, log_level=args.log_level)
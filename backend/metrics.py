@@ -0,0 +1,303 @@
+"""
+运行指标（Prometheus 文本格式）
+不依赖 prometheus_client 等外部包：计数器和直方图在进程内累加，GET /metrics 时按需输出；
+连接池、缓存等已有统计信息在抓取时通过回调读取，热路径上不做额外工作。
+记录一次观测只需一次加锁和一次二分查找，可以常开。
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 默认延迟分桶（秒）：覆盖亚毫秒级的数据库调用到数秒的慢请求
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# AI 上游耗时分桶（秒）
+UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+# 输出速率分桶（token/秒）
+RATE_BUCKETS = (1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 500)
+
+# Response 会为 text/* 自动追加 charset=utf-8
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = self._header()
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各桶计数（非累计）..., 超出最大桶的计数, 总和]
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        lines = self._header()
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """抓取时才调用 collect() 读取当前值（用于已有的 stats() 数据）"""
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        kind: str,
+        labelnames: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[LabelValues, float]]],
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.kind = kind
+        self._collect = collect
+
+    def render(self) -> List[str]:
+        try:
+            samples = list(self._collect())
+        except Exception:
+            # 某个组件尚未启动或已关闭时跳过，不影响其他指标
+            return []
+        lines = self._header()
+        for labels, value in samples:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+_registry: List[_Metric] = []
+
+
+def gauge(name: str, help_text: str, labelnames: Sequence[str] = ()):
+    """注册一个在抓取时求值的 gauge（装饰器）"""
+    def register(collect: Callable[[], Iterable[Tuple[LabelValues, float]]]):
+        CallbackMetric(name, help_text, "gauge", labelnames, collect)
+        return collect
+    return register
+
+
+def counter_callback(name: str, help_text: str, labelnames: Sequence[str] = ()):
+    """注册一个在抓取时读取的累计计数（装饰器），用于组件自己维护的计数器"""
+    def register(collect: Callable[[], Iterable[Tuple[LabelValues, float]]]):
+        CallbackMetric(name, help_text, "counter", labelnames, collect)
+        return collect
+    return register
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ========== 公共指标 ==========
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "todo_http_request_duration_seconds",
+    "HTTP 请求耗时（到响应体发送完毕）",
+    ("method", "route", "status"),
+)
+
+DB_CALL_SECONDS = Histogram(
+    "todo_db_call_duration_seconds",
+    "database.* 函数在线程池中的执行耗时",
+    ("function", "lane"),
+)
+DB_CALL_ERRORS = Counter(
+    "todo_db_call_errors_total",
+    "database.* 函数抛出异常的次数",
+    ("function", "lane"),
+)
+DB_QUEUE_WAIT_SECONDS = Histogram(
+    "todo_db_queue_wait_seconds",
+    "数据库调用在读 / 写通道中排队的时间（写通道即写锁排队）",
+    ("lane",),
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "todo_db_pool_wait_seconds",
+    "从连接池获取连接的等待时间",
+)
+DB_COMMIT_SECONDS = Histogram(
+    "todo_db_commit_duration_seconds",
+    "事务提交耗时（含 WAL 写入与锁等待）",
+)
+DB_GROUP_COMMIT_BATCH_SIZE = Histogram(
+    "todo_db_group_commit_batch_size",
+    "合并提交时每个事务包含的写请求数",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+DB_SLOW_QUERIES = Counter(
+    "todo_db_slow_queries_total",
+    "超过 DB_SLOW_QUERY_MS 的语句执行次数（需开启 DB_PROFILE）",
+)
+
+AI_REQUEST_SECONDS = Histogram(
+    "todo_ai_request_duration_seconds",
+    "单次上游 AI 请求耗时（流式请求计到收到响应头）",
+    ("endpoint", "outcome"),
+    UPSTREAM_BUCKETS,
+)
+AI_QUEUE_WAIT_SECONDS = Histogram(
+    "todo_ai_queue_wait_seconds",
+    "上游 AI 请求等待并发名额的时间",
+    ("endpoint",),
+)
+
+REPORT_STREAM_TTFT_SECONDS = Histogram(
+    "todo_report_stream_ttft_seconds",
+    "流式日报：从请求上游到收到第一个 token 的时间",
+    buckets=UPSTREAM_BUCKETS,
+)
+REPORT_STREAM_TOKENS_PER_SECOND = Histogram(
+    "todo_report_stream_tokens_per_second",
+    "流式日报：首 token 之后的输出速率",
+    buckets=RATE_BUCKETS,
+)
+REPORT_STREAM_TOKENS = Counter(
+    "todo_report_stream_tokens_total",
+    "流式日报：上游输出的 token（增量）总数",
+)
+REPORT_STREAM_SECONDS = Histogram(
+    "todo_report_stream_duration_seconds",
+    "流式日报：整个流的持续时间（含分组摘要阶段）",
+    ("outcome",),
+    UPSTREAM_BUCKETS,
+)
+
+
+class MetricsMiddleware:
+    """ASGI 中间件：按路由模板记录请求耗时（纯 ASGI 实现，不缓冲流式响应）"""
+
+    in_flight = 0
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = ["500"]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        MetricsMiddleware.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            MetricsMiddleware.in_flight -= 1
+            route = scope.get("route")
+            # 使用路由模板（如 /todos/{todo_id}）而不是实际路径，避免标签基数失控
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, scope["method"], path, status[0])
+
+
+@gauge("todo_http_requests_in_flight", "正在处理的 HTTP 请求数")
+def _in_flight():
+    return [((), MetricsMiddleware.in_flight)]
+
+
+class StreamTimer:
+    """记录一次流式上游输出的首 token 时间、token 数和输出速率"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.tokens = 0
+
+    def token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+            REPORT_STREAM_TTFT_SECONDS.observe(self.first_token - self.started)
+        self.tokens += 1
+
+    def finish(self):
+        if self.tokens:
+            REPORT_STREAM_TOKENS.inc(amount=self.tokens)
+        if self.first_token is not None and self.tokens > 1:
+            elapsed = time.perf_counter() - self.first_token
+            if elapsed > 0:
+                REPORT_STREAM_TOKENS_PER_SECOND.observe((self.tokens - 1) / elapsed)
@@ -1,44 +1,94 @@
 """
-数据库迁移脚本 - 添加 is_new 和 created_at 字段
+数据库迁移脚本 - 执行 migrations 包中尚未执行的迁移，并在线分批完成数据回填
+
+用法（在 backend 目录下，后端运行中也可以执行）：
+    python migrate_db.py                    # 结构变更 + 数据回填
+    python migrate_db.py --dry-run          # 只列出将要执行的语句和回填范围，不修改数据库
+    python migrate_db.py --status           # 查看各迁移的执行状态与回填进度
+    python migrate_db.py --batch-size 500 --pause-ms 100
+
+回填按 id 区间分批提交，中断（Ctrl+C）后重新运行会从断点继续。
 """
-import sqlite3
 
-DATABASE_PATH = "todos.db"
+import argparse
+import os
+import sys
+import time
 
-def migrate_database():
-    """为现有数据库添加新字段"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    try:
-        # 检查是否已经有这些字段
-        cursor.execute("PRAGMA table_info(todos)")
-        columns = [col[1] for col in cursor.fetchall()]
-        
-        if 'is_new' not in columns:
-            print("添加 is_new 字段...")
-            cursor.execute("ALTER TABLE todos ADD COLUMN is_new BOOLEAN NOT NULL DEFAULT 0")
-            print("✅ is_new 字段添加成功")
+import database
+import migrations
+
+
+def print_status():
+    for s in migrations.get_status():
+        if not s["applied"]:
+            state = "未执行"
+        elif s["backfill_next_id"] is not None:
+            state = f"回填中（下一批从 id {s['backfill_next_id']} 开始，共到 {s['backfill_end_id']}）"
         else:
-            print("✅ is_new 字段已存在")
-        
-        if 'created_at' not in columns:
-            print("添加 created_at 字段...")
-            cursor.execute("ALTER TABLE todos ADD COLUMN created_at TIMESTAMP")
-            # 更新现有行的 created_at 为当前时间
-            cursor.execute("UPDATE todos SET created_at = datetime('now')")
-            print("✅ created_at 字段添加成功")
+            state = f"已完成 {s['applied_at']}"
+        print(f"  v{s['version']:04d} {s['description']}\n         {state}")
+
+def print_plan():
+    steps = migrations.plan()
+    if not steps:
+        print("✅ 没有待执行的迁移")
+    for step in steps:
+        print(f"🔧 v{step['version']:04d} {step['description']}")
+        for sql in step["statements"]:
+            print(f"     {sql[:160]}")
+        if step["backfill"]:
+            print(f"     ↳ 数据回填: id {step['backfill']['first_id']} - {step['backfill']['last_id']}")
+    for s in migrations.pending_backfills():
+        print(f"⏳ v{s['version']:04d} 数据回填未完成: id {s['backfill_next_id']} - {s['backfill_end_id']}")
+
+def migrate_database(batch_size: int, pause_ms: float):
+    """执行结构变更，然后完成所有未完成的数据回填"""
+    database.init_database()
+    last_report = [0.0]
+
+    def on_batch(migration, batch):
+        # 每秒最多输出一次进度
+        now = time.monotonic()
+        if batch["finished"] or now - last_report[0] >= 1:
+            last_report[0] = now
+            print(f"  v{migration.version:04d} 回填到 id {batch['last_id']} / {batch['end_id']}")
+
+    started = time.perf_counter()
+    try:
+        results = migrations.run_backfills(batch_size, pause_ms, on_batch)
+    except KeyboardInterrupt:
+        print("\n⏸️  已中断，进度已保存，重新运行将从断点继续")
+        sys.exit(130)
+    for version, rows in results.items():
+        print(f"✅ v{version:04d} 数据回填完成，更新 {rows} 行")
+    print(f"\n✅ 数据库迁移完成！用时 {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据库迁移")
+    parser.add_argument("--database", default=database.DATABASE_PATH, help="数据库文件")
+    parser.add_argument("--dry-run", action="store_true", help="只输出将要执行的变更，不修改数据库")
+    parser.add_argument("--status", action="store_true", help="查看迁移状态")
+    parser.add_argument("--batch-size", type=int, default=migrations.BACKFILL_BATCH_SIZE,
+                        help="每批回填的 id 区间长度")
+    parser.add_argument("--pause-ms", type=float, default=migrations.BACKFILL_PAUSE_MS,
+                        help="回填批次之间的暂停（毫秒）")
+    args = parser.parse_args()
+
+    database.DATABASE_PATH = os.path.abspath(args.database)
+    if (args.dry_run or args.status) and not os.path.exists(database.DATABASE_PATH):
+        sys.exit(f"❌ 数据库不存在: {database.DATABASE_PATH}")
+    print(f"💾 数据库: {database.DATABASE_PATH}")
+    try:
+        if args.status:
+            print_status()
+        elif args.dry_run:
+            print_plan()
         else:
-            print("✅ created_at 字段已存在")
-        
-        conn.commit()
-        print("\n✅ 数据库迁移完成！")
-    
-    except Exception as e:
-        print(f"❌ 迁移失败: {e}")
-        conn.rollback()
+            migrate_database(args.batch_size, args.pause_ms)
     finally:
-        conn.close()
+        database.close_pool()
 
 if __name__ == "__main__":
-    migrate_database()
+    main()
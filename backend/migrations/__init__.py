@@ -0,0 +1,252 @@
+"""
+数据库迁移
+每个迁移是本目录下的一个模块，文件名为 v<四位版本号>_<名称>.py，按版本号顺序执行；
+已执行的版本记录在 schema_version 表中。迁移模块约定：
+
+    模块文档字符串的第一行    迁移说明
+    upgrade(cursor)          结构变更（建表、加列、建索引、触发器）。必须幂等且很快完成：
+                             与版本记录在同一个事务中提交。定义了 backfill 的迁移返回是否需要回填
+    backfill(cursor, first_id, last_id) -> int
+                             可选。修改 id 在 [first_id, last_id] 范围内的存量数据，返回修改的行数。
+                             必须幂等（按条件更新），重复执行同一区间不会出错
+
+结构变更由 database.init_database() 在应用启动时执行；数据回填不在启动时执行，
+而是由 migrate_db.py 按 id 区间分批执行：每批一个短事务，批次之间暂停，
+运行中的应用可以照常读写。回填进度与该批数据在同一个事务中提交，中断后重新运行会从断点继续。
+回填范围是执行 upgrade 时已有的行；之后新写入的行须由列默认值或触发器保证正确，
+后续迁移的 upgrade 也不能依赖之前的回填已经完成。
+"""
+
+import importlib
+import os
+import pkgutil
+import re
+import sqlite3
+import time
+from typing import Callable, Dict, List, Optional
+
+import database
+
+BACKFILL_BATCH_SIZE = 1000   # 每批处理的 id 区间长度
+BACKFILL_PAUSE_MS = 50       # 批次之间的暂停，留出写锁给应用
+
+_MODULE_PATTERN = re.compile(r"^v(\d{4})_(\w+)$")
+# dry-run 时只展示会修改数据库的语句
+_WRITE_SQL = re.compile(r"^\s*(CREATE|ALTER|DROP|INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+
+class Migration:
+    """一个迁移模块"""
+
+    def __init__(self, version: int, name: str, module):
+        self.version = version
+        self.name = name
+        self.description = (module.__doc__ or name).strip().splitlines()[0]
+        self.upgrade: Callable[[sqlite3.Cursor], Optional[bool]] = module.upgrade
+        self.backfill: Optional[Callable[[sqlite3.Cursor, int, int], int]] = getattr(module, "backfill", None)
+
+
+def load_migrations() -> List[Migration]:
+    """按版本号顺序加载本目录下的所有迁移模块"""
+    migrations = []
+    for info in pkgutil.iter_modules([os.path.dirname(__file__)]):
+        match = _MODULE_PATTERN.match(info.name)
+        if match is None:
+            continue
+        module = importlib.import_module(f"{__name__}.{info.name}")
+        migrations.append(Migration(int(match.group(1)), match.group(2), module))
+    migrations.sort(key=lambda m: m.version)
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"迁移版本号重复: {versions}")
+    return migrations
+
+
+# ========== 版本记录 ==========
+
+def ensure_column(cursor: sqlite3.Cursor, table: str, column: str, ddl: str) -> bool:
+    """为旧数据库补充缺失的列，返回是否新增"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column in [col[1] for col in cursor.fetchall()]:
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {ddl}")
+    return True
+
+def _ensure_version_table(cursor: sqlite3.Cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            backfill_next_id INTEGER,   -- 下一批回填的起始 id；NULL 表示无需回填或已完成
+            backfill_end_id INTEGER,    -- 回填范围的最大 id（执行 upgrade 时的 MAX(id)）
+            backfill_rows INTEGER NOT NULL DEFAULT 0,
+            backfilled_at TIMESTAMP
+        )
+    """)
+
+def _applied(cursor: sqlite3.Cursor) -> Dict[int, Dict]:
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+    ).fetchone() is not None
+    if not exists:
+        return {}
+    rows = cursor.execute("""
+        SELECT version, name, applied_at, backfill_next_id, backfill_end_id, backfill_rows, backfilled_at
+        FROM schema_version
+    """).fetchall()
+    return {row[0]: dict(zip(
+        ("version", "name", "applied_at", "backfill_next_id", "backfill_end_id", "backfill_rows", "backfilled_at"),
+        row,
+    )) for row in rows}
+
+def _apply_one(cursor: sqlite3.Cursor, migration: Migration):
+    needs_backfill = migration.upgrade(cursor)
+    next_id = end_id = None
+    if migration.backfill is not None and needs_backfill is not False:
+        next_id, end_id = cursor.execute("SELECT MIN(id), MAX(id) FROM todos").fetchone()
+    cursor.execute(
+        "INSERT INTO schema_version (version, name, backfill_next_id, backfill_end_id) VALUES (?, ?, ?, ?)",
+        (migration.version, migration.name, next_id, end_id),
+    )
+
+
+# ========== 结构变更 ==========
+
+def apply_schema(migrations: Optional[List[Migration]] = None) -> List[Migration]:
+    """按顺序执行尚未执行的结构变更，每个迁移一个事务；返回本次执行的迁移
+
+    多进程同时启动时由调用方（init_database）用文件锁串行化。
+    """
+    migrations = load_migrations() if migrations is None else migrations
+    applied = []
+    with database.get_db_connection() as conn:
+        cursor = conn.cursor()
+        _ensure_version_table(cursor)
+        conn.commit()
+        done = _applied(cursor)
+        for migration in migrations:
+            if migration.version in done:
+                continue
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                _apply_one(cursor, migration)
+            except Exception:
+                conn.rollback()
+                raise
+            conn.commit()
+            applied.append(migration)
+    return applied
+
+def plan(migrations: Optional[List[Migration]] = None) -> List[Dict]:
+    """dry-run：在事务中执行所有待执行的结构变更并记录语句，然后回滚，不修改数据库"""
+    migrations = load_migrations() if migrations is None else migrations
+    steps = []
+    with database.get_db_connection() as conn:
+        cursor = conn.cursor()
+        done = _applied(cursor)
+        statements: List[str] = []
+        conn.set_trace_callback(statements.append)
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            _ensure_version_table(cursor)
+            for migration in migrations:
+                if migration.version in done:
+                    continue
+                statements.clear()
+                _apply_one(cursor, migration)
+                backfill = cursor.execute(
+                    "SELECT backfill_next_id, backfill_end_id FROM schema_version WHERE version = ?",
+                    (migration.version,),
+                ).fetchone()
+                steps.append({
+                    "version": migration.version,
+                    "name": migration.name,
+                    "description": migration.description,
+                    "statements": [
+                        " ".join(sql.split()) for sql in statements
+                        if _WRITE_SQL.match(sql) and "schema_version" not in sql
+                    ],
+                    "backfill": None if backfill[0] is None else {"first_id": backfill[0], "last_id": backfill[1]},
+                })
+        finally:
+            conn.set_trace_callback(None)
+            conn.rollback()
+    return steps
+
+def get_status(migrations: Optional[List[Migration]] = None) -> List[Dict]:
+    """各迁移的执行状态与回填进度"""
+    migrations = load_migrations() if migrations is None else migrations
+    with database.get_db_connection() as conn:
+        done = _applied(conn.cursor())
+    return [
+        {
+            "version": m.version,
+            "name": m.name,
+            "description": m.description,
+            "applied": m.version in done,
+            **({k: v for k, v in done[m.version].items() if k not in ("version", "name")}
+               if m.version in done else {}),
+        }
+        for m in migrations
+    ]
+
+def pending_backfills() -> List[Dict]:
+    """已执行结构变更但尚未完成回填的迁移"""
+    return [s for s in get_status() if s["applied"] and s["backfill_next_id"] is not None]
+
+
+# ========== 数据回填 ==========
+
+def _backfill_batch(migration: Migration, batch_size: int) -> Optional[Dict]:
+    """执行一批回填，与进度更新在同一事务中提交；已完成时返回 None"""
+    with database.get_db_connection() as conn:
+        cursor = conn.cursor()
+        # 在写锁内读取进度，多个回填进程同时运行时也不会重复处理同一区间
+        cursor.execute("BEGIN IMMEDIATE")
+        next_id, end_id = cursor.execute(
+            "SELECT backfill_next_id, backfill_end_id FROM schema_version WHERE version = ?",
+            (migration.version,),
+        ).fetchone()
+        if next_id is None:
+            conn.rollback()
+            return None
+        last_id = min(next_id + batch_size - 1, end_id)
+        rows = migration.backfill(cursor, next_id, last_id)
+        finished = last_id >= end_id
+        cursor.execute(
+            """
+            UPDATE schema_version
+            SET backfill_next_id = ?, backfill_rows = backfill_rows + ?,
+                backfilled_at = CASE WHEN ? THEN CURRENT_TIMESTAMP END
+            WHERE version = ?
+            """,
+            (None if finished else last_id + 1, rows, finished, migration.version),
+        )
+        conn.commit()
+    return {"first_id": next_id, "last_id": last_id, "end_id": end_id, "rows": rows, "finished": finished}
+
+def run_backfill(migration: Migration, batch_size: int = BACKFILL_BATCH_SIZE,
+                 pause_ms: float = BACKFILL_PAUSE_MS,
+                 on_batch: Optional[Callable[[Migration, Dict], None]] = None) -> int:
+    """分批执行一个迁移的数据回填直到完成，返回修改的总行数"""
+    total = 0
+    while True:
+        batch = _backfill_batch(migration, max(1, batch_size))
+        if batch is None:
+            return total
+        total += batch["rows"]
+        if on_batch is not None:
+            on_batch(migration, batch)
+        if batch["finished"]:
+            return total
+        time.sleep(pause_ms / 1000)
+
+def run_backfills(batch_size: int = BACKFILL_BATCH_SIZE, pause_ms: float = BACKFILL_PAUSE_MS,
+                  on_batch: Optional[Callable[[Migration, Dict], None]] = None) -> Dict[int, int]:
+    """按版本顺序完成所有未完成的回填，返回 {版本号: 修改行数}"""
+    pending = {s["version"] for s in pending_backfills()}
+    return {
+        m.version: run_backfill(m, batch_size, pause_ms, on_batch)
+        for m in load_migrations() if m.version in pending
+    }
@@ -0,0 +1,40 @@
+"""
+todos 表；为旧数据库补充 is_new、created_at 列，并回填存量任务的创建时间
+"""
+
+import sqlite3
+
+from migrations import ensure_column
+
+
+def upgrade(cursor: sqlite3.Cursor) -> bool:
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS todos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            completed BOOLEAN NOT NULL DEFAULT 0,
+            is_new BOOLEAN NOT NULL DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # 存量任务不显示 NEW 标记
+    ensure_column(cursor, "todos", "is_new", "is_new BOOLEAN NOT NULL DEFAULT 0")
+    # ALTER TABLE 不能添加 CURRENT_TIMESTAMP 默认值，由触发器为之后插入的行补上创建时间
+    added = ensure_column(cursor, "todos", "created_at", "created_at TIMESTAMP")
+    if added:
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_todos_created_at AFTER INSERT ON todos
+            WHEN NEW.created_at IS NULL
+            BEGIN
+                UPDATE todos SET created_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+            END
+        """)
+    return added
+
+def backfill(cursor: sqlite3.Cursor, first_id: int, last_id: int) -> int:
+    # 回填完成前，created_at 为 NULL 的存量任务不会出现在按创建时间筛选的结果中
+    cursor.execute(
+        "UPDATE todos SET created_at = datetime('now') WHERE id BETWEEN ? AND ? AND created_at IS NULL",
+        (first_id, last_id),
+    )
+    return cursor.rowcount
@@ -0,0 +1,15 @@
+"""
+列表查询索引：按完成状态筛选 + 按 id 倒序分页、按创建时间筛选、NEW 标记清理
+"""
+
+import sqlite3
+
+
+def upgrade(cursor: sqlite3.Cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_todos_completed_id ON todos (completed, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_todos_created_at ON todos (created_at)")
+    # 仅索引仍带 NEW 标记的行，供 expire_new_flags() 快速定位过期记录
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_todos_new_created_at
+        ON todos (created_at) WHERE is_new = 1
+    """)
@@ -0,0 +1,45 @@
+"""
+计数表及维护它的触发器，使统计查询无需扫描 todos 表
+"""
+
+import sqlite3
+
+
+def upgrade(cursor: sqlite3.Cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS todo_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total INTEGER NOT NULL,
+            completed INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_todo_stats_insert AFTER INSERT ON todos
+        BEGIN
+            UPDATE todo_stats
+            SET total = total + 1, completed = completed + (NEW.completed != 0)
+            WHERE id = 1;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_todo_stats_delete AFTER DELETE ON todos
+        BEGIN
+            UPDATE todo_stats
+            SET total = total - 1, completed = completed - (OLD.completed != 0)
+            WHERE id = 1;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_todo_stats_update AFTER UPDATE OF completed ON todos
+        WHEN (OLD.completed != 0) != (NEW.completed != 0)
+        BEGIN
+            UPDATE todo_stats
+            SET completed = completed + (NEW.completed != 0) - (OLD.completed != 0)
+            WHERE id = 1;
+        END
+    """)
+    # 首次创建时根据现有数据初始化计数（与触发器在同一事务中，计数不会漏掉并发写入）
+    cursor.execute("""
+        INSERT OR IGNORE INTO todo_stats (id, total, completed)
+        SELECT 1, COUNT(*), COALESCE(SUM(completed != 0), 0) FROM todos
+    """)
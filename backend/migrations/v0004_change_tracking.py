@@ -0,0 +1,70 @@
+"""
+变更版本号：每次插入 / 修改 / 删除都使全局版本号加一，被修改的行记录该版本号，被删除的行写入墓碑表
+"""
+
+import sqlite3
+
+from migrations import ensure_column
+
+
+def upgrade(cursor: sqlite3.Cursor) -> bool:
+    ensure_column(cursor, "todos", "version", "version INTEGER NOT NULL DEFAULT 0")
+    ensure_column(cursor, "todos", "updated_at", "updated_at TIMESTAMP")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            tombstone_floor INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS todo_tombstones (
+            id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL,
+            deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_todos_version ON todos (version)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_todo_tombstones_version ON todo_tombstones (version)")
+    first_time = cursor.execute("SELECT 1 FROM sync_state WHERE id = 1").fetchone() is None
+    if first_time:
+        cursor.execute("INSERT INTO sync_state (id, version) VALUES (1, 1)")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_todos_version_insert AFTER INSERT ON todos
+        BEGIN
+            UPDATE sync_state SET version = version + 1 WHERE id = 1;
+            UPDATE todos
+            SET version = (SELECT version FROM sync_state WHERE id = 1), updated_at = CURRENT_TIMESTAMP
+            WHERE id = NEW.id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_todos_version_update AFTER UPDATE OF text, completed, is_new ON todos
+        WHEN OLD.text IS NOT NEW.text OR OLD.completed IS NOT NEW.completed OR OLD.is_new IS NOT NEW.is_new
+        BEGIN
+            UPDATE sync_state SET version = version + 1 WHERE id = 1;
+            UPDATE todos
+            SET version = (SELECT version FROM sync_state WHERE id = 1), updated_at = CURRENT_TIMESTAMP
+            WHERE id = NEW.id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_todos_version_delete AFTER DELETE ON todos
+        BEGIN
+            UPDATE sync_state SET version = version + 1 WHERE id = 1;
+            INSERT OR REPLACE INTO todo_tombstones (id, version)
+            VALUES (OLD.id, (SELECT version FROM sync_state WHERE id = 1));
+        END
+    """)
+    return first_time
+
+def backfill(cursor: sqlite3.Cursor, first_id: int, last_id: int) -> int:
+    # 首次启用：已有数据统一记为版本 1（回填完成前这些行不会出现在增量同步结果中）
+    cursor.execute(
+        """
+        UPDATE todos SET version = 1, updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)
+        WHERE id BETWEEN ? AND ? AND version = 0
+        """,
+        (first_id, last_id),
+    )
+    return cursor.rowcount
@@ -0,0 +1,24 @@
+"""
+归档表：完成较久的任务从 todos 移到 todos_archive（保留原 id），使 todos 只保存活跃数据
+"""
+
+import sqlite3
+
+
+def upgrade(cursor: sqlite3.Cursor):
+    # todos 的 id 为 AUTOINCREMENT，删除后不会被重新分配，归档表沿用原 id 不会冲突
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS todos_archive (
+            id INTEGER PRIMARY KEY,
+            text TEXT NOT NULL,
+            created_at TIMESTAMP,
+            completed_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_todos_archive_created_at ON todos_archive (created_at)")
+    # 仅索引已完成的任务，供归档任务按完成时间（updated_at）定位候选行
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_todos_completed_updated_at
+        ON todos (updated_at) WHERE completed = 1
+    """)
@@ -0,0 +1,21 @@
+"""
+版本号触发器不再响应 is_new：后台清除过期 NEW 标记不产生变更事件，也不改写 updated_at
+"""
+
+import sqlite3
+
+
+def upgrade(cursor: sqlite3.Cursor):
+    # is_new 在读取时按创建时间计算，清除过期标记对客户端不可见；
+    # updated_at 还被归档当作完成时间使用，只应随用户的修改变化
+    cursor.execute("DROP TRIGGER IF EXISTS trg_todos_version_update")
+    cursor.execute("""
+        CREATE TRIGGER trg_todos_version_update AFTER UPDATE OF text, completed ON todos
+        WHEN OLD.text IS NOT NEW.text OR OLD.completed IS NOT NEW.completed
+        BEGIN
+            UPDATE sync_state SET version = version + 1 WHERE id = 1;
+            UPDATE todos
+            SET version = (SELECT version FROM sync_state WHERE id = 1), updated_at = CURRENT_TIMESTAMP
+            WHERE id = NEW.id;
+        END
+    """)
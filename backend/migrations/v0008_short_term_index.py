@@ -0,0 +1,75 @@
+"""
+短词索引：1～2 个字符的关键词（如两个字的中文词）也走全文索引，不再扫描全表
+"""
+
+import sqlite3
+
+import database
+from migrations import ensure_column
+
+
+def upgrade(cursor: sqlite3.Cursor) -> bool:
+    # short_text = short_index_text(text)：每个字符两侧加分隔符，1～2 个字符的关键词对应恰好一个 trigram。
+    # 由应用在写入 text 时一并写入；NULL 表示尚未计算（存量数据、其他程序直接写入的行），
+    # 由回填和后台任务 fill_short_index() 分批补上。触发器只使用内置 SQL，不依赖应用注册的函数
+    ensure_column(cursor, "todos", "short_text", "short_text TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_todos_short_text_pending ON todos (id) WHERE short_text IS NULL")
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'todos_fts_short'"
+    ).fetchone() is not None
+    if not exists:
+        # 不保存内容（content=''）；保留完整的位置信息，detail=none / column 时 bm25 恒为 0，无法排序
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE todos_fts_short USING fts5(
+                    text, content = '', tokenize = 'trigram'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            print(f"⚠️  短词索引不可用，短关键词将使用 LIKE: {e}")
+            return False
+    # 索引中恰好包含 short_text 不为 NULL 的行；无内容表删除时须提供与写入时相同的值
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_todos_fts_short_insert AFTER INSERT ON todos
+        WHEN NEW.short_text IS NOT NULL
+        BEGIN
+            INSERT INTO todos_fts_short (rowid, text) VALUES (NEW.id, NEW.short_text);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_todos_fts_short_delete AFTER DELETE ON todos
+        WHEN OLD.short_text IS NOT NULL
+        BEGIN
+            INSERT INTO todos_fts_short (todos_fts_short, rowid, text) VALUES ('delete', OLD.id, OLD.short_text);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_todos_fts_short_update AFTER UPDATE OF short_text ON todos
+        BEGIN
+            INSERT INTO todos_fts_short (todos_fts_short, rowid, text)
+            SELECT 'delete', OLD.id, OLD.short_text WHERE OLD.short_text IS NOT NULL;
+            INSERT INTO todos_fts_short (rowid, text)
+            SELECT NEW.id, NEW.short_text WHERE NEW.short_text IS NOT NULL;
+        END
+    """)
+    # 只改 text 没有同时写 short_text（其他程序直接修改）时，旧的 short_text 已失效，置为 NULL 等待重新计算
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_todos_short_text_stale AFTER UPDATE OF text ON todos
+        WHEN NEW.text IS NOT OLD.text AND NEW.short_text IS NOT NULL AND NEW.short_text IS OLD.short_text
+        BEGIN
+            UPDATE todos SET short_text = NULL WHERE id = NEW.id;
+        END
+    """)
+    return True
+
+def backfill(cursor: sqlite3.Cursor, first_id: int, last_id: int) -> int:
+    # 回填完成前，搜索中的短关键词在候选行上用 LIKE 过滤（见 database.search_todos）
+    rows = cursor.execute(
+        "SELECT id, text FROM todos WHERE id BETWEEN ? AND ? AND short_text IS NULL",
+        (first_id, last_id),
+    ).fetchall()
+    cursor.executemany(
+        "UPDATE todos SET short_text = ? WHERE id = ? AND short_text IS NULL",
+        [(database.short_index_text(text), todo_id) for todo_id, text in rows],
+    )
+    return len(rows)
@@ -0,0 +1,112 @@
+"""
+慢查询分析 - 命令行输出
+
+两种用法（在 backend 目录下）：
+    # 读取运行中的后端（需以 DB_PROFILE=1 启动）的分析结果
+    python query_profile.py --url http://127.0.0.1:8001
+
+    # 离线分析：对指定数据库执行一轮列表 / 统计 / 搜索等读路径，输出各语句的耗时与查询计划
+    python query_profile.py --database todos.db --threshold-ms 0
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import httpx
+
+import database
+
+
+def fetch_profile(url: str, limit: int) -> dict:
+    response = httpx.get(f"{url.rstrip('/')}/admin/queries", params={"limit": limit}, timeout=10)
+    response.raise_for_status()
+    return response.json()
+
+
+def profile_database(path: str, threshold_ms: float, repeat: int, limit: int) -> dict:
+    """在本进程中开启分析，重复执行主要的读路径（只读，不做初始化或迁移）"""
+    database.DATABASE_PATH = path
+    database.enable_query_profiling(threshold_ms, log=False)
+    with database.get_db_connection() as conn:
+        # 不运行 init_database()，按数据库中是否已有全文索引决定搜索路径
+        database.FTS_AVAILABLE = database.has_search_index(conn)
+    total = database.get_todo_stats()["total"]
+    for _ in range(repeat):
+        _, _, next_cursor = database.list_todos(limit=50)
+        if next_cursor is not None:
+            database.list_todos(limit=50, cursor=next_cursor)
+        database.list_todos(limit=50, completed=False)
+        database.list_todos(limit=50, include_archived=True)
+        database.get_list_etag_state()
+        database.get_todo_stats()
+        database.get_sync_version()
+        database.search_todos("会议记录", limit=20)
+        database.get_todo_by_id(max(total // 2, 1))
+    database.close_pool()
+    return database.get_query_profile(limit)
+
+
+def print_profile(profile: dict, show_plans: bool):
+    if not profile.get("enabled"):
+        print("⚠️  慢查询分析未开启（以 DB_PROFILE=1 启动后端）")
+        return
+    print(f"📊 统计起始: {profile['since']}  慢查询阈值: {profile['threshold_ms']}ms  "
+          f"语句模板: {profile['statements_tracked']}")
+    print(f"{'#':>3} {'calls':>7} {'total ms':>10} {'avg ms':>9} {'max ms':>9} {'rows':>8} {'slow':>6}  sql")
+    for rank, entry in enumerate(profile["top"], 1):
+        flags = []
+        if entry["full_scans"]:
+            flags.append("FULL SCAN")
+        if entry["temp_btree"]:
+            flags.append("TEMP B-TREE")
+        flag_text = f" [{', '.join(flags)}]" if flags else ""
+        print(f"{rank:>3} {entry['calls']:>7} {entry['total_ms']:>10.2f} {entry['avg_ms']:>9.3f} "
+              f"{entry['max_ms']:>9.3f} {entry['avg_rows']:>8} {entry['slow_calls']:>6}  "
+              f"{entry['sql'][:120]}{flag_text}")
+        if show_plans and entry["plan"]:
+            for line in entry["plan"]:
+                print(f"{'':>12}↳ {line}")
+    if profile["recent_slow"]:
+        print("\n🐢 最近的慢查询:")
+        for event in profile["recent_slow"][:10]:
+            print(f"  {event['at']}  {event['elapsed_ms']:>9.3f}ms  {event['rows']:>6} 行  "
+                  f"{event['sql'][:100]}  [{event['params']}]")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="输出按总耗时排序的 SQL 语句及查询计划")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--url", default="http://127.0.0.1:8001", help="运行中的后端地址")
+    source.add_argument("--database", help="离线分析的数据库文件")
+    parser.add_argument("--limit", type=int, default=20, help="输出前多少条语句")
+    parser.add_argument("--threshold-ms", type=float, default=database.SLOW_QUERY_MS,
+                        help="离线分析的慢查询阈值；0 表示为所有语句抓取查询计划")
+    parser.add_argument("--repeat", type=int, default=5, help="离线分析时每条读路径执行的次数")
+    parser.add_argument("--no-plans", action="store_true", help="不输出查询计划")
+    parser.add_argument("--json", action="store_true", help="输出原始 JSON")
+    args = parser.parse_args()
+
+    if args.database:
+        if not os.path.exists(args.database):
+            sys.exit(f"❌ 数据库不存在: {args.database}")
+        started = time.perf_counter()
+        profile = profile_database(args.database, args.threshold_ms, args.repeat, args.limit)
+        if not args.json:
+            print(f"✅ 离线分析完成，用时 {time.perf_counter() - started:.2f}s")
+    else:
+        try:
+            profile = fetch_profile(args.url, args.limit)
+        except httpx.HTTPError as e:
+            sys.exit(f"❌ 无法读取 {args.url}/admin/queries: {e}")
+
+    if args.json:
+        print(json.dumps(profile, ensure_ascii=False, indent=2))
+    else:
+        print_profile(profile, show_plans=not args.no_plans)
+
+
+if __name__ == "__main__":
+    main()
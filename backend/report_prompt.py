@@ -0,0 +1,470 @@
+"""
+AI 日报提示词构建
+两个日报接口（普通 / 流式）共用同一套提示词。任务较少时一次生成；
+提示词超出 token 预算时采用 map-reduce：先把任务分组、并发生成各组摘要（有并发上限），
+再由分组摘要生成最终日报，最终阶段仍可流式输出。
+"""
+
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+# ========== 配置（可通过环境变量调整） ==========
+# 单次请求提示词的 token 预算（估算值），超出后改用分组摘要
+REPORT_PROMPT_TOKEN_BUDGET = int(os.getenv("REPORT_PROMPT_TOKEN_BUDGET", "6000"))
+# 每个分组的任务文本 token 上限
+REPORT_CHUNK_TOKENS = int(os.getenv("REPORT_CHUNK_TOKENS", "2500"))
+# 同时进行的分组摘要请求数
+REPORT_MAP_CONCURRENCY = int(os.getenv("REPORT_MAP_CONCURRENCY", "4"))
+# 每个分组摘要的最大输出 token 数
+REPORT_SUMMARY_MAX_TOKENS = int(os.getenv("REPORT_SUMMARY_MAX_TOKENS", "400"))
+# 摘要仍然过长时最多再合并的轮数
+REPORT_MAX_COMBINE_ROUNDS = 3
+
+Messages = List[Dict[str, str]]
+Summarizer = Callable[[Messages], Awaitable[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：非 ASCII 字符（中文等）按每字 1 个，ASCII 按每 4 个字符 1 个"""
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+def estimate_messages_tokens(messages: Messages) -> int:
+    # 每条消息另有少量格式开销
+    return sum(estimate_tokens(m["content"]) + 4 for m in messages)
+
+
+# ========== 提示词模板 ==========
+
+_TEMPLATES = {
+    "simplified": {
+        "none": "无",
+        "no_completed": "暂无已完成任务",
+        "no_incomplete": "暂无未完成任务",
+        "completed_label": "已完成",
+        "incomplete_label": "未完成",
+        "system": """你是一个专业的工作总结助手。请生成一份清晰的纯文本工作日报（不要使用Markdown格式，不要使用**符号）。
+
+要求：
+1. 完整列出所有已完成和未完成的任务
+2. 总结部分需要详细（至少{min_points}句话），要涵盖主要工作内容、进展情况、重点任务等
+3. 使用纯文本格式，不要使用任何Markdown标记（如 ** ）
+4. 使用简体中文
+5. 使用换行和缩进来组织内容""",
+        "user": """请为以下任务生成详细的工作日报（纯文本格式，使用简体中文，不要使用**等Markdown符号）：
+
+已完成的任务（共{completed_count}项）：
+{completed_text}
+
+未完成的任务（共{incomplete_count}项）：
+{incomplete_text}
+
+请按照以下格式生成日报（使用纯文本，简体中文，不要Markdown格式）：
+
+工作日报
+
+日期：{date_str}
+
+一、已完成任务（{completed_count}项）
+
+{completed_section}
+
+二、未完成任务（{incomplete_count}项）
+
+{incomplete_section}
+
+三、工作总结
+
+[详细总结，至少包含{min_points}个方面：
+- 今天完成的主要工作及成果
+- 当前进行中的重点任务
+- 遇到的问题或挑战
+- 下一步工作计划
+等]
+
+四、备注
+
+[特别事项或需要关注的内容]
+
+注意：请使用简体中文纯文本格式输出，不要使用任何Markdown标记符号。""",
+        "map_system": "你是一个专业的工作总结助手。请把给定的一组任务归纳为简洁的要点摘要：按主题合并相似任务，保留关键事项、数量和编号范围，使用简体中文纯文本，不要使用Markdown标记。",
+        "map_user": """以下是{label}的任务（第{first}至{last}项，共{count}项）：
+{task_text}
+
+请输出这组任务的要点摘要（每行一个要点）。""",
+        "combine_user": """以下是{label}任务的若干分组摘要：
+{summaries}
+
+请把它们合并为一份更精简的要点摘要（每行一个要点），保留关键事项和数量。""",
+        "final_system": """你是一个专业的工作总结助手。请生成一份清晰的纯文本工作日报（不要使用Markdown格式，不要使用**符号）。
+
+任务数量较多，已预先按组归纳为要点摘要。要求：
+1. 根据摘要按主题概括已完成和未完成的任务，任务数量以给出的数字为准
+2. 总结部分需要详细（至少{min_points}句话），要涵盖主要工作内容、进展情况、重点任务等
+3. 使用纯文本格式，不要使用任何Markdown标记（如 ** ）
+4. 使用简体中文
+5. 使用换行和缩进来组织内容""",
+        "final_user": """请根据以下任务摘要生成详细的工作日报（纯文本格式，使用简体中文，不要使用**等Markdown符号）：
+
+已完成的任务（共{completed_count}项）摘要：
+{completed_text}
+
+未完成的任务（共{incomplete_count}项）摘要：
+{incomplete_text}
+
+请按照以下格式生成日报（使用纯文本，简体中文，不要Markdown格式）：
+
+工作日报
+
+日期：{date_str}
+
+一、已完成任务（{completed_count}项）
+
+[按主题分类概括已完成的任务]
+
+二、未完成任务（{incomplete_count}项）
+
+[按主题分类概括未完成的任务]
+
+三、工作总结
+
+[详细总结，至少包含{min_points}个方面：
+- 今天完成的主要工作及成果
+- 当前进行中的重点任务
+- 遇到的问题或挑战
+- 下一步工作计划
+等]
+
+四、备注
+
+[特别事项或需要关注的内容]
+
+注意：请使用简体中文纯文本格式输出，不要使用任何Markdown标记符号。""",
+    },
+    "traditional": {
+        "none": "無",
+        "no_completed": "暫無已完成任務",
+        "no_incomplete": "暫無未完成任務",
+        "completed_label": "已完成",
+        "incomplete_label": "未完成",
+        "system": """你是一個專業的工作總結助手。請生成一份清晰的純文字工作日報（不要使用Markdown格式，不要使用**符號）。
+
+要求：
+1. 完整列出所有已完成和未完成的任務
+2. 總結部分需要詳細（至少{min_points}句話），要涵蓋主要工作內容、進展情況、重點任務等
+3. 使用純文字格式，不要使用任何Markdown標記（如 ** ）
+4. **必須使用繁體中文輸出所有內容**（如果任務列表中包含簡體中文，請將其轉換為繁體中文）
+5. 使用換行和縮進來組織內容""",
+        "user": """請為以下任務生成詳細的工作日報（純文字格式，使用繁體中文，不要使用**等Markdown符號）：
+
+**重要提示：無論任務列表中的文字是簡體還是繁體，最終輸出的日報必須全部使用繁體中文。請將所有簡體中文內容轉換為繁體中文。**
+
+已完成的任務（共{completed_count}項）：
+{completed_text}
+
+未完成的任務（共{incomplete_count}項）：
+{incomplete_text}
+
+請按照以下格式生成日報（使用純文字，繁體中文，不要Markdown格式）：
+
+工作日報
+
+日期：{date_str}
+
+一、已完成任務（{completed_count}項）
+
+{completed_section}
+
+二、未完成任務（{incomplete_count}項）
+
+{incomplete_section}
+
+三、工作總結
+
+[詳細總結，至少包含{min_points}個方面：
+- 今天完成的主要工作及成果
+- 當前進行中的重點任務
+- 遇到的問題或挑戰
+- 下一步工作計劃
+等]
+
+四、備註
+
+[特別事項或需要關注的內容]
+
+注意：請使用繁體中文純文字格式輸出，不要使用任何Markdown標記符號。""",
+        "map_system": "你是一個專業的工作總結助手。請把給定的一組任務歸納為簡潔的要點摘要：按主題合併相似任務，保留關鍵事項、數量和編號範圍，使用繁體中文純文字，不要使用Markdown標記。",
+        "map_user": """以下是{label}的任務（第{first}至{last}項，共{count}項）：
+{task_text}
+
+請輸出這組任務的要點摘要（每行一個要點，使用繁體中文）。""",
+        "combine_user": """以下是{label}任務的若干分組摘要：
+{summaries}
+
+請把它們合併為一份更精簡的要點摘要（每行一個要點，使用繁體中文），保留關鍵事項和數量。""",
+        "final_system": """你是一個專業的工作總結助手。請生成一份清晰的純文字工作日報（不要使用Markdown格式，不要使用**符號）。
+
+任務數量較多，已預先按組歸納為要點摘要。要求：
+1. 根據摘要按主題概括已完成和未完成的任務，任務數量以給出的數字為準
+2. 總結部分需要詳細（至少{min_points}句話），要涵蓋主要工作內容、進展情況、重點任務等
+3. 使用純文字格式，不要使用任何Markdown標記（如 ** ）
+4. **必須使用繁體中文輸出所有內容**（如果摘要中包含簡體中文，請將其轉換為繁體中文）
+5. 使用換行和縮進來組織內容""",
+        "final_user": """請根據以下任務摘要生成詳細的工作日報（純文字格式，使用繁體中文，不要使用**等Markdown符號）：
+
+已完成的任務（共{completed_count}項）摘要：
+{completed_text}
+
+未完成的任務（共{incomplete_count}項）摘要：
+{incomplete_text}
+
+請按照以下格式生成日報（使用純文字，繁體中文，不要Markdown格式）：
+
+工作日報
+
+日期：{date_str}
+
+一、已完成任務（{completed_count}項）
+
+[按主題分類概括已完成的任務]
+
+二、未完成任務（{incomplete_count}項）
+
+[按主題分類概括未完成的任務]
+
+三、工作總結
+
+[詳細總結，至少包含{min_points}個方面：
+- 今天完成的主要工作及成果
+- 當前進行中的重點任務
+- 遇到的問題或挑戰
+- 下一步工作計劃
+等]
+
+四、備註
+
+[特別事項或需要關注的內容]
+
+注意：請使用繁體中文純文字格式輸出，不要使用任何Markdown標記符號。""",
+    },
+}
+
+
+def _templates(language: str) -> Dict[str, str]:
+    return _TEMPLATES["traditional" if language == "traditional" else "simplified"]
+
+
+def _numbered(texts: List[str], start: int = 1) -> str:
+    return "\n".join(f"{start + i}. {text}" for i, text in enumerate(texts))
+
+
+def _min_points(total_count: int) -> int:
+    return max(3, total_count // 2)
+
+
+# ========== 单次生成 ==========
+
+def build_report_messages(
+    language: str,
+    date_str: str,
+    completed_texts: List[str],
+    incomplete_texts: List[str],
+) -> Messages:
+    """完整列出全部任务的日报提示词（任务较少时使用）"""
+    t = _templates(language)
+    completed_text = _numbered(completed_texts) or t["none"]
+    incomplete_text = _numbered(incomplete_texts) or t["none"]
+    min_points = _min_points(len(completed_texts) + len(incomplete_texts))
+    return [
+        {"role": "system", "content": t["system"].format(min_points=min_points)},
+        {"role": "user", "content": t["user"].format(
+            completed_count=len(completed_texts),
+            incomplete_count=len(incomplete_texts),
+            completed_text=completed_text,
+            incomplete_text=incomplete_text,
+            completed_section=completed_text if completed_texts else t["no_completed"],
+            incomplete_section=incomplete_text if incomplete_texts else t["no_incomplete"],
+            date_str=date_str,
+            min_points=min_points,
+        )},
+    ]
+
+
+# ========== 分组摘要（map-reduce） ==========
+
+def chunk_texts(texts: List[str], max_tokens: int) -> List[Tuple[int, List[str]]]:
+    """按 token 预算顺序切分任务，返回 (起始编号, 任务列表)；单个超长任务独占一组"""
+    chunks: List[Tuple[int, List[str]]] = []
+    current: List[str] = []
+    current_tokens = 0
+    start = 1
+    for i, text in enumerate(texts, start=1):
+        # 编号和换行约占几个 token
+        tokens = estimate_tokens(text) + 3
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append((start, current))
+            current, current_tokens, start = [], 0, i
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        chunks.append((start, current))
+    return chunks
+
+
+async def gather_bounded(coros: List[Awaitable], limit: int) -> List:
+    """与 asyncio.gather 相同，但同时最多运行 limit 个
+
+    任一协程失败（或调用方被取消）时立即取消其余任务，排队中的协程不再启动，
+    不会继续消耗上游调用；抛出第一个失败的异常。
+    """
+    if not coros:
+        return []
+    semaphore = asyncio.Semaphore(max(1, limit))
+    failed = False
+
+    async def run(coro):
+        nonlocal failed
+        async with semaphore:
+            # 失败释放的名额可能在取消之前就被排队的任务拿到
+            if failed:
+                raise asyncio.CancelledError()
+            try:
+                return await coro
+            except BaseException:
+                failed = True
+                raise
+
+    tasks = [asyncio.ensure_future(run(c)) for c in coros]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # 等被取消的任务结束，再关闭从未启动的协程（避免 "coroutine was never awaited"）
+        await asyncio.wait(tasks)
+        for coro in coros:
+            close = getattr(coro, "close", None)
+            if close is not None:
+                close()
+    errors = [t.exception() for t in tasks if not t.cancelled() and t.exception() is not None]
+    if errors:
+        raise errors[0]
+    return [task.result() for task in tasks]
+
+
+def _summary_messages(language: str, label: str, start: int, texts: List[str]) -> Messages:
+    t = _templates(language)
+    return [
+        {"role": "system", "content": t["map_system"]},
+        {"role": "user", "content": t["map_user"].format(
+            label=label, first=start, last=start + len(texts) - 1,
+            count=len(texts), task_text=_numbered(texts, start),
+        )},
+    ]
+
+
+def _combine_messages(language: str, label: str, summaries: List[str]) -> Messages:
+    t = _templates(language)
+    return [
+        {"role": "system", "content": t["map_system"]},
+        {"role": "user", "content": t["combine_user"].format(
+            label=label, summaries="\n\n".join(summaries),
+        )},
+    ]
+
+
+def _final_messages(
+    language: str,
+    date_str: str,
+    completed_count: int,
+    incomplete_count: int,
+    completed_summaries: List[str],
+    incomplete_summaries: List[str],
+) -> Messages:
+    t = _templates(language)
+    min_points = _min_points(completed_count + incomplete_count)
+    return [
+        {"role": "system", "content": t["final_system"].format(min_points=min_points)},
+        {"role": "user", "content": t["final_user"].format(
+            completed_count=completed_count,
+            incomplete_count=incomplete_count,
+            completed_text="\n\n".join(completed_summaries) or t["none"],
+            incomplete_text="\n\n".join(incomplete_summaries) or t["none"],
+            date_str=date_str,
+            min_points=min_points,
+        )},
+    ]
+
+
+async def prepare_report_messages(
+    language: str,
+    date_str: str,
+    completed_texts: List[str],
+    incomplete_texts: List[str],
+    summarize: Summarizer,
+    budget: int = REPORT_PROMPT_TOKEN_BUDGET,
+    chunk_tokens: int = REPORT_CHUNK_TOKENS,
+    concurrency: int = REPORT_MAP_CONCURRENCY,
+) -> Messages:
+    """返回生成最终日报所用的提示词
+
+    提示词在预算内时直接返回单次生成的提示词（不调用 summarize）；
+    否则先用 summarize（非流式补全）并发生成各组摘要，返回基于摘要的提示词。
+    """
+    messages = build_report_messages(language, date_str, completed_texts, incomplete_texts)
+    if estimate_messages_tokens(messages) <= budget:
+        return messages
+
+    t = _templates(language)
+    groups = [
+        (t["completed_label"], completed_texts),
+        (t["incomplete_label"], incomplete_texts),
+    ]
+    # map：两类任务的所有分组一起并发摘要
+    jobs = [
+        (group, _summary_messages(language, label, start, chunk))
+        for group, (label, texts) in enumerate(groups)
+        for start, chunk in chunk_texts(texts, chunk_tokens)
+    ]
+    results = await gather_bounded([summarize(m) for _, m in jobs], concurrency)
+    summaries: List[List[str]] = [[] for _ in groups]
+    for (group, _), summary in zip(jobs, results):
+        summaries[group].append(summary.strip())
+
+    # reduce：摘要合起来仍超出预算时，逐轮合并相邻的摘要，直到放得下
+    messages = _final_messages(
+        language, date_str, len(completed_texts), len(incomplete_texts), *summaries,
+    )
+    for _ in range(REPORT_MAX_COMBINE_ROUNDS):
+        if estimate_messages_tokens(messages) <= budget:
+            break
+        jobs = [
+            (group, batch)
+            for group, (label, _) in enumerate(groups)
+            # 合并输入可占用半个预算，保证每批能容纳多段摘要
+            for _start, batch in chunk_texts(summaries[group], max(chunk_tokens, budget // 2))
+        ]
+        if len(jobs) >= sum(len(s) for s in summaries):
+            # 无法继续合并（每组摘要都已单独超出分组预算）
+            break
+        results = await gather_bounded(
+            [
+                summarize(_combine_messages(language, groups[group][0], batch))
+                if len(batch) > 1 else _done(batch[0])
+                for group, batch in jobs
+            ],
+            concurrency,
+        )
+        summaries = [[] for _ in groups]
+        for (group, _), summary in zip(jobs, results):
+            summaries[group].append(summary.strip())
+        messages = _final_messages(
+            language, date_str, len(completed_texts), len(incomplete_texts), *summaries,
+        )
+    return messages
+
+
+async def _done(value: str) -> str:
+    return value
@@ -49,9 +49,9 @@ echo "📚 API 文档: http://localhost:8000/docs"
 echo "=========================================="
 echo ""
 
-# 使用 python3 而不是 python
+# 使用 python3 而不是 python；参数原样传给 main.py，例如 ./start-backend.sh --workers 4
 if [ -f "venv/bin/python" ]; then
-    venv/bin/python main.py
+    venv/bin/python main.py "$@"
 else
-    python3 main.py
+    python3 main.py "$@"
 fi
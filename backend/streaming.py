@@ -0,0 +1,135 @@
+"""
+流式输出工具
+将上游逐 token 的增量合并为较大的块再写出（按时间窗口 / 字节数刷新），
+并提供可选的 SSE（Server-Sent Events）帧格式。
+"""
+
+import asyncio
+import os
+from typing import AsyncIterator, Optional
+
+# ========== 配置（可通过环境变量调整） ==========
+STREAM_FLUSH_MS = float(os.getenv("REPORT_STREAM_FLUSH_MS", "20"))        # 最长攒批时间
+STREAM_FLUSH_BYTES = int(os.getenv("REPORT_STREAM_FLUSH_BYTES", "256"))   # 攒够多少字节立即写出
+# 客户端读取过慢时最多缓冲的增量个数；缓冲满后暂停读取上游（反压）
+STREAM_MAX_BUFFERED = int(os.getenv("REPORT_STREAM_MAX_BUFFERED", "1024"))
+# 每个输出块之后的人为延迟（旧版"打字效果"），默认关闭
+STREAM_DELAY_MS = float(os.getenv("REPORT_STREAM_DELAY_MS", "0"))
+
+_END = object()
+
+
+class _SourceError:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+async def coalesce(
+    source: AsyncIterator[str],
+    flush_ms: float = STREAM_FLUSH_MS,
+    flush_bytes: int = STREAM_FLUSH_BYTES,
+    max_buffered: int = STREAM_MAX_BUFFERED,
+    delay_ms: float = STREAM_DELAY_MS,
+) -> AsyncIterator[str]:
+    """合并 source 产生的小块文本
+
+    上游在后台任务中读取并放入有界队列：客户端读得快时按 flush_ms / flush_bytes 刷新；
+    客户端读得慢时，每次写出都会一次性取走队列中积压的全部内容，
+    因此慢客户端收到的是更少、更大的块，而不是越积越多的小块；
+    队列满时上游读取暂停，内存占用有上限。
+    """
+    if flush_ms <= 0 and flush_bytes <= 0:
+        async for piece in source:
+            yield piece
+            if delay_ms > 0:
+                await asyncio.sleep(delay_ms / 1000)
+        return
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_buffered))
+
+    async def produce():
+        try:
+            async for piece in source:
+                if piece:
+                    await queue.put(piece)
+        except Exception as e:
+            await queue.put(_SourceError(e))
+        else:
+            await queue.put(_END)
+        finally:
+            # 确保上游连接随生成器一起关闭
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    producer = asyncio.create_task(produce())
+    loop = asyncio.get_running_loop()
+    try:
+        finished = False
+        while not finished:
+            item = await queue.get()
+            if item is _END:
+                break
+            if isinstance(item, _SourceError):
+                raise item.exc
+            parts = [item]
+            size = len(item.encode("utf-8"))
+            deadline = loop.time() + flush_ms / 1000
+            pending_error: Optional[BaseException] = None
+
+            while True:
+                if not queue.empty():
+                    # 已积压的内容总是一次取完
+                    item = queue.get_nowait()
+                elif flush_bytes > 0 and size >= flush_bytes:
+                    break
+                else:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _END:
+                    finished = True
+                    break
+                if isinstance(item, _SourceError):
+                    pending_error = item.exc
+                    break
+                parts.append(item)
+                size += len(item.encode("utf-8"))
+
+            yield "".join(parts)
+            if pending_error is not None:
+                raise pending_error
+            if delay_ms > 0:
+                await asyncio.sleep(delay_ms / 1000)
+    finally:
+        # 客户端断开或出错时停止读取上游
+        producer.cancel()
+        try:
+            await producer
+        except (asyncio.CancelledError, Exception):
+            pass
+
+
+def sse_frame(data: str, event_id: Optional[int] = None, event: Optional[str] = None) -> str:
+    """构造一个 SSE 帧；多行数据按规范拆成多个 data 字段"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    for line in data.split("\n"):
+        lines.append(f"data: {line}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def sse_events(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """将文本块包装为带递增事件 id 的 SSE 流，结束时发送 done 事件"""
+    event_id = 0
+    async for chunk in chunks:
+        event_id += 1
+        yield sse_frame(chunk, event_id=event_id)
+    yield sse_frame("[DONE]", event_id=event_id + 1, event="done")